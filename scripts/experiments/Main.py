@@ -0,0 +1,36 @@
+import argparse
+import json
+
+from lib.settings import make_experiment, make_placement, get_storage_accounts, PRE_FAILURE_SECONDS, POST_FAILURE_SECONDS
+from lib.experiment import run_experiment
+
+#Python counterpart of execute-experiment.ps1 that waits for readiness instead of fixed sleeps
+#credentials.json holds logs_sas_url, checkpoint_sas_url and storage_connection_string
+#or a list of such storage accounts under accounts, see run_experiments.py for running several experiments at once
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs repetitions of one experiment configuration")
+    parser.add_argument('--job', type=int, required=True, help="job type 0-6 (0 = wordcount, 6 = nhop)")
+    parser.add_argument('--shards', type=int, required=True, help="generator shards")
+    parser.add_argument('--throughput', type=int, required=True, help="target throughput per generator shard (events/s)")
+    parser.add_argument('--generator', choices=['text', 'graph', 'nexmark'], required=True)
+    parser.add_argument('--skip', default='', help="comma separated topics the generator skips")
+    parser.add_argument('--checkpoint-mode', type=int, choices=[0, 1, 2], required=True, help="0 = uc, 1 = cc, 2 = cic")
+    parser.add_argument('--interval', type=int, required=True, help="checkpoint interval in seconds")
+    parser.add_argument('--kill', required=True, help="instance to kill, e.g. crainst13")
+    parser.add_argument('--pre-failure', type=int, default=PRE_FAILURE_SECONDS, help="seconds the job runs, from its first throughput, before the failure is inserted")
+    parser.add_argument('--post-failure', type=int, default=POST_FAILURE_SECONDS, help="seconds the job runs after the failure before it is torn down")
+    parser.add_argument('--repetitions', type=int, default=1)
+    parser.add_argument('--first-repetition', type=int, default=0, help="repetition number of the first run, to resume a series")
+    parser.add_argument('--namespace', default=None, help="run in this new namespace with its own kafka, on the nodes labelled for it (default: the shared default and kafka namespaces)")
+    parser.add_argument('--account', type=int, default=0, help="index of the storage account in credentials.json to use")
+    args = parser.parse_args()
+
+    credentials = get_storage_accounts(json.load(open('credentials.json')))[args.account]
+    for repetition in range(args.first_repetition, args.first_repetition + args.repetitions):
+        experiment = make_experiment(args.job, repetition, args.shards, args.throughput, args.generator, args.skip, args.checkpoint_mode, args.interval, args.kill, args.pre_failure, args.post_failure)
+        run_experiment(experiment, credentials, make_placement(args.namespace))
+    print("Success")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""Offline stand-in for kubectl, azcopy and the benchmarks executable, simulates a cluster in a state file
+usage: set EXPERIMENT_KUBECTL="python fake_tools.py kubectl", EXPERIMENT_AZCOPY="python fake_tools.py azcopy"
+and EXPERIMENT_BENCHMARKS="python fake_tools.py benchmarks", the state lives in FAKE_CLUSTER_STATE (default fake-cluster.json).
+Statefulsets become ready READY_SECONDS after they are applied, the throughput logger reports THROUGHPUT while generators run.
+The cluster has FAKE_NODES worker nodes, azcopy downloads the logs of the namespace whose metric loggers use the storage account
+named by the first path segment of the url (e.g. logs_sas_url "account-0/logs" for storage_connection_string "account-0").
+"""
+
+import json
+import os
+import re
+import sys
+import time
+from datetime import datetime, timezone
+
+STATE_PATH = os.environ.get('FAKE_CLUSTER_STATE', 'fake-cluster.json')
+READY_SECONDS = float(os.environ.get('FAKE_READY_SECONDS', '2'))
+NODE_COUNT = int(os.environ.get('FAKE_NODES', '4'))
+NODE_CPU = '16'
+NODE_MEMORY = '64Gi'
+TERMINATING_SECONDS = 1
+LOG_INTERVAL = 0.333
+THROUGHPUT = 5000
+KAFKA_RESOURCES = [('StatefulSet', 'pzoo'), ('StatefulSet', 'zoo'), ('StatefulSet', 'kafka')]
+TOPICS = ['sentences', 'neighbours', 'auctions', 'people', 'bids']
+WORKERS = ['crainst01', 'crainst02', 'crainst03']
+
+
+def load_state():
+    if(not os.path.exists(STATE_PATH)):
+        nodes = {'master': {'node-role.kubernetes.io/master': ''}}
+        nodes.update({'slave-' + str(i): {} for i in range(NODE_COUNT)})
+        return {'resources': {}, 'namespaces': {}, 'nodes': nodes, 'accounts': {}}
+    with open(STATE_PATH, 'r') as file:
+        return json.load(file)
+
+def save_state(state: dict):
+    with open(STATE_PATH + '.tmp', 'w') as file:
+        json.dump(state, file)
+    os.replace(STATE_PATH + '.tmp', STATE_PATH)
+
+"""Serialises the fake tools of concurrent runs on the state file, without fcntl (windows) runs cannot overlap safely
+"""
+def lock_state():
+    try:
+        import fcntl
+    except ImportError:
+        return None
+    lock = open(STATE_PATH + '.lock', 'w')
+    fcntl.flock(lock, fcntl.LOCK_EX)
+    return lock
+
+def resource_key(namespace: str, kind: str, name: str):
+    return namespace + "/" + kind + "/" + name
+
+"""Returns the (namespace, kind, name) of every resource in the file
+"""
+def read_resources(path: str):
+    with open(path, 'r') as file:
+        sections = file.read().split('---')
+    resources = []
+    for section in sections:
+        kind = re.search(r'^kind:\s*(\S+)', section, re.MULTILINE)
+        name = re.search(r'^\s*name:\s*(\S+)', section, re.MULTILINE)
+        namespace = re.search(r'^\s*namespace:\s*(\S+)', section, re.MULTILINE)
+        if(kind and name):
+            resources.append((namespace.group(1) if namespace else 'default', kind.group(1), name.group(1)))
+    return resources
+
+def read_account(path: str):
+    with open(path, 'r') as file:
+        account = re.search(r'name: AZURE_STORAGE_CONNECTION_STRING\s+value: "([^"]*)"', file.read())
+    return account.group(1) if account else None
+
+"""The namespace of a kustomization, the overlays of dedicated namespaces set it, the kafka variants keep theirs
+"""
+def kustomization_namespace(path: str):
+    kustomization = os.path.join(path, 'kustomization.yaml')
+    if(os.path.exists(kustomization)):
+        with open(kustomization, 'r') as file:
+            namespace = re.search(r'^namespace:\s*(\S+)', file.read(), re.MULTILINE)
+        if(namespace):
+            return namespace.group(1)
+    return 'kafka'
+
+def live(resource: dict, now: float, grace: float = 0):
+    return resource['deleted'] is None or now < resource['deleted'] + grace
+
+def find(state: dict, namespace: str, kind: str, name: str, now: float):
+    resource = state['resources'].get(resource_key(namespace, kind, name))
+    return resource if resource is not None and live(resource, now) else None
+
+def is_ready(resource: dict, now: float):
+    return resource is not None and now >= resource['applied'] + READY_SECONDS
+
+def format_time(moment: float):
+    return datetime.fromtimestamp(moment, timezone.utc).strftime("%I:%M:%S:%f")
+
+"""The namespace of the jobs that use the kafka in namespace, the shared kafka namespace serves the default namespace
+"""
+def workload_namespace(namespace: str):
+    return 'default' if namespace == 'kafka' else namespace
+
+def node_of(state: dict, namespace: str):
+    return next((name for name, labels in state['nodes'].items() if labels.get('blacksp-run') == namespace), 'slave-0')
+
+def throughput_lines(state: dict, namespace: str, now: float):
+    logger = state['resources'].get(resource_key(namespace, 'Deployment', 'throughput-logger'))
+    if(logger is None):
+        return []
+    generator = state['resources'].get(resource_key(namespace, 'Deployment', 'generator'))
+    end = now if logger['deleted'] is None else min(now, logger['deleted'])
+    lines = ["timestamp, throughput", format_time(logger['applied']) + ", 0"]
+    moment = logger['applied'] + LOG_INTERVAL
+    while(moment <= end):
+        running = generator is not None and generator['applied'] + READY_SECONDS <= moment and (generator['deleted'] is None or moment < generator['deleted'])
+        lines.append(format_time(moment) + ", " + str(THROUGHPUT if running else 0))
+        moment += LOG_INTERVAL
+    return lines
+
+def kubectl(args: list):
+    state = load_state()
+    now = time.time()
+    namespace = args[args.index('-n') + 1] if '-n' in args else 'default'
+
+    if(args[:2] == ['create', 'namespace']):
+        if(args[2] in state['namespaces'] and live(state['namespaces'][args[2]], now, TERMINATING_SECONDS)):
+            print("Error from server (AlreadyExists): namespaces \"" + args[2] + "\" already exists", file=sys.stderr)
+            return 1
+        state['namespaces'][args[2]] = {'applied': now, 'deleted': None}
+        save_state(state)
+        print("namespace/" + args[2] + " created")
+        return 0
+
+    if(args[:2] == ['delete', 'namespace']):
+        for key, resource in state['resources'].items():
+            if(key.startswith(args[2] + "/") and resource['deleted'] is None):
+                resource['deleted'] = now
+        if(args[2] in state['namespaces']):
+            state['namespaces'][args[2]]['deleted'] = now
+        save_state(state)
+        print("namespace \"" + args[2] + "\" deleted")
+        return 0
+
+    if(args[:2] == ['get', 'namespace']):
+        resource = state['namespaces'].get(args[2])
+        if(resource is None or not live(resource, now, TERMINATING_SECONDS)):
+            print("Error from server (NotFound): namespaces \"" + args[2] + "\" not found", file=sys.stderr)
+            return 1
+        return 0
+
+    if(args[:2] == ['label', 'node']):
+        label = args[-2] if args[-1] == '--overwrite' else args[-1]
+        for name in args[2:args.index(label)]:
+            if(label.endswith('-')):
+                state['nodes'][name].pop(label[:-1], None)
+            else:
+                state['nodes'][name][label.split('=')[0]] = label.split('=')[1]
+        save_state(state)
+        return 0
+
+    if(args[:2] == ['get', 'nodes']):
+        items = [{'metadata': {'name': name, 'labels': labels}, 'spec': {},
+                  'status': {'allocatable': {'cpu': NODE_CPU, 'memory': NODE_MEMORY}, 'conditions': [{'type': 'Ready', 'status': 'True'}]}}
+                 for name, labels in state['nodes'].items()]
+        print(json.dumps({'items': items}))
+        return 0
+
+    if(args[:3] == ['get', 'pods', '--all-namespaces']):
+        items = []
+        for key, resource in state['resources'].items():
+            resource_namespace, kind, name = key.split('/')
+            if(kind == 'StatefulSet' and live(resource, now, TERMINATING_SECONDS)):
+                requests = {'cpu': '7500m', 'memory': '8000Mi'} if name == 'kafka' else {'cpu': '500m', 'memory': '1000Mi'}
+                items.append({'metadata': {'name': name + "-0", 'namespace': resource_namespace}, 'status': {'phase': 'Running'},
+                              'spec': {'nodeName': node_of(state, resource_namespace), 'containers': [{'resources': {'requests': requests}}]}})
+        print(json.dumps({'items': items}))
+        return 0
+
+    if(args[0] in ('apply', 'delete')):
+        if(args[1] == '-k'):
+            resources = [(kustomization_namespace(args[2]), kind, name) for kind, name in KAFKA_RESOURCES]
+        else:
+            resources = read_resources(args[2])
+            account = read_account(args[2])
+            if(args[0] == 'apply' and account is not None):
+                state['accounts'][account] = resources[0][0]
+        for resource_namespace, kind, name in resources:
+            key = resource_key(resource_namespace, kind, name)
+            if(args[0] == 'apply'):
+                state['resources'][key] = {'applied': now, 'deleted': None}
+            elif(key in state['resources'] and state['resources'][key]['deleted'] is None):
+                state['resources'][key]['deleted'] = now
+            print(kind.lower() + ".apps/" + name + (" configured" if args[0] == 'apply' else " deleted"))
+        save_state(state)
+        return 0
+
+    if(args[:2] == ['get', 'statefulsets']):
+        items = []
+        for key, resource in state['resources'].items():
+            resource_namespace, kind, name = key.split('/')
+            if(kind == 'StatefulSet' and resource_namespace == namespace and live(resource, now)):
+                items.append({'metadata': {'name': name}, 'spec': {'replicas': 1}, 'status': {'readyReplicas': 1 if is_ready(resource, now) else 0}})
+        print(json.dumps({'items': items}))
+        return 0
+
+    if(args[:2] == ['get', 'pods']):
+        selector = args[args.index('-l') + 1] if '-l' in args else None
+        items = []
+        for key, resource in state['resources'].items():
+            resource_namespace, kind, name = key.split('/')
+            selected = selector is None or (selector == 'operator' and kind == 'StatefulSet') or (selector.startswith('app in') and name in selector)
+            if(resource_namespace == namespace and selected and live(resource, now, TERMINATING_SECONDS)):
+                items.append({'metadata': {'name': name + "-0"}})
+        print(json.dumps({'items': items}))
+        return 0
+
+    if(args[0] == 'exec'):
+        pod = args[3] if args[1] == '-n' else args[1]
+        if(pod == 'kafka-0'):
+            if(not is_ready(find(state, namespace, 'StatefulSet', 'kafka', now), now)):
+                print("error: unable to upgrade connection: container not found (\"broker\")", file=sys.stderr)
+                return 1
+            if(find(state, workload_namespace(namespace), 'Deployment', 'generator', now) is not None):
+                print("\n".join(TOPICS))
+            return 0
+        if(find(state, namespace, 'StatefulSet', pod.rsplit('-', 1)[0], now) is None):
+            print("Error from server (NotFound): pods \"" + pod + "\" not found", file=sys.stderr)
+            return 1
+        return 0
+
+    if(args[0] == 'logs'):
+        if(args[1] == 'deployment/throughput-logger'):
+            print("\n".join(throughput_lines(state, namespace, now)))
+        return 0
+
+    if(args[0] == 'rollout'):
+        print("deployment.apps/coredns " + ("restarted" if args[1] == 'restart' else "successfully rolled out"))
+        return 0
+
+    print("fake kubectl does not support: " + " ".join(args), file=sys.stderr)
+    return 1
+
+def azcopy(args: list):
+    if(args[0] == 'copy'):
+        state = load_state()
+        namespace = state['accounts'].get(args[1].split('/')[0], 'default')
+        folder = os.path.join(args[2], 'logs', 'performance')
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, 'throughput-logger-fake.log'), 'w') as file:
+            file.write("\n".join(throughput_lines(state, namespace, time.time())) + "\n")
+    return 0
+
+def benchmarks(args: list):
+    with open('deployment.yaml', 'w') as file:
+        for name in WORKERS:
+            file.write("kind: StatefulSet\napiVersion: apps/v1\nmetadata:\n    namespace: default\n    name: " + name + "\n---\n")
+    return 0
+
+if __name__ == "__main__":
+    tools = {'kubectl': kubectl, 'azcopy': azcopy, 'benchmarks': benchmarks}
+    lock = lock_state()
+    sys.exit(tools[sys.argv[1]](sys.argv[2:]))
@@ -0,0 +1,175 @@
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from lib.settings import make_placement, get_environment, get_storage_accounts, CAMPAIGN_FOLDER, RESULTS_FOLDER, NODE_RUN_LABEL, SCHEDULER_POLL_SECONDS, \
+    TEARDOWN_TIMEOUT, KAFKA_DEMAND, ZOOKEEPER_DEMAND, WORKER_DEMAND, GENERATOR_DEMAND, METRIC_LOGGER_DEMAND
+from lib.deployments import write_blacksp_deployment
+from lib.probes import wait_for, namespace_gone
+from lib.tools import kubectl, kubectl_json
+
+MASTER_ROLE_LABELS = ['node-role.kubernetes.io/master', 'node-role.kubernetes.io/control-plane']
+MEMORY_UNITS = {'Ki': 1 / 1024, 'Mi': 1, 'Gi': 1024, 'Ti': 1024 ** 2, 'k': 1000 / 1024 ** 2, 'M': 1000 ** 2 / 1024 ** 2, 'G': 1000 ** 3 / 1024 ** 2, 'T': 1000 ** 4 / 1024 ** 2}
+
+
+def parse_cpu(quantity: str):
+    if(quantity.endswith('m')):
+        return float(quantity[:-1]) / 1000
+    return float(quantity)
+
+"""Parses a kubernetes memory quantity (e.g. 1000Mi, 8Gi, 512M or plain bytes) into MiB
+"""
+def parse_memory(quantity: str):
+    for unit in sorted(MEMORY_UNITS, key=len, reverse=True):
+        if(quantity.endswith(unit)):
+            return float(quantity[:-len(unit)]) * MEMORY_UNITS[unit]
+    return float(quantity) / 1024 ** 2
+
+"""Returns {node: (cores, MiB)} a run may take on every schedulable worker node: the given fraction of what the node
+can allocate, minus what pods already on it request. The master, cordoned, tainted and not ready nodes are left out.
+"""
+def get_node_budgets(cpuFraction: float = 1, memoryFraction: float = 1):
+    nodes = kubectl_json('get', 'nodes')
+    pods = kubectl_json('get', 'pods', '--all-namespaces')
+    if(nodes is None or pods is None):
+        return {}
+    requested = {}
+    for pod in pods['items']:
+        node = pod['spec'].get('nodeName')
+        if(node is None or pod.get('status', {}).get('phase') in ('Succeeded', 'Failed')):
+            continue
+        cpu, memory = requested.get(node, (0, 0))
+        for container in pod['spec'].get('containers', []):
+            requests = container.get('resources', {}).get('requests', {})
+            cpu += parse_cpu(requests.get('cpu', '0'))
+            memory += parse_memory(requests.get('memory', '0'))
+        requested[node] = (cpu, memory)
+    budgets = {}
+    for node in nodes['items']:
+        name = node['metadata']['name']
+        labels = node['metadata'].get('labels', {})
+        ready = any(c.get('type') == 'Ready' and c.get('status') == 'True' for c in node['status'].get('conditions', []))
+        tainted = any(taint.get('effect') in ('NoSchedule', 'NoExecute') for taint in node['spec'].get('taints', []))
+        if(not ready or tainted or node['spec'].get('unschedulable', False) or any(label in labels for label in MASTER_ROLE_LABELS)):
+            continue
+        allocatable = node['status']['allocatable']
+        cpu, memory = requested.get(name, (0, 0))
+        budgets[name] = (parse_cpu(allocatable['cpu']) * cpuFraction - cpu, parse_memory(allocatable['memory']) * memoryFraction - memory)
+    return budgets
+
+"""Returns the (cores, MiB) of every pod the experiment deploys: its kafka, workers, generator shards and metric loggers
+"""
+def get_demand(experiment: dict, workerCount: int):
+    return [KAFKA_DEMAND, ZOOKEEPER_DEMAND] + [WORKER_DEMAND] * workerCount + [GENERATOR_DEMAND] * experiment['shards'] + [METRIC_LOGGER_DEMAND] * 2
+
+"""Packs the pods, largest first, onto the fewest of the given nodes (first fit decreasing on the largest nodes),
+returns the names of the nodes used or None when the pods do not fit.
+"""
+def place(pods: list, budgets: dict):
+    remaining = dict(budgets)
+    order = sorted(remaining, key=lambda node: remaining[node], reverse=True)
+    used = []
+    for cpu, memory in sorted(pods, reverse=True):
+        node = next((node for node in used + order if remaining[node][0] >= cpu and remaining[node][1] >= memory), None)
+        if(node is None):
+            return None
+        if(node not in used):
+            used.append(node)
+            order.remove(node)
+        remaining[node] = (remaining[node][0] - cpu, remaining[node][1] - memory)
+    return used
+
+"""Counts the BlackSP workers of a job type by letting the benchmarks executable write its deployment once
+"""
+def count_workers(experiment: dict, credentials: dict, cache: dict):
+    if(experiment['job'] not in cache):
+        placement = {**make_placement(), 'folder': os.path.join(CAMPAIGN_FOLDER, 'job-' + str(experiment['job']))}
+        os.makedirs(placement['folder'], exist_ok=True)
+        cache[experiment['job']] = len(write_blacksp_deployment(get_environment(experiment, credentials), placement))
+    return cache[experiment['job']]
+
+def experiment_arguments(experiment: dict):
+    return ['--job', str(experiment['job']), '--shards', str(experiment['shards']), '--throughput', str(experiment['throughput']),
+            '--generator', experiment['generator'], '--skip', experiment['skip_list'], '--checkpoint-mode', str(experiment['checkpoint_mode']),
+            '--interval', str(experiment['checkpoint_interval']), '--kill', experiment['instance_to_kill'],
+            '--pre-failure', str(experiment['pre_failure_seconds']), '--post-failure', str(experiment['post_failure_seconds']),
+            '--repetitions', '1', '--first-repetition', str(experiment['repetition'])]
+
+"""Labels the nodes for the run and starts Main.py for it in a separate process, its output goes to campaign/<namespace>/run.log
+"""
+def start_run(experiment: dict, namespace: str, account: int, nodes: list):
+    placement = make_placement(namespace)
+    os.makedirs(placement['folder'], exist_ok=True)
+    kubectl('label', 'node', *nodes, NODE_RUN_LABEL + '=' + namespace, '--overwrite')
+    log = open(os.path.join(placement['folder'], 'run.log'), 'w')
+    command = [sys.executable, 'Main.py'] + experiment_arguments(experiment) + ['--namespace', namespace, '--account', str(account)]
+    process = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT, env={**os.environ, 'PYTHONUNBUFFERED': '1'})
+    print("Started " + experiment['key'] + " in " + namespace + " on " + ", ".join(nodes) + " (storage account " + str(account) + ")")
+    return {'experiment': experiment, 'namespace': namespace, 'account': account, 'nodes': nodes, 'process': process, 'log': log, 'started': time.monotonic()}
+
+"""Cleans up after a run that did not tear itself down and gives its nodes back
+"""
+def release_run(run: dict):
+    run['log'].close()
+    code = run['process'].returncode
+    minutes = str(round((time.monotonic() - run['started']) / 60, 1))
+    if(code != 0):
+        print("Run " + run['experiment']['key'] + " failed with exit code " + str(code) + " after " + minutes + " minutes, see " + run['log'].name)
+        placement = make_placement(run['namespace'])
+        if(os.path.exists(os.path.join(placement['kafka_path'], 'kustomization.yaml'))):
+            kubectl('delete', '-k', placement['kafka_path'], '--wait=false')
+        kubectl('delete', 'namespace', run['namespace'], '--wait=false')
+        wait_for("namespace " + run['namespace'] + " to be deleted", lambda: namespace_gone(run['namespace']), TEARDOWN_TIMEOUT, required=False)
+    else:
+        print("Run " + run['experiment']['key'] + " completed in " + minutes + " minutes")
+    kubectl('label', 'node', *run['nodes'], NODE_RUN_LABEL + '-')
+
+"""Runs the experiments with as many at a time as there are storage accounts (at most parallel) and free nodes to place them on.
+Every run gets its own namespace, kafka and nodes, the nodes are not shared so the runs do not disturb each other.
+Experiments whose results folder already exists are skipped, a campaign can be resumed by starting it again.
+A run that does not fit on the free nodes is passed over for the next one that does. Returns the experiments that failed.
+"""
+def run_campaign(experiments: list, credentials: dict, parallel: int = None, cpuFraction: float = 1, memoryFraction: float = 1):
+    accounts = get_storage_accounts(credentials)
+    pending = [experiment for experiment in experiments if not os.path.exists(os.path.join(RESULTS_FOLDER, experiment['key']))]
+    print("Campaign of " + str(len(experiments)) + " runs, " + str(len(experiments) - len(pending)) + " already have results")
+    free_accounts = list(range(len(accounts)))[:parallel]
+    prefix = 'run-' + datetime.now().strftime('%m%d%H%M') + '-'
+    workers = {}
+    running = []
+    failed = []
+    started = time.monotonic()
+    count = 0
+    while(len(pending) > 0 or len(running) > 0):
+        for run in [run for run in running if run['process'].poll() is not None]:
+            running.remove(run)
+            release_run(run)
+            free_accounts.append(run['account'])
+            if(run['process'].returncode != 0):
+                failed.append(run['experiment'])
+
+        if(len(pending) > 0 and len(free_accounts) > 0):
+            busy = [node for run in running for node in run['nodes']]
+            budgets = {node: budget for node, budget in get_node_budgets(cpuFraction, memoryFraction).items() if node not in busy}
+            for experiment in list(pending):
+                nodes = place(get_demand(experiment, count_workers(experiment, accounts[0], workers)), budgets)
+                if(nodes is None):
+                    continue
+                pending.remove(experiment)
+                running.append(start_run(experiment, prefix + str(count), free_accounts.pop(0), nodes))
+                count += 1
+                budgets = {node: budget for node, budget in budgets.items() if node not in nodes}
+                if(len(free_accounts) == 0):
+                    break
+            if(len(running) == 0):
+                raise SystemError("The cluster has no free nodes to place " + ", ".join(experiment['key'] for experiment in pending) + " on")
+
+        if(len(running) > 0):
+            time.sleep(SCHEDULER_POLL_SECONDS)
+
+    print("Campaign finished in " + str(round((time.monotonic() - started) / 3600, 2)) + " hours, " + str(len(failed)) + " runs failed")
+    for experiment in failed:
+        print("Failed: " + experiment['key'])
+    return failed
@@ -0,0 +1,178 @@
+import os
+import re
+
+from lib.settings import DEPLOYMENT_FILE, METRIC_DEPLOYMENT_FILE, GENERATOR_DEPLOYMENT_FILE, WORKER_DOCKER_IMAGE, GENERATOR_VERTEX_COUNT, GENERATOR_EDGE_P_INCLUDE, \
+    KAFKA_KUSTOMIZATION_PATH, NODE_RUN_LABEL
+from lib.tools import benchmarks, check
+
+METRIC_ENVIRONMENT_KEYS = ['AZURE_STORAGE_CONNECTION_STRING', 'KAFKA_BROKER_DNS_TEMPLATE', 'KAFKA_BROKER_COUNT', 'KAFKA_TOPIC_PARTITION_COUNT', 'LOG_EVENT_LEVEL', 'LOG_TARGET_FLAGS']
+
+
+def get_deployment_path(placement: dict, filename: str):
+    return os.path.join(placement['folder'], filename)
+
+"""Lets the benchmarks executable write the StatefulSets of the BlackSP job into the placement folder, mirrors lib/blacksp-deployment.ps1
+the executable always writes to the default namespace, for a dedicated namespace the file is rewritten.
+"""
+def write_blacksp_deployment(environment: dict, placement: dict):
+    path = get_deployment_path(placement, DEPLOYMENT_FILE)
+    check(benchmarks('benchmark', '-a', env=environment, cwd=placement['folder']), "Generating the BlackSP deployment")
+    misplaced = os.path.abspath(placement['folder']) + '\\' + DEPLOYMENT_FILE #the executable joins paths with backslashes, on linux that ends up next to the working directory
+    if(not os.path.exists(path) and os.path.exists(misplaced)):
+        os.replace(misplaced, path)
+    if(placement['dedicated']):
+        with open(path, 'r') as file:
+            yaml = file.read()
+        yaml = re.sub(r'^    namespace: default(?=\r?$)', '    namespace: ' + placement['namespace'], yaml, flags=re.MULTILINE)
+        yaml = re.sub(r'^(        spec:\r?\n)(            containers:)', lambda match: match.group(1) + node_selector_yaml(placement) + match.group(2), yaml, flags=re.MULTILINE)
+        with open(path, 'w') as file:
+            file.write(yaml)
+    return get_statefulset_names(path)
+
+def get_statefulset_names(path: str):
+    with open(path, 'r') as file:
+        sections = file.read().split('---')
+    return [re.search(r'^\s*name:\s*(\S+)', section, re.MULTILINE).group(1) for section in sections if re.search(r'^kind:\s*StatefulSet', section, re.MULTILINE)]
+
+"""Pins the pods of a dedicated placement to the nodes labelled for it, empty for the shared layout
+"""
+def node_selector_yaml(placement: dict):
+    if(not placement['dedicated']):
+        return ""
+    return f"""            nodeSelector:
+                {NODE_RUN_LABEL}: {placement['namespace']}
+"""
+
+def write_metric_deployment(environment: dict, placement: dict):
+    with open(get_deployment_path(placement, METRIC_DEPLOYMENT_FILE), 'w') as file:
+        file.write("---\n".join(metric_logger_yaml(name, environment, placement) for name in ['latency-logger', 'throughput-logger']))
+
+def metric_logger_yaml(name: str, environment: dict, placement: dict):
+    env = "".join(f'              - name: {key}\n                value: "{environment[key]}"\n' for key in METRIC_ENVIRONMENT_KEYS)
+    return f"""kind: Deployment
+apiVersion: apps/v1
+metadata:
+    namespace: {placement['namespace']}
+    name: {name}
+    labels:
+        app: {name}
+spec:
+    replicas: 1
+    selector:
+        matchLabels:
+            app: {name}
+    template:
+        metadata:
+            labels:
+                app: {name}
+        spec:
+{node_selector_yaml(placement)}            containers:
+            - name: {name}
+              image: {WORKER_DOCKER_IMAGE}
+              env:
+{env}              args: ["{name.split('-')[0]}"]
+"""
+
+def write_generator_deployment(environment: dict, experiment: dict, placement: dict):
+    with open(get_deployment_path(placement, GENERATOR_DEPLOYMENT_FILE), 'w') as file:
+        file.write(f"""kind: Deployment
+apiVersion: apps/v1
+metadata:
+    namespace: {placement['namespace']}
+    name: generator
+    labels:
+        app: generator
+spec:
+    replicas: {experiment['shards']}
+    selector:
+        matchLabels:
+            app: generator
+    template:
+        metadata:
+            labels:
+                app: generator
+        spec:
+{node_selector_yaml(placement)}            containers:
+            - name: generator
+              image: {WORKER_DOCKER_IMAGE}
+              env:
+                - name: KAFKA_BROKER_DNS_TEMPLATE
+                  value: "{environment['KAFKA_BROKER_DNS_TEMPLATE']}"
+                - name: KAFKA_BROKER_COUNT
+                  value: "{environment['KAFKA_BROKER_COUNT']}"
+                - name: KAFKA_TOPIC_PARTITION_COUNT
+                  value: "{environment['KAFKA_TOPIC_PARTITION_COUNT']}"
+                - name: GENERATOR_TARGET_THROUGHPUT
+                  value: "{environment['GENERATOR_TARGET_THROUGHPUT']}"
+                - name: GENERATOR_CALLS
+                  value: "{environment['GENERATOR_CALLS']}"
+                - name: GENERATOR_SKIP_TOPICS
+                  value: "{experiment['skip_list']}"
+                - name: GENERATOR_VERTEX_COUNT
+                  value: "{GENERATOR_VERTEX_COUNT}"
+                - name: GENERATOR_EDGE_P_INCLUDE
+                  value: "{GENERATOR_EDGE_P_INCLUDE}"
+              args: ["{experiment['generator']}"]
+""")
+
+"""Writes a kustomization that deploys the kafka variant into the dedicated namespace and onto its nodes.
+The cluster wide role and binding get per namespace names and the fixed node port of the outside listener is dropped,
+these would otherwise be shared by all runs and removed by the first run to tear down.
+"""
+def write_kafka_overlay(placement: dict):
+    namespace = placement['namespace']
+    base = os.path.relpath(KAFKA_KUSTOMIZATION_PATH, placement['folder']).replace(os.sep, '/')
+    with open(os.path.join(placement['folder'], 'kustomization.yaml'), 'w') as file:
+        file.write(f"""namespace: {namespace}
+resources:
+- {base}
+patches:
+- target:
+    kind: StatefulSet
+  patch: |-
+    - op: add
+      path: /spec/template/spec/nodeSelector
+      value:
+        {NODE_RUN_LABEL}: {namespace}
+- target:
+    kind: ClusterRole
+    name: node-reader
+  options:
+    allowNameChange: true
+  patch: |-
+    - op: replace
+      path: /metadata/name
+      value: node-reader-{namespace}
+- target:
+    kind: ClusterRoleBinding
+    name: kafka-node-reader
+  options:
+    allowNameChange: true
+  patch: |-
+    - op: replace
+      path: /metadata/name
+      value: kafka-node-reader-{namespace}
+    - op: replace
+      path: /roleRef/name
+      value: node-reader-{namespace}
+    - op: replace
+      path: /subjects/0/namespace
+      value: {namespace}
+- target:
+    kind: Service
+    name: outside-0
+  patch: |-
+    - op: replace
+      path: /spec/type
+      value: ClusterIP
+    - op: remove
+      path: /spec/externalTrafficPolicy
+    - op: remove
+      path: /spec/ports/0/nodePort
+""")
+
+def remove_deployment_files(placement: dict):
+    for filename in [DEPLOYMENT_FILE, METRIC_DEPLOYMENT_FILE, GENERATOR_DEPLOYMENT_FILE]:
+        path = get_deployment_path(placement, filename)
+        if(os.path.exists(path)):
+            os.remove(path)
@@ -0,0 +1,177 @@
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from lib.settings import make_placement, get_environment, get_generator_topics, \
+    KAFKA_READY_TIMEOUT, WORKERS_READY_TIMEOUT, FIRST_THROUGHPUT_TIMEOUT, METRIC_DRAIN_TIMEOUT, TEARDOWN_TIMEOUT, \
+    DEPLOYMENT_FILE, METRIC_DEPLOYMENT_FILE, GENERATOR_DEPLOYMENT_FILE, RESULTS_FOLDER
+from lib.deployments import get_deployment_path, write_blacksp_deployment, write_metric_deployment, write_generator_deployment, write_kafka_overlay, remove_deployment_files
+from lib.probes import wait_for, statefulsets_ready, kafka_ready, topics_available, first_throughput, throughput_drained, pods_gone, namespace_gone
+from lib.tools import kubectl, azcopy, fetch_results, check, FETCH_RESULTS
+
+#pods of one experiment in the default namespace, BlackSP workers carry an operator label
+EXPERIMENT_POD_SELECTORS = ['app in (generator, latency-logger, throughput-logger)', 'operator']
+
+
+"""Formats a UTC time the way the metric loggers do (.NET hh:mm:ss:ffffff, 12 hour clock)
+"""
+def format_timestamp(moment: datetime):
+    return moment.strftime("%I:%M:%S:%f")
+
+class PhaseLog:
+    """Records when each phase of an experiment actually happened"""
+
+    def __init__(self):
+        self.phases = []
+
+    def mark(self, phase: str):
+        moment = datetime.now(timezone.utc)
+        self.phases.append((phase, moment))
+        print("[" + format_timestamp(moment) + "] " + phase)
+        return moment
+
+    def get(self, phase: str):
+        return next(moment for name, moment in self.phases if name == phase)
+
+    def write(self, path: str):
+        with open(path, 'w') as file:
+            file.write("phase, timestamp\n")
+            for phase, moment in self.phases:
+                file.write(phase + ", " + format_timestamp(moment) + "\n")
+
+
+"""Runs one repetition: deploy, inject the failure, tear down and download the logs into results/<experiment key>
+every phase waits for the cluster to actually be ready instead of sleeping a fixed time.
+credentials is the storage account the run uses, placement where it runs (see make_placement, default the shared layout).
+"""
+def run_experiment(experiment: dict, credentials: dict, placement: dict = None):
+    placement = make_placement() if placement is None else placement
+    namespace = placement['namespace']
+    kafka_namespace = placement['kafka_namespace']
+    print("")
+    print("==========================================================================")
+    print("Starting experiment " + experiment['key'])
+    print("==========================================================================")
+    print("")
+    phases = PhaseLog()
+    environment = get_environment(experiment, credentials, kafka_namespace)
+
+    if(placement['dedicated']):
+        print("Creating namespace " + namespace)
+        os.makedirs(placement['folder'], exist_ok=True)
+        check(kubectl('create', 'namespace', namespace), "Creating namespace " + namespace)
+        write_kafka_overlay(placement)
+
+    print("Deploying kafka")
+    check(kubectl('apply', '-k', placement['kafka_path']), "Deploying kafka")
+    phases.mark('kafka_deployed')
+
+    #clear storage and prepare the deployment files while kafka starts
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        cleared = executor.submit(clear_storage, credentials)
+        print("Preparing deployment files")
+        workers = write_blacksp_deployment(environment, placement)
+        write_metric_deployment(environment, placement)
+        write_generator_deployment(environment, experiment, placement)
+        cleared.result()
+
+    wait_for("kafka", lambda: kafka_ready(kafka_namespace), KAFKA_READY_TIMEOUT)
+    phases.mark('kafka_ready')
+
+    print("Deploying BlackSP nodes to kubernetes cluster")
+    check(kubectl('apply', '-f', get_deployment_path(placement, DEPLOYMENT_FILE)), "Deploying BlackSP nodes")
+    wait_for(str(len(workers)) + " BlackSP workers", lambda: statefulsets_ready(namespace, workers), WORKERS_READY_TIMEOUT)
+    phases.mark('workers_ready')
+
+    print("Deploying metric and generator nodes to kubernetes cluster")
+    check(kubectl('apply', '-f', get_deployment_path(placement, METRIC_DEPLOYMENT_FILE)), "Deploying metric nodes")
+    check(kubectl('apply', '-f', get_deployment_path(placement, GENERATOR_DEPLOYMENT_FILE)), "Deploying generator nodes")
+    phases.mark('generators_deployed') #the experiment start, init_timestamp.log
+
+    topics = get_generator_topics(experiment)
+    wait_for("topics " + ", ".join(topics), lambda: topics_available(kafka_namespace, topics), FIRST_THROUGHPUT_TIMEOUT)
+    phases.mark('topics_available')
+    wait_for("first throughput", lambda: first_throughput(namespace), FIRST_THROUGHPUT_TIMEOUT)
+    phases.mark('first_throughput')
+
+    print("Experiment " + experiment['key'] + " running, waiting " + str(experiment['pre_failure_seconds']) + " seconds before inserting failure..")
+    sleep_until(phases.get('first_throughput'), experiment['pre_failure_seconds'])
+
+    print("Inserting failure")
+    phases.mark('failure')
+    instance = experiment['instance_to_kill']
+    check(kubectl('exec', '-n', namespace, instance + "-0", '-c', instance, '--', '/bin/sh', '-c', "kill 1"), "Inserting failure")
+
+    print("Failure inserted, waiting " + str(experiment['post_failure_seconds']) + " seconds before tearing the cluster down..")
+    sleep_until(phases.get('failure'), experiment['post_failure_seconds'])
+
+    tear_down(phases, placement)
+    download_logs(experiment, credentials, phases, placement)
+    remove_deployment_files(placement)
+    clear_storage(credentials)
+
+def tear_down(phases: PhaseLog, placement: dict):
+    print("Tearing down cluster")
+    kubectl('delete', '-f', get_deployment_path(placement, GENERATOR_DEPLOYMENT_FILE), '--wait=false')
+    kubectl('delete', '-f', get_deployment_path(placement, DEPLOYMENT_FILE), '--wait=false')
+    phases.mark('teardown')
+
+    #the metric loggers stay until they logged the tail (zero throughput), at most METRIC_DRAIN_TIMEOUT
+    wait_for("metric loggers to log the tail", lambda: throughput_drained(placement['namespace']), METRIC_DRAIN_TIMEOUT, required=False)
+    #foreground deletion returns once the logger pods are gone and have flushed their logs
+    kubectl('delete', '-f', get_deployment_path(placement, METRIC_DEPLOYMENT_FILE), '--cascade=foreground', timeout=TEARDOWN_TIMEOUT)
+    phases.mark('metrics_stopped')
+
+    print("Tearing kafka down")
+    kubectl('delete', '-k', placement['kafka_path'], '--wait=false')
+
+    if(placement['dedicated']):
+        #kafka of a dedicated namespace has broker names no other run uses, so there is no DNS cache to purge
+        print("Deleting namespace " + placement['namespace'])
+        kubectl('delete', 'namespace', placement['namespace'], '--wait=false')
+        wait_for("namespace " + placement['namespace'] + " to be deleted", lambda: namespace_gone(placement['namespace']), TEARDOWN_TIMEOUT, required=False)
+        phases.mark('teardown_completed')
+        return
+
+    print("Purging kubernetes DNS cache")
+    kubectl('rollout', 'restart', 'deployment', 'coredns', '-n', 'kube-system')
+    wait_for("experiment pods to terminate", lambda: all(pods_gone(placement['namespace'], selector) for selector in EXPERIMENT_POD_SELECTORS) and pods_gone(placement['kafka_namespace']), TEARDOWN_TIMEOUT, required=False)
+    kubectl('rollout', 'status', 'deployment', 'coredns', '-n', 'kube-system', '--timeout=' + str(TEARDOWN_TIMEOUT) + 's', timeout=TEARDOWN_TIMEOUT + 10)
+    phases.mark('teardown_completed')
+
+"""Downloads the logs container of the storage account into results/<experiment key>,
+runs in a dedicated namespace download into their own staging folder as they share the results folder.
+"""
+def download_logs(experiment: dict, credentials: dict, phases: PhaseLog, placement: dict):
+    print("Downloading log files")
+    staging = os.path.join(RESULTS_FOLDER, '.' + placement['namespace']) if placement['dedicated'] else RESULTS_FOLDER
+    logs = os.path.join(staging, 'logs')
+    os.makedirs(logs, exist_ok=True) #ensure folder creation even if azcopy fails
+    with open(os.path.join(logs, 'failures.log'), 'w') as file:
+        file.write("timestamp\n" + format_timestamp(phases.get('failure')) + "\n")
+    with open(os.path.join(logs, 'init_timestamp.log'), 'w') as file:
+        file.write(format_timestamp(phases.get('generators_deployed')) + "\n")
+    if(len(FETCH_RESULTS) > 0):
+        code, output = fetch_results(credentials['logs_sas_url'], logs) #init_timestamp.log is already there, the metric logs get cached
+    else:
+        code, output = azcopy('copy', credentials['logs_sas_url'], staging, '--recursive')
+    if(code != 0):
+        print(output)
+        print("Downloading log files failed with exit code " + str(code))
+    phases.mark('downloaded')
+    phases.write(os.path.join(logs, 'phases.log'))
+    os.replace(logs, os.path.join(RESULTS_FOLDER, experiment['key']))
+    if(placement['dedicated']):
+        shutil.rmtree(staging, ignore_errors=True)
+
+def clear_storage(credentials: dict):
+    print("Deleting remaining log files and checkpoints from blob storage")
+    azcopy('rm', credentials['logs_sas_url'], '--recursive')
+    azcopy('rm', credentials['checkpoint_sas_url'], '--recursive')
+
+def sleep_until(start: datetime, seconds: float):
+    remaining = seconds - (datetime.now(timezone.utc) - start).total_seconds()
+    if(remaining > 0):
+        time.sleep(remaining)
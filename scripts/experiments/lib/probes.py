@@ -0,0 +1,81 @@
+import re
+import time
+
+from lib.tools import kubectl, kubectl_json
+
+METRIC_LINE = re.compile(r'(\d\d:\d\d:\d\d:\d{6}), (\d+)')
+KAFKA_TOPICS_COMMAND = ['./bin/kafka-topics.sh', '--bootstrap-server', 'localhost:9092', '--list']
+
+
+"""Polls probe until it returns a truthy value and returns that value, the interval grows from 1 to 5 seconds.
+Raises TimeoutError after timeout seconds, or returns None when required is False.
+"""
+def wait_for(description: str, probe, timeout: float, required: bool = True):
+    started = time.monotonic()
+    interval = 1
+    while(True):
+        result = probe()
+        if(result):
+            print("Ready: " + description + " (" + str(round(time.monotonic() - started, 1)) + "s)")
+            return result
+        remaining = started + timeout - time.monotonic()
+        if(remaining <= 0):
+            if(required):
+                raise TimeoutError("Timed out after " + str(timeout) + "s waiting for " + description)
+            print("Gave up waiting for " + description + " after " + str(timeout) + "s")
+            return None
+        time.sleep(min(interval, remaining))
+        interval = min(interval * 1.5, 5)
+
+"""True when the namespace has statefulsets (all of names, if given) and every one of them has all replicas ready
+"""
+def statefulsets_ready(namespace: str, names: list = None):
+    document = kubectl_json('get', 'statefulsets', '-n', namespace)
+    if(document is None):
+        return False
+    items = [item for item in document['items'] if names is None or item['metadata']['name'] in names]
+    if(len(items) == 0 or (names is not None and len(items) < len(set(names)))):
+        return False
+    return all(item.get('status', {}).get('readyReplicas', 0) >= item['spec'].get('replicas', 1) for item in items)
+
+"""Returns the topics the first broker in the namespace lists, None while the broker does not answer
+"""
+def get_kafka_topics(namespace: str):
+    code, output = kubectl('exec', '-n', namespace, 'kafka-0', '-c', 'broker', '--', *KAFKA_TOPICS_COMMAND)
+    if(code != 0):
+        return None
+    return {line.strip() for line in output.splitlines() if line.strip()}
+
+def kafka_ready(namespace: str):
+    return statefulsets_ready(namespace) and get_kafka_topics(namespace) is not None
+
+def topics_available(namespace: str, topics: list):
+    available = get_kafka_topics(namespace)
+    return available is not None and all(topic in available for topic in topics)
+
+"""Returns the (timestamp, value) lines the throughput logger in the namespace printed so far
+"""
+def get_throughput_lines(namespace: str):
+    code, output = kubectl('logs', 'deployment/throughput-logger', '-n', namespace)
+    if(code != 0):
+        return []
+    return [(match.group(1), int(match.group(2))) for match in (METRIC_LINE.search(line) for line in output.splitlines()) if match]
+
+"""Returns the timestamp of the first non-zero throughput, the logger always starts with a zero line
+"""
+def first_throughput(namespace: str):
+    return next((timestamp for timestamp, value in get_throughput_lines(namespace) if value > 0), None)
+
+"""True once the throughput logger reports zero throughput after having seen events, i.e. the tail has been logged
+"""
+def throughput_drained(namespace: str):
+    values = [value for _, value in get_throughput_lines(namespace)]
+    return len(values) > 0 and max(values) > 0 and values[-1] == 0
+
+def pods_gone(namespace: str, selector: str = None):
+    document = kubectl_json('get', 'pods', '-n', namespace, *([] if selector is None else ['-l', selector]))
+    return document is not None and len(document['items']) == 0
+
+def namespace_gone(namespace: str):
+    code, _ = kubectl('get', 'namespace', namespace)
+    return code is not None and code != 0
@@ -0,0 +1,112 @@
+import os
+
+#kafka settings
+CLUSTER_KAFKA_DNS_TEMPLATE = 'kafka-{0}.kafka.{namespace}.svc.cluster.local:9092'
+KAFKA_BROKER_COUNT = 1
+KAFKA_TOPIC_PARTITION_COUNT = 24
+KAFKA_KUSTOMIZATION_PATH = os.path.join('.', 'kafka', 'variants', 'scale-1')
+KAFKA_NAMESPACE = 'kafka'
+
+#generator settings
+GENERATOR_NEXMARK_GEN_CALLS = 99999999 #FIXED
+GENERATOR_VERTEX_COUNT = 1000000 #used for graph data generation (n-hop query)
+GENERATOR_EDGE_P_INCLUDE = 0.005
+GENERATOR_TOPICS = {'text': ['sentences'], 'graph': ['neighbours'], 'nexmark': ['auctions', 'people', 'bids']}
+
+#job settings
+JOB_SIZE = 1 #0-2 BUT FIXED FOR EXPERIMENTS
+WORKER_DOCKER_IMAGE = 'mdzwart/benchmarks-net3.1:latest'
+STREAM_BUFFER_BYTES = 4096
+
+#log settings - FIXED
+LOG_TARGETS = 5 # flags (1 = console, 2 = file, 4 = azure blob)
+LOG_LEVEL = 2 # 0-5 (Verbose-Debug-Information-Warning-Error-Fatal)
+
+#experiment execution timing settings, in seconds
+PRE_FAILURE_SECONDS = 90 #counted from the first throughput the metric logger reports
+POST_FAILURE_SECONDS = 150
+
+#upper bounds for the readiness gates that replace the fixed sleeps, in seconds
+KAFKA_READY_TIMEOUT = 300
+WORKERS_READY_TIMEOUT = 300
+FIRST_THROUGHPUT_TIMEOUT = 300
+METRIC_DRAIN_TIMEOUT = 20 #the most the metric loggers get to report the tail after workers and generators are gone
+TEARDOWN_TIMEOUT = 300
+
+#deployment files, written to the working directory
+DEPLOYMENT_FILE = 'deployment.yaml'
+METRIC_DEPLOYMENT_FILE = 'metric-loggers.yaml'
+GENERATOR_DEPLOYMENT_FILE = 'generators.yaml'
+RESULTS_FOLDER = os.path.join('.', 'results')
+
+#campaign settings, runs of a campaign each get their own namespace, kafka and nodes
+CAMPAIGN_FOLDER = os.path.join('.', 'campaign') #per run deployment files, kafka overlay and output
+NODE_RUN_LABEL = 'blacksp-run' #nodes given to a run are labelled with its namespace, its pods select on it
+SCHEDULER_POLL_SECONDS = 10
+#what one pod of a run takes from its node (cores, MiB), the requests of the manifests or an estimate where a pod requests nothing
+KAFKA_DEMAND = (7.5, 8000) #kafka/kafka/50kafka.yml
+ZOOKEEPER_DEMAND = (0.01, 100) #kafka/zookeeper/51zoo.yml
+WORKER_DEMAND = (0.5, 1000) #BlackSP.CRA DeploymentUtility
+GENERATOR_DEMAND = (1, 500)
+METRIC_LOGGER_DEMAND = (0.25, 250)
+
+
+"""Returns the experiment description used by the orchestrator, the key matches the folder naming of execute-experiment.ps1
+"""
+def make_experiment(jobType: int, repetition: int, generatorShards: int, generatorThroughput: int, generatorType: str, generatorSkipList: str, checkpointMode: int, checkpointIntervalSec: int, instanceToKill: str,
+                    preFailureSec: int = PRE_FAILURE_SECONDS, postFailureSec: int = POST_FAILURE_SECONDS):
+    key = f"job-{jobType}-cp-{checkpointMode}-{checkpointIntervalSec}s-{format_thousands(generatorShards * generatorThroughput)}k-({repetition})"
+    return {
+        'key': key, 'job': jobType, 'repetition': repetition, 'shards': generatorShards, 'throughput': generatorThroughput,
+        'generator': generatorType, 'skip_list': generatorSkipList, 'checkpoint_mode': checkpointMode,
+        'checkpoint_interval': checkpointIntervalSec, 'instance_to_kill': instanceToKill,
+        'pre_failure_seconds': preFailureSec, 'post_failure_seconds': postFailureSec
+    }
+
+def format_thousands(eventsPerSecond: int):
+    value = eventsPerSecond / 1000
+    return str(int(value)) if value == int(value) else str(value)
+
+"""Where an experiment runs, without a namespace this is the shared layout of execute-experiment.ps1 (jobs in default, kafka in kafka).
+A dedicated namespace holds the job, its metric loggers and its own kafka, its pods only run on nodes labelled NODE_RUN_LABEL=<namespace>.
+"""
+def make_placement(namespace: str = None):
+    if(namespace is None):
+        return {'namespace': 'default', 'kafka_namespace': KAFKA_NAMESPACE, 'kafka_path': KAFKA_KUSTOMIZATION_PATH, 'folder': '.', 'dedicated': False}
+    folder = os.path.join(CAMPAIGN_FOLDER, namespace)
+    return {'namespace': namespace, 'kafka_namespace': namespace, 'kafka_path': folder, 'folder': folder, 'dedicated': True}
+
+"""Storage accounts experiments can use, credentials.json holds one account or a list of them under accounts.
+Concurrent runs each need their own account: checkpoint and log containers and the CRA tables have fixed names.
+"""
+def get_storage_accounts(credentials: dict):
+    return credentials.get('accounts', [credentials])
+
+"""Topics the generator of the experiment produces to, the skip list names topics it leaves out
+"""
+def get_generator_topics(experiment: dict):
+    skipped = [topic.strip() for topic in experiment['skip_list'].split(',') if topic.strip()]
+    return [topic for topic in GENERATOR_TOPICS[experiment['generator']] if topic not in skipped]
+
+"""Environment for the BlackSP deployment generator and the deployment templates, mirrors lib/env/*.ps1
+"""
+def get_environment(experiment: dict, credentials: dict, kafkaNamespace: str = KAFKA_NAMESPACE):
+    return {
+        'CHECKPOINT_COORDINATION_MODE': str(experiment['checkpoint_mode']), #0 = uc, 1 = cc, 2 = cic
+        'CHECKPOINT_INTERVAL_SECONDS': str(experiment['checkpoint_interval']),
+        'LOG_TARGET_FLAGS': str(LOG_TARGETS),
+        'LOG_EVENT_LEVEL': str(LOG_LEVEL),
+        'BENCHMARK_INFRA': "1", # 0 = simulator / 1 cra
+        'BENCHMARK_JOB': str(experiment['job']),
+        'BENCHMARK_SIZE': str(JOB_SIZE),
+        'BLACKSP_STREAM_BUFFER_BYTES': str(STREAM_BUFFER_BYTES),
+        'GENERATOR_TARGET_THROUGHPUT': str(experiment['throughput']),
+        'GENERATOR_CALLS': str(GENERATOR_NEXMARK_GEN_CALLS),
+        'KAFKA_BROKER_DNS_TEMPLATE': CLUSTER_KAFKA_DNS_TEMPLATE.replace('{namespace}', kafkaNamespace),
+        'KAFKA_BROKER_COUNT': str(KAFKA_BROKER_COUNT),
+        'KAFKA_TOPIC_PARTITION_COUNT': str(KAFKA_TOPIC_PARTITION_COUNT),
+        'AZURE_STORAGE_CONN_STRING': credentials['storage_connection_string'],
+        'AZURE_STORAGE_CONNECTION_STRING': credentials['storage_connection_string'],
+        'CRA_WORKER_DOCKER_IMAGE': WORKER_DOCKER_IMAGE,
+        'CRA_ENVIRONMENT_VARIABLE_KEYS_TO_COPY': "AZURE_STORAGE_CONN_STRING, AZURE_STORAGE_CONNECTION_STRING, KAFKA_BROKER_DNS_TEMPLATE, KAFKA_BROKER_COUNT, KAFKA_TOPIC_PARTITION_COUNT, BLACKSP_STREAM_BUFFER_BYTES"
+    }
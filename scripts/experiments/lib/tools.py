@@ -0,0 +1,55 @@
+import json
+import os
+import shlex
+import subprocess
+
+#external commands, the EXPERIMENT_* variables replace them e.g. with "python fake_tools.py kubectl" to run offline
+KUBECTL = shlex.split(os.environ.get('EXPERIMENT_KUBECTL', 'kubectl'))
+AZCOPY = shlex.split(os.environ.get('EXPERIMENT_AZCOPY', 'azcopy'))
+BENCHMARKS = shlex.split(os.environ.get('EXPERIMENT_BENCHMARKS', os.path.join('.', 'docker', 'bin', 'BlackSP.Benchmarks.exe' if os.name == 'nt' else 'BlackSP.Benchmarks')))
+#downloads the logs container into an experiment folder instead of azcopy, e.g. "python ../visualisation/fetch_results.py"
+#which downloads concurrently and fills the data cache of the plots on the way
+FETCH_RESULTS = shlex.split(os.environ.get('EXPERIMENT_FETCH_RESULTS', ''))
+COMMAND_TIMEOUT = 120
+
+
+"""Runs a command, returns (exit code, output), the exit code is None when the command timed out or could not be started
+"""
+def run(command: list, timeout: float = COMMAND_TIMEOUT, env: dict = None, cwd: str = None):
+    try:
+        p = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=timeout, env=None if env is None else {**os.environ, **env}, cwd=cwd)
+        return p.returncode, p.stdout.decode(errors='replace')
+    except (subprocess.TimeoutExpired, OSError) as ex:
+        return None, str(ex)
+
+def kubectl(*args, timeout: float = COMMAND_TIMEOUT):
+    return run(KUBECTL + list(args), timeout)
+
+"""Runs a kubectl query with json output, returns the parsed document or None when kubectl failed
+"""
+def kubectl_json(*args):
+    code, output = kubectl(*args, '-o', 'json')
+    if(code != 0):
+        return None
+    try:
+        return json.loads(output)
+    except ValueError:
+        return None
+
+def azcopy(*args, timeout: float = None):
+    return run(AZCOPY + list(args), timeout)
+
+def fetch_results(url: str, destination: str):
+    return run(FETCH_RESULTS + [destination, '--url', url], timeout=None)
+
+def benchmarks(*args, env: dict = None, cwd: str = None, timeout: float = COMMAND_TIMEOUT):
+    return run(BENCHMARKS + list(args), timeout, env, cwd)
+
+"""Runs a command that has to succeed, prints its output when it fails
+"""
+def check(result: tuple, description: str):
+    code, output = result
+    if(code != 0):
+        print(output)
+        raise SystemError(description + " failed with exit code " + str(code))
+    return output
@@ -0,0 +1,38 @@
+import argparse
+import json
+
+from lib.settings import make_experiment, PRE_FAILURE_SECONDS, POST_FAILURE_SECONDS
+from lib.campaign import run_campaign
+
+#Python counterpart of run-experiments.ps1 that runs independent experiments side by side on one cluster
+#each run gets its own namespace, kafka, nodes and storage account, so credentials.json lists one account per concurrent run under accounts
+#the campaign file holds {"repetitions": N, "configurations": [[job, shards, throughput, generator, skip list, checkpoint mode, interval, instance to kill], ...]}
+#and optionally pre_failure_seconds and post_failure_seconds
+
+def load_campaign(path: str, repetitions: int = None):
+    campaign = json.load(open(path))
+    experiments = []
+    for configuration in campaign['configurations']:
+        for repetition in range(repetitions if repetitions is not None else campaign['repetitions']):
+            job, shards, throughput, generator, skip, mode, interval, kill = configuration
+            experiments.append(make_experiment(job, repetition, shards, throughput, generator, skip, mode, interval, kill,
+                                               campaign.get('pre_failure_seconds', PRE_FAILURE_SECONDS), campaign.get('post_failure_seconds', POST_FAILURE_SECONDS)))
+    return experiments
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs a campaign of experiments, several at a time")
+    parser.add_argument('campaign', nargs='?', default='campaign.json', help="campaign file (default campaign.json, the configurations of run-experiments.ps1)")
+    parser.add_argument('--repetitions', type=int, default=None, help="overrides the repetitions of the campaign file")
+    parser.add_argument('--parallel', type=int, default=None, help="most runs at a time (default: one per storage account)")
+    parser.add_argument('--cpu-budget', type=float, default=1, help="fraction of the allocatable cpu of a node runs may use")
+    parser.add_argument('--memory-budget', type=float, default=1, help="fraction of the allocatable memory of a node runs may use")
+    args = parser.parse_args()
+
+    credentials = json.load(open('credentials.json'))
+    failed = run_campaign(load_campaign(args.campaign, args.repetitions), credentials, args.parallel, args.cpu_budget, args.memory_budget)
+    if(len(failed) > 0):
+        exit(1)
+    print("Success")
+
+if __name__ == "__main__":
+    main()
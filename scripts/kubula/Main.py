@@ -1,15 +1,16 @@
 import json
 import os
 import subprocess
-import pyone
 import sys
 #import warnings
 #warnings.filterwarnings("ignore")
 
-from lib.cluster import create_cluster, wait_for_kubernetes_slaves, get_deployment_info, find_missing_ips
+from lib.remote import print_outcomes
+from lib.cluster import connect, create_cluster, scale_cluster, delete_cluster, fill_pool, join_nodes, generate_cluster_name, get_current_cluster, wait_for_kubernetes_slaves, find_missing_ips
 
 #NOTE: used in cluster naming, cluster naming is used in some DNS stage, therefore: ensure this number is unique per cluster!
-experiment_num = 464
+#None generates a unique name on create and addresses the most recently created cluster otherwise
+experiment_num = None
 
 def main():
     args = sys.argv[1:]
@@ -18,37 +19,46 @@ def main():
     cred = json.load(open('credentials.json')) # username, password, endpoint, ssh_key
     conf = json.load(open('cluster-config.json')) #master/slave_cpu, _memory, _disk + num_slaves + cluster_name
 
-    conf['cluster_name'] = conf['cluster_name'] + str(experiment_num)
-    
-    client = pyone.OneServer(cred['endpoint'], session=(cred['username'] + ':' + cred['password']))
-    home = os.environ['USERPROFILE']
+    client = connect(cred)
+    home = os.environ.get('USERPROFILE', os.path.expanduser('~'))
+
+    if(experiment_num is not None):
+        conf['cluster_name'] = conf['cluster_name'] + str(experiment_num)
+    elif(args[0] == "create"):
+        conf['cluster_name'] = generate_cluster_name(home, conf['cluster_name'])
+    elif(args[0] in ("scale", "patch", "delete")):
+        conf['cluster_name'] = get_current_cluster(home)
+    print("Cluster: " + conf['cluster_name'])
     
     if(args[0] == "create"):
         create_cluster(client, home, cred, conf)
         wait_for_kubernetes_slaves(conf)
 
+    if(args[0] == "scale"):
+        conf['num_slaves'] = int(args[1])
+        scale_cluster(client, home, cred, conf)
+        wait_for_kubernetes_slaves(conf)
+
     if(args[0] == "patch"):
-        for ip in find_missing_ips(home, conf['cluster_name'], client):
-            print("Attempting to reconnect: " + ip)
-            trigger_rejoin(ip, conf['cluster_name'])
+        missing_ips = sorted(find_missing_ips(home, conf['cluster_name'], client))
+        print("Attempting to reconnect: " + ", ".join(missing_ips))
+        print_outcomes(join_nodes(home, missing_ips, conf['cluster_name']))
         wait_for_kubernetes_slaves(conf)
 
+    if(args[0] == "pool"):
+        if(len(args) > 1):
+            conf['pool_size'] = int(args[1])
+        fill_pool(client, home, cred, conf)
+
     if(args[0] == "regcred"):
         add_docker_pull_service_account()
 
     if(args[0] == "delete"):
-        deployment_info = get_deployment_info(home, conf['cluster_name'])
-        client.vm.action('terminate', deployment_info['master_id'])
-        for slave_id in deployment_info['slave_ids']:
-            client.vm.action('terminate', slave_id)
+        delete_cluster(client, home, conf)
 
     print("Success")
 
 
-def trigger_rejoin(ip, cluster_name):
-    subprocess.call(['ssh', 'ubuntu@'+ip, './join_cluster.sh '+cluster_name, '-o StrictHostKeyChecking=no'])
-
-
 def add_docker_pull_service_account():
     print("adding pubregcred serviceaccount to kubernetes") #allows utilising the unlimited docker pulls from a docker hub subscription
     subprocess.call(['kubectl', 'apply', '-f', "./pubregcred.yaml"])
@@ -0,0 +1,65 @@
+"""Offline stand-in for kubectl, answers 'get nodes -o json' from a scenario file and fakes cordon, drain and 'delete node'
+usage: set KUBULA_KUBECTL="python fake_kubectl.py" and FAKE_KUBECTL_SCENARIO=<scenario.json>
+scenario: {"nodes": [{"name": "kubula-1", "ip": "10.0.0.2", "master": false, "registers_after": 5, "ready_after": 20}, ...]}
+times are seconds since the scenario file was last modified, touch it to restart the scenario.
+deleted nodes are remembered in <scenario>.deleted, remove that file to bring them back.
+"""
+
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+
+def node_item(node: dict, start: float, now: float):
+    registered = start + node.get('registers_after', 0)
+    ready_at = start + node.get('ready_after', 0)
+    ready = now >= ready_at
+    labels = {'kubernetes.io/hostname': node['name']}
+    if(node.get('master', False)):
+        labels['node-role.kubernetes.io/master'] = ''
+    return {
+        'metadata': {'name': node['name'], 'labels': labels, 'creationTimestamp': format_time(registered)},
+        'status': {
+            'addresses': [{'type': 'InternalIP', 'address': node['ip']}, {'type': 'Hostname', 'address': node['name']}],
+            'conditions': [{'type': 'Ready', 'status': 'True' if ready else 'False', 'lastTransitionTime': format_time(ready_at if ready else registered)}]
+        }
+    }
+
+def format_time(timestamp: float):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def read_deleted(path: str):
+    if(not os.path.exists(path)):
+        return []
+    with open(path, 'r') as file:
+        return file.read().split()
+
+def main():
+    args = sys.argv[1:]
+    scenario_path = os.environ['FAKE_KUBECTL_SCENARIO']
+    deleted_path = scenario_path + ".deleted"
+    deleted = read_deleted(deleted_path)
+
+    if(args[:1] in (['cordon'], ['drain'])):
+        print("node/" + args[1] + " " + args[0] + "ed")
+        return
+    if(args[:2] == ['delete', 'node']):
+        with open(deleted_path, 'a') as file:
+            file.write("\n".join(args[2:]) + "\n")
+        for name in args[2:]:
+            print("node \"" + name + "\" deleted")
+        return
+    if(args[:2] != ['get', 'nodes'] or '-o' not in args or args[args.index('-o') + 1] != 'json'):
+        print("fake_kubectl only supports 'get nodes -o json', cordon, drain and 'delete node', got: " + " ".join(args), file=sys.stderr)
+        sys.exit(1)
+    with open(scenario_path, 'r') as file:
+        scenario = json.load(file)
+    start = os.path.getmtime(scenario_path)
+    now = time.time()
+    items = [node_item(node, start, now) for node in scenario['nodes'] if now >= start + node.get('registers_after', 0) and node['name'] not in deleted]
+    print(json.dumps({'apiVersion': 'v1', 'kind': 'List', 'items': items}))
+
+if __name__ == "__main__":
+    main()
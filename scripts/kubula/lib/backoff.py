@@ -0,0 +1,31 @@
+import time
+
+
+class Backoff:
+    """Sleeps between polls with an exponentially growing delay, reset whenever progress is observed.
+    Raises TimeoutError once the overall timeout (seconds, None = wait forever) has passed."""
+
+    def __init__(self, description: str, timeout: float = None, initial: float = 1, factor: float = 1.5, maximum: float = 15):
+        self.description = description
+        self.initial = initial
+        self.factor = factor
+        self.maximum = maximum
+        self.delay = initial
+        self.started = time.monotonic()
+        self.deadline = None if timeout is None else self.started + timeout
+
+    def reset(self):
+        self.delay = self.initial
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def expired(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def wait(self):
+        if(self.expired()):
+            raise TimeoutError("Timed out after " + str(round(self.elapsed())) + "s waiting for " + self.description)
+        delay = self.delay if self.deadline is None else min(self.delay, max(0, self.deadline - time.monotonic()))
+        time.sleep(delay)
+        self.delay = min(self.delay * self.factor, self.maximum)
@@ -1,109 +1,281 @@
 import re
-import time
 import os
-import json
+import secrets
+import socket
 import subprocess
+import threading
+import time
 import pyone
+from concurrent.futures import ThreadPoolExecutor
 
+from lib.backoff import Backoff
+from lib.kubectl import get_nodes, remove_nodes
+from lib.pool import get_pool, dump_pool, remove_from_pool, return_to_pool
+from lib.remote import run_on_nodes, print_outcomes
+from lib.state import get_state_path, read_state, write_state
 
-def create_cluster(client: pyone.OneServer, home: str, credentials: dict, config: dict):
-    master_template = ""
-    slave_template = ""
 
-    with open('./Master.def', 'r') as file:
-        data = file.read()
-        for key, value in config.items():
-            data = re.sub("<\\$" + key + ">", str(value), data)
-        for key, value in credentials.items():
-            data = re.sub("<\\$" + key + ">", str(value), data)
-        master_template = data
+#provisioning, all in seconds
+PROVISION_TIMEOUT = 1800
+API_PORT = 6443
+ALLOCATION_THREADS = 8
+READY_TIMEOUT = 1200
+JOIN_TIMEOUT = 300
+CURRENT_NAME = "current"
+FAILED_VM_STATES = {pyone.VM_STATE.DONE, pyone.VM_STATE.FAILED, pyone.VM_STATE.CLONING_FAILURE}
+FAILED_LCM_STATES = {state for state in pyone.LCM_STATE if state.name.endswith("FAILURE")}
+
 
-    with open('./Slave.def', 'r') as file:
+def connect(credentials: dict):
+    return pyone.OneServer(credentials['endpoint'], session=(credentials['username'] + ':' + credentials['password']))
+
+def render_template(path: str, credentials: dict, config: dict):
+    with open(path, 'r') as file:
         data = file.read()
         for key, value in config.items():
             data = re.sub("<\\$" + key + ">", str(value), data)
         for key, value in credentials.items():
             data = re.sub("<\\$" + key + ">", str(value), data)
-        slave_template = data
-
-
-    #print(master_template)
-    #print(slave_template)
-    
-    print("Allocating kubernetes master VM")
-    named_master_template = re.sub("<\\$name>", "kubula-0", master_template)
-    master_id = client.vm.allocate(named_master_template)
-    
-    print("Waiting for master to be ready before creating slaves. This may take several minutes.")
-    master = None
-    master_state = 0
-    while(master_state < 3): #3 == RUNNING
-        print("Polling master state..")
-        master = client.vm.info(master_id)
-        #print(master, vars(master))
-        master_state = master.LCM_STATE
-        time.sleep(10)
-    
-    master_ip = master.TEMPLATE['CONTEXT']['ETH0_IP']
-    print("Master running @ "+master_ip)
-    
-    #allocate slave VMS
-    print("Allocating slaves")
-    slave_ids = []
-    for i in range(config['num_slaves']):
-        named_slave_template = re.sub("<\\$name>", "kubula-"+str(i+1), slave_template)
-        slave_ids.append(client.vm.allocate(named_slave_template))
-    
-    time.sleep(45)#wait an extra 45 seconds for kube config init on master..
-    print("Copying kube config from master")
-    kubeconfig_loc = os.path.join(home, ".kube", "config")
-    p = subprocess.call(['scp', '-o', 'StrictHostKeyChecking=no', 'ubuntu@' + master_ip + ':/home/ubuntu/.kube/config', kubeconfig_loc])
-    if(p != 0):
-        raise SystemError("Kube config could not be copied from master node, exit code: " + str(p))
+        return data
+
+def create_cluster(client: pyone.OneServer, home: str, credentials: dict, config: dict):
+    pooled = get_running_pool(client, home)[:config['num_slaves']]
+    master_template = render_template('./Master.def', credentials, config)
+    slave_template = render_template('./Slave.def', credentials, config)
+    templates = [re.sub("<\\$name>", "kubula-0", master_template)]
+    templates += [re.sub("<\\$name>", "kubula-" + str(i+1), slave_template) for i in range(len(pooled), config['num_slaves'])]
+
+    print("Allocating kubernetes master and " + str(len(templates) - 1) + " slave VMs, taking " + str(len(pooled)) + " slaves from the pool")
+    vm_ids = allocate_vms(credentials, templates)
+    master_id, slave_ids = vm_ids[0], [vm_id for vm_id, _ in pooled] + vm_ids[1:]
 
     try:
-        #dump deployment info on disk
+        #dump deployment info on disk before waiting, so a failed deployment can still be deleted
         deployment_info = {"master_id": master_id, "slave_ids": slave_ids}
         dump_deployment_info(home, deployment_info, config['cluster_name'])
+        remove_from_pool(home, slave_ids)
         print("Deployment info sucessfully dumped on disk.")
     except:
         print("Failed to dump deployment info on disk. Deployment must be manually deleted from OpenNebula")
 
+    kubeconfig_loc = os.path.join(home, ".kube", "config")
+    wait_for_vms(client, vm_ids, config.get('provision_timeout', PROVISION_TIMEOUT), master_id, kubeconfig_loc)
+    join_pooled(home, pooled, config['cluster_name'])
+
+"""Adds or removes slaves until the deployment has config['num_slaves'] of them, the master and remaining slaves are untouched.
+New slaves come from the pool first, the rest is allocated concurrently. Removed slaves (the most recently added first)
+are drained and deleted from kubernetes, then returned to the pool or terminated.
+"""
+def scale_cluster(client: pyone.OneServer, home: str, credentials: dict, config: dict):
+    deployment_info = get_deployment_info(home, config['cluster_name'])
+    slave_ids = deployment_info['slave_ids']
+    target = config['num_slaves']
+    print("Scaling from " + str(len(slave_ids)) + " to " + str(target) + " slaves")
+
+    if(target > len(slave_ids)):
+        pooled = get_running_pool(client, home)[:target - len(slave_ids)]
+        slave_template = render_template('./Slave.def', credentials, config)
+        templates = [re.sub("<\\$name>", "kubula-" + str(i+1), slave_template) for i in range(len(slave_ids) + len(pooled), target)]
+        new_ids = allocate_vms(credentials, templates) if len(templates) > 0 else []
+        deployment_info['slave_ids'] = slave_ids + [vm_id for vm_id, _ in pooled] + new_ids
+        dump_deployment_info(home, deployment_info, config['cluster_name'])
+        remove_from_pool(home, deployment_info['slave_ids'])
+        if(len(new_ids) > 0):
+            wait_for_vms(client, new_ids, config.get('provision_timeout', PROVISION_TIMEOUT))
+        join_pooled(home, pooled, config['cluster_name'])
+
+    if(target < len(slave_ids)):
+        release_slaves(client, home, config, slave_ids[target:], drain=True)
+        deployment_info['slave_ids'] = slave_ids[:target]
+        dump_deployment_info(home, deployment_info, config['cluster_name'])
+
+def delete_cluster(client: pyone.OneServer, home: str, config: dict):
+    deployment_info = get_deployment_info(home, config['cluster_name'])
+    release_slaves(client, home, config, deployment_info['slave_ids'], drain=False)
+    client.vm.action('terminate', deployment_info['master_id'])
+
+"""Removes slaves from their cluster, running slaves are reset and parked in the pool while it has room, the others are terminated
+drain first moves their pods to the remaining nodes, pointless when the whole cluster goes.
+"""
+def release_slaves(client: pyone.OneServer, home: str, config: dict, slave_ids: list, drain: bool):
+    states = get_vm_states(client, slave_ids)
+    running = [(vm_id, states[vm_id][2].strip()) for vm_id in slave_ids if states[vm_id][1] == pyone.LCM_STATE.RUNNING and states[vm_id][2] is not None]
+    if(drain):
+        ips = {ip for _, ip in running}
+        names = [node['name'] for node in get_nodes() if node['ip'] in ips]
+        print("Draining " + str(names))
+        remove_nodes(names)
+    terminated = return_to_pool(home, running, config.get('pool_size', 0))
+    terminated += [vm_id for vm_id in slave_ids if vm_id not in {vm_id for vm_id, _ in running}]
+    for slave_id in terminated:
+        client.vm.action('terminate', slave_id)
+
+"""Allocates pool VMs until the pool holds config['pool_size'] running slaves, pool VMs that are gone are dropped
+"""
+def fill_pool(client: pyone.OneServer, home: str, credentials: dict, config: dict):
+    pooled = [vm_id for vm_id, _ in get_running_pool(client, home)]
+    missing = config.get('pool_size', 0) - len(pooled)
+    print("Pool holds " + str(len(pooled)) + " slaves, allocating " + str(max(0, missing)))
+    dump_pool(home, pooled)
+    if(missing <= 0):
+        return
+    template = re.sub("<\\$name>", "kubula-pool", render_template('./Pool.def', credentials, config))
+    new_ids = allocate_vms(credentials, [template] * missing)
+    dump_pool(home, pooled + new_ids)
+    wait_for_vms(client, new_ids, config.get('provision_timeout', PROVISION_TIMEOUT))
+
+"""Returns [(vm_id, ip)] of the pooled slaves that are running
+"""
+def get_running_pool(client: pyone.OneServer, home: str):
+    pooled = get_pool(home)
+    if(len(pooled) == 0):
+        return []
+    states = get_vm_states(client, pooled)
+    return [(vm_id, states[vm_id][2].strip()) for vm_id in pooled if states[vm_id][1] == pyone.LCM_STATE.RUNNING and states[vm_id][2] is not None]
+
+def join_pooled(home: str, pooled: list, cluster_name: str):
+    if(len(pooled) > 0):
+        print("Joining " + str(len(pooled)) + " pooled slaves")
+        print_outcomes(join_nodes(home, [ip for _, ip in pooled], cluster_name))
+
+def join_nodes(home: str, ips: list, cluster_name: str):
+    return run_on_nodes(home, ips, './join_cluster.sh ' + cluster_name, timeout=JOIN_TIMEOUT)
+
+"""Allocates all templates concurrently, returns the VM ids in template order
+every thread uses its own connection, the xml-rpc client is not thread safe.
+If any allocation fails, the VMs that were allocated are terminated again.
+"""
+def allocate_vms(credentials: dict, templates: list):
+    local = threading.local()
+    def allocate(template):
+        if(not hasattr(local, 'client')):
+            local.client = connect(credentials)
+        return local.client.vm.allocate(template)
+
+    with ThreadPoolExecutor(max_workers=min(ALLOCATION_THREADS, len(templates))) as executor:
+        futures = [executor.submit(allocate, template) for template in templates]
+    vm_ids = [future.result() for future in futures if future.exception() is None]
+    errors = [future.exception() for future in futures if future.exception() is not None]
+    if(len(errors) > 0):
+        client = connect(credentials)
+        for vm_id in vm_ids:
+            client.vm.action('terminate', vm_id)
+        raise SystemError("Allocating " + str(len(errors)) + " of " + str(len(templates)) + " VMs failed, terminated the others: " + str(errors[0]))
+    return vm_ids
+
+"""Tracks the state of all VMs with one pool query per round, polling faster while VMs are making progress.
+The kubeconfig is copied as soon as the api server of the (running) master accepts connections,
+while the slaves are still booting.
+"""
+def wait_for_vms(client: pyone.OneServer, vm_ids: list, timeout: float = PROVISION_TIMEOUT, master_id: int = None, kubeconfig_loc: str = None):
+    master_ip = None
+    kubeconfig_copied = master_id is None
+    running = set()
+    backoff = Backoff("VMs to be running and the kubeconfig to be available", timeout)
+    while(True):
+        states = get_vm_states(client, vm_ids)
+        failed = [vm_id for vm_id, (state, lcm_state, _) in states.items() if is_failed(state, lcm_state)]
+        if(len(failed) > 0):
+            raise SystemError("VMs failed to deploy: " + str(failed) + ", delete the deployment and try again")
+        now_running = {vm_id for vm_id, (state, lcm_state, _) in states.items() if state == pyone.VM_STATE.ACTIVE and lcm_state == pyone.LCM_STATE.RUNNING}
+        if(now_running != running):
+            backoff.reset()
+            running = now_running
+            print(str(len(running)) + "/" + str(len(vm_ids)) + " VMs running (" + str(round(backoff.elapsed())) + "s)")
+
+        if(master_ip is None and master_id is not None and master_id in running):
+            master_ip = states[master_id][2]
+            print("Master running @ " + master_ip)
+        if(master_ip is not None and not kubeconfig_copied):
+            kubeconfig_copied = try_copy_kubeconfig(master_ip, kubeconfig_loc)
+
+        if(len(running) == len(vm_ids) and kubeconfig_copied):
+            return master_ip
+        backoff.wait()
+
+"""Returns {vm_id: (state, lcm_state, ip)} for the given VMs from a single pool query
+"""
+def get_vm_states(client: pyone.OneServer, vm_ids: list):
+    if(len(vm_ids) == 0): #e.g. releasing the slaves of a cluster without any
+        return {}
+    pool = client.vmpool.info(-2, min(vm_ids), max(vm_ids), -1) #-2 all VMs, -1 any state except DONE
+    states = {}
+    for vm in pool.VM:
+        if(vm.ID in vm_ids):
+            states[vm.ID] = (vm.STATE, vm.LCM_STATE, vm.TEMPLATE.get('CONTEXT', {}).get('ETH0_IP'))
+    for vm_id in vm_ids:
+        if(vm_id not in states): #left the pool, only DONE VMs are not listed
+            states[vm_id] = (pyone.VM_STATE.DONE, pyone.LCM_STATE.LCM_INIT, None)
+    return states
+
+def is_failed(state: int, lcm_state: int):
+    return state in FAILED_VM_STATES or (state == pyone.VM_STATE.ACTIVE and lcm_state in FAILED_LCM_STATES)
+
+"""Copies the kubeconfig from the master once its api server accepts connections, returns whether it succeeded
+"""
+def try_copy_kubeconfig(master_ip: str, kubeconfig_loc: str):
+    try:
+        with socket.create_connection((master_ip, API_PORT), timeout=3):
+            pass
+    except OSError:
+        return False
+    print("Kubernetes api answers, copying kube config from master")
+    os.makedirs(os.path.dirname(kubeconfig_loc), exist_ok=True)
+    p = subprocess.call(['scp', '-o', 'StrictHostKeyChecking=no', '-o', 'ConnectTimeout=10', 'ubuntu@' + master_ip + ':/home/ubuntu/.kube/config', kubeconfig_loc])
+    if(p != 0):
+        print("Kube config not yet available on master, exit code: " + str(p))
+    return p == 0
+
+"""Watches the registered nodes until config['num_slaves'] non-master nodes report Ready, one kubectl call per round.
+Prints the time until each node became ready, raises TimeoutError after config['ready_timeout'] seconds (default 20 minutes).
+"""
 def wait_for_kubernetes_slaves(config: dict):
     print("Waiting for slaves to register with the kubernetes cluster")
-    nodenames = []
-    while len(nodenames) != config["num_slaves"]:
-        time.sleep(10)
-        k = subprocess.Popen(("kubectl", "get", "nodes", ), stdout=subprocess.PIPE)
-        k.wait()
+    backoff = Backoff("slaves to become ready", config.get('ready_timeout', READY_TIMEOUT), initial=2, maximum=10)
+    ready = {}
+    slaves = []
+    while(True):
+        try:
+            slaves = [node for node in get_nodes() if not node['master']]
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, ValueError) as ex:
+            print("Could not list nodes, retrying: " + str(ex))
+        for node in slaves:
+            if(node['ready'] and node['name'] not in ready):
+                ready[node['name']] = backoff.elapsed()
+                registered = " (" + str(round((node['ready_since'] - node['created']).total_seconds())) + "s after registering)" if node['ready_since'] and node['created'] else ""
+                print(node['name'] + " ready after " + str(round(ready[node['name']])) + "s" + registered + ", " + str(len(ready)) + "/" + str(config["num_slaves"]))
+                backoff.reset()
+        if(sum(node['ready'] for node in slaves) >= config["num_slaves"]):
+            break
         try:
-            f = subprocess.Popen(("findstr", "slave"), stdin=k.stdout, stdout=subprocess.PIPE)
-            output = subprocess.check_output(("findstr", "Ready"), stdin=f.stdout)
-        except subprocess.CalledProcessError as ex:
-            if(ex.returncode == 1):
-                continue #exit-code 1 means no search results.. just keep trying
-            else:
-                raise
-        output = str(output)
-        output = output.replace('b\'', '').replace('\'','').replace('\\n',',')
-        nodenames = list(filter(None, output.split(",")))
-    print("Test deployment by running 'kubectl get nodes'")    
+            backoff.wait()
+        except TimeoutError:
+            print("Not ready: " + str(sorted(node['name'] for node in slaves if not node['ready'])) + ", registered " + str(len(slaves)) + "/" + str(config["num_slaves"]))
+            raise
+    print("Test deployment by running 'kubectl get nodes'")
 
 
 def dump_deployment_info(homePath:str, deployment_info: dict, clusterName: str):
     print("Deployment info", deployment_info)
-    kubulaPath = str(os.path.join(homePath, ".kubula"))
-    if not os.path.exists(kubulaPath):
-        os.makedirs(kubulaPath)
-    with open(str(os.path.join(kubulaPath ,"." + clusterName)), 'w+') as deployment_file:
-        json.dump(deployment_info, deployment_file)
+    write_state(homePath, clusterName, deployment_info)
 
 def get_deployment_info(homePath:str, clusterName: str):
-    kubulaPath = str(os.path.join(homePath, ".kubula"))
-    if not os.path.exists(kubulaPath):
-        os.makedirs(kubulaPath)
-    with open(str(os.path.join(kubulaPath ,"." + clusterName)), 'r') as deployment_file:
-        return json.loads(deployment_file.read())
+    return read_state(homePath, clusterName)
+
+"""Returns a cluster name that is not used by any recorded deployment and records it as the current cluster
+cluster names end up in DNS names, so they have to be unique per cluster.
+"""
+def generate_cluster_name(homePath: str, prefix: str):
+    while(True):
+        name = prefix + time.strftime("%m%d%H%M") + secrets.token_hex(2)
+        if(not os.path.exists(get_state_path(homePath, name))):
+            write_state(homePath, CURRENT_NAME, {"cluster_name": name})
+            return name
+
+def get_current_cluster(homePath: str):
+    if(not os.path.exists(get_state_path(homePath, CURRENT_NAME))):
+        raise SystemError("No cluster has been created yet, set experiment_num to address a cluster created before names were generated")
+    return read_state(homePath, CURRENT_NAME)['cluster_name']
 
 
 def find_missing_ips(homePath, clusterName, client):
@@ -113,16 +285,12 @@ def find_missing_ips(homePath, clusterName, client):
 
 
 def find_known_ips():
-    outputstr = str(subprocess.check_output(['kubectl', 'get','nodes', '--selector=!node-role.kubernetes.io/master','-o=custom-columns=ExternalIp:status.addresses[0].address',]))
-    for substr in outputstr.replace('b\"', '').replace('\"','').split("\\n")[1::]:
-        if(len(substr) >= 7):
-            yield substr.strip()
+    return [node['ip'] for node in get_nodes() if not node['master'] and node['ip'] is not None]
 
 def find_expected_ips(homePath, clusterName, client):
     deployment = get_deployment_info(homePath, clusterName)
-    for slave_id in deployment['slave_ids']:
-        slave = client.vm.info(slave_id)
-        yield slave.TEMPLATE['CONTEXT']['ETH0_IP'].strip()
+    states = get_vm_states(client, deployment['slave_ids'])
+    return [ip.strip() for _, _, ip in states.values() if ip is not None]
 
 def test(credentials, config):
     print("empty")
\ No newline at end of file
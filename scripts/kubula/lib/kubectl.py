@@ -0,0 +1,68 @@
+import json
+import os
+import shlex
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+#command used to reach the cluster, KUBULA_KUBECTL replaces it e.g. with "python fake_kubectl.py" to test offline
+KUBECTL = shlex.split(os.environ.get('KUBULA_KUBECTL', 'kubectl'))
+KUBECTL_TIMEOUT = 30
+DRAIN_TIMEOUT = 300
+DRAIN_WORKERS = 8
+MASTER_ROLE_LABELS = ['node-role.kubernetes.io/master', 'node-role.kubernetes.io/control-plane']
+
+
+def kubectl_json(*args):
+    output = subprocess.check_output(KUBECTL + list(args) + ['-o', 'json'], timeout=KUBECTL_TIMEOUT)
+    return json.loads(output)
+
+"""Runs a kubectl command, returns its exit code or None when it timed out
+"""
+def kubectl(*args, timeout: float = KUBECTL_TIMEOUT):
+    try:
+        return subprocess.call(KUBECTL + list(args), timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return None
+
+"""Returns one dict per registered node: name, ip, master, ready, created and ready_since (datetimes, None if unknown)
+"""
+def get_nodes():
+    return [parse_node(item) for item in kubectl_json('get', 'nodes')['items']]
+
+def parse_node(item: dict):
+    metadata = item.get('metadata', {})
+    status = item.get('status', {})
+    labels = metadata.get('labels', {})
+    addresses = status.get('addresses', [])
+    ready = next((c for c in status.get('conditions', []) if c.get('type') == 'Ready'), {})
+    return {
+        'name': metadata.get('name'),
+        'ip': addresses[0]['address'] if len(addresses) > 0 else None,
+        'master': any(label in labels for label in MASTER_ROLE_LABELS),
+        'ready': ready.get('status') == 'True',
+        'created': parse_time(metadata.get('creationTimestamp')),
+        'ready_since': parse_time(ready.get('lastTransitionTime')) if ready.get('status') == 'True' else None
+    }
+
+def parse_time(value: str):
+    if(value is None):
+        return None
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+"""Drains the nodes concurrently and deletes them from the cluster
+all nodes are cordoned first so evicted pods are not rescheduled onto another node that is about to go.
+"""
+def remove_nodes(names: list):
+    if(len(names) == 0):
+        return
+    for name in names:
+        kubectl('cordon', name)
+    def drain(name):
+        return kubectl('drain', name, '--ignore-daemonsets', '--delete-emptydir-data', '--force', '--timeout=' + str(DRAIN_TIMEOUT) + 's', timeout=DRAIN_TIMEOUT + KUBECTL_TIMEOUT)
+    with ThreadPoolExecutor(max_workers=min(DRAIN_WORKERS, len(names))) as executor:
+        codes = list(executor.map(drain, names))
+    for name, code in zip(names, codes):
+        if(code != 0):
+            print("Draining " + name + " failed with exit code " + str(code) + ", deleting it anyway")
+    kubectl('delete', 'node', *names)
@@ -0,0 +1,35 @@
+from lib.remote import run_on_nodes, print_outcomes
+from lib.state import read_state, write_state
+
+POOL_NAME = "pool"
+#returns a slave to a clean, unjoined state, the local volume folders are emptied for the next experiment
+RESET_COMMAND = "sudo kubeadm reset -f && sudo rm -rf /media/extra/{0..200}/*"
+RESET_TIMEOUT = 300
+
+
+"""Warm pool of booted slaves that have not joined a cluster, recorded in ~/.kubula/.pool
+pool VMs are started from Pool.def, a Slave.def that prepares the disk but does not join.
+"""
+def get_pool(homePath: str):
+    return read_state(homePath, POOL_NAME, {"slave_ids": []})['slave_ids']
+
+def dump_pool(homePath: str, slave_ids: list):
+    write_state(homePath, POOL_NAME, {"slave_ids": slave_ids})
+
+def remove_from_pool(homePath: str, slave_ids: list):
+    dump_pool(homePath, [vm_id for vm_id in get_pool(homePath) if vm_id not in slave_ids])
+
+"""Resets the given [(vm_id, ip)] slaves and parks them in the pool while it holds less than size,
+returns the ids that were not pooled, slaves that fail to reset are not pooled either.
+"""
+def return_to_pool(homePath: str, slaves: list, size: int):
+    pooled = get_pool(homePath)
+    candidates = [(vm_id, ip) for vm_id, ip in slaves if ip is not None][:max(0, size - len(pooled))]
+    if(len(candidates) == 0):
+        return [vm_id for vm_id, _ in slaves]
+    print("Resetting " + str(len(candidates)) + " slaves for the pool")
+    outcomes = run_on_nodes(homePath, [ip for _, ip in candidates], RESET_COMMAND, timeout=RESET_TIMEOUT)
+    print_outcomes(outcomes)
+    reset = [vm_id for (vm_id, _), outcome in zip(candidates, outcomes) if outcome['code'] == 0]
+    dump_pool(homePath, pooled + reset)
+    return [vm_id for vm_id, _ in slaves if vm_id not in reset]
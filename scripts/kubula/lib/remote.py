@@ -0,0 +1,44 @@
+import os
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+SSH_USER = "ubuntu"
+SSH_WORKERS = 8
+CONNECT_TIMEOUT = 10
+#seconds an idle multiplexed connection is kept open for the next command to the same node
+CONTROL_PERSIST = 120
+
+
+def ssh_options(home: str):
+    options = ['-o', 'StrictHostKeyChecking=no', '-o', 'BatchMode=yes', '-o', 'ConnectTimeout=' + str(CONNECT_TIMEOUT)]
+    if(os.name != 'nt'): #Windows OpenSSH has no connection multiplexing
+        control_dir = os.path.join(home, ".kubula", "ssh")
+        os.makedirs(control_dir, exist_ok=True)
+        options += ['-o', 'ControlMaster=auto', '-o', 'ControlPath=' + os.path.join(control_dir, '%C'), '-o', 'ControlPersist=' + str(CONTROL_PERSIST)]
+    return options
+
+"""Runs command on ip over ssh, returns an outcome dict with ip, exit code (None on timeout), seconds and the last output line
+"""
+def run_remote(home: str, ip: str, command: str, timeout: float = None):
+    started = time.monotonic()
+    try:
+        p = subprocess.run(['ssh'] + ssh_options(home) + [SSH_USER + '@' + ip, command], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=timeout)
+        code, output = p.returncode, p.stdout.decode(errors='replace')
+    except subprocess.TimeoutExpired as ex:
+        code, output = None, (ex.output or b'').decode(errors='replace') + "\ntimed out"
+    lines = [line for line in output.splitlines() if line.strip()]
+    return {'ip': ip, 'code': code, 'seconds': time.monotonic() - started, 'last_line': lines[-1].strip() if len(lines) > 0 else ""}
+
+"""Runs command on all ips concurrently with at most workers ssh sessions at a time, outcomes are returned in ips order
+"""
+def run_on_nodes(home: str, ips: list, command: str, timeout: float = None, workers: int = SSH_WORKERS):
+    if(len(ips) == 0):
+        return []
+    with ThreadPoolExecutor(max_workers=min(workers, len(ips))) as executor:
+        return list(executor.map(lambda ip: run_remote(home, ip, command, timeout), ips))
+
+def print_outcomes(outcomes: list):
+    for outcome in outcomes:
+        status = "ok" if outcome['code'] == 0 else ("timeout" if outcome['code'] is None else "failed (" + str(outcome['code']) + ")")
+        print(outcome['ip'].ljust(16) + status.ljust(14) + str(round(outcome['seconds'], 1)).rjust(7) + "s  " + outcome['last_line'])
@@ -0,0 +1,24 @@
+import json
+import os
+
+
+"""State files live in ~/.kubula as .<name>, one json document each
+"""
+def get_state_path(homePath: str, name: str):
+    kubulaPath = str(os.path.join(homePath, ".kubula"))
+    if not os.path.exists(kubulaPath):
+        os.makedirs(kubulaPath)
+    return str(os.path.join(kubulaPath, "." + name))
+
+def read_state(homePath: str, name: str, default = None):
+    path = get_state_path(homePath, name)
+    if(default is not None and not os.path.exists(path)):
+        return default
+    with open(path, 'r') as state_file:
+        return json.loads(state_file.read())
+
+def write_state(homePath: str, name: str, state):
+    path = get_state_path(homePath, name)
+    with open(path + ".tmp", 'w+') as state_file:
+        json.dump(state, state_file)
+    os.replace(path + ".tmp", path) #never leave a half written file behind
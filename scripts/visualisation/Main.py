@@ -1,3 +1,5 @@
+import argparse
+import cProfile
 import json
 from typing import List
 
@@ -7,8 +9,13 @@ import os
 import sys
 import numpy as np
 
-from performance_plots import produce_throughput_graphs_in_folder, produce_throughput_compound_graph, produce_latency_graphs_in_folder, produce_latency_compound_graph, produce_compound_latency_metrics
-from checkpoint_plots import produce_checkpoint_plot, produce_compound_checkpoint_metrics, produce_compound_recovery_metrics
+from performance_plots import produce_throughput_graphs_in_folder, produce_throughput_compound_graph, produce_latency_graphs_in_folder, produce_latency_compound_graph, produce_compound_latency_metrics, produce_latency_percentile_graphs_in_folder, produce_latency_percentile_graph
+from checkpoint_plots import produce_checkpoint_plot, produce_compound_checkpoint_metrics, produce_compound_checkpoint_cost, produce_compound_recovery_metrics
+from lib import data_cache, parallel, plot_builder, profiling
+from lib.downsample import METHODS
+from lib.catalog import get_catalog
+from lib.metric_table import render_table, FORMATS
+from lib.plot_builder import Plotter
 
 import warnings
 warnings.filterwarnings("ignore")
@@ -24,60 +31,126 @@ metric_data_folder = "C:/projects/BlackSP/scripts/experiments/results"#"C:/Users
 fromSecond = 30
 toSecond = 240
 
-compound_plot_keys = [
-    ('job-1-cp-0-10s-18k-(3)', 'UC'),
-    ('job-1-cp-1-10s-18k-(3)', 'CC'),
-    ('job-1-cp-2-10s-18k-(2)', 'CIC')
-]
+#experiments shown in the compound plots, one per protocol (see Catalog.filter for the accepted fields)
+compound_plot_query = {'job': 1, 'interval': 10, 'throughput_k': 18}
+
+actions = ['plot_throughput', 'plot_latency', 'plot_latency_percentiles', 'plot_compound', 'metric_latency', 'metric_checkpoint', 'metric_checkpoint_cost', 'metric_recovery']
+
+"""Selects one experiment per protocol matching compound_plot_query, the latest repetition unless one is given
+"""
+def get_compound_plot_keys(repetition: int = None):
+    catalog = get_catalog(plot_data_folder)
+    keys = []
+    for _, experiments in catalog.group('protocol', experiments=catalog.filter(**compound_plot_query)):
+        candidates = [e for e in experiments if repetition is None or e.repetition == repetition]
+        if(len(candidates) > 0):
+            experiment = max(candidates, key=lambda e: e.repetition)
+            keys.append((experiment.key, experiment.protocol_name, experiment.location))
+    return keys
+
+"""Selects every repetition per protocol matching compound_plot_query, labelled by protocol
+"""
+def get_compound_plot_repetitions():
+    catalog = get_catalog(plot_data_folder)
+    return [(e.key, e.protocol_name, e.location) for _, experiments in catalog.group('protocol', experiments=catalog.filter(**compound_plot_query)) for e in experiments]
 
 def main():
-    args = sys.argv[1:]
-    if(len(args) == 0) :
-        print("give argument")
-        exit()
-
-    action = args[0];
-
-    if(action == 'plot_throughput'):
-        produce_throughput_graphs_in_folder(plot_data_folder)
-    if(action == 'plot_latency'):
-        produce_latency_graphs_in_folder(plot_data_folder)
-
-    if(action == 'plot_compound'):
-        plotter = produce_throughput_compound_graph(plot_data_folder, compound_plot_keys)
-        plotter.xlim([fromSecond, toSecond])
-        plotter.ylim([0, 75000])
-        #plotter.show_plot(experiment)
-        plotter.save_plot(f"{plot_data_folder}/compound-throughput")
+    parser = argparse.ArgumentParser()
+    parser.add_argument('actions', nargs='+', choices=actions, metavar='action', help=", ".join(actions) + " (several actions share loaded data)")
+    parser.add_argument('--repetition', type=int, default=None, help="plot_compound: repetition to plot per protocol, the latest one when omitted")
+    parser.add_argument('--jobs', type=int, default=1, help="number of worker processes used to handle experiments concurrently")
+    parser.add_argument('--no-cache', action='store_true', help="always parse the raw log files instead of using the parsed data cache")
+    parser.add_argument('--max-points', type=int, default=None, help="decimate every plotted series to roughly this many points")
+    parser.add_argument('--downsample', choices=METHODS, default='minmax', help="decimation method used with --max-points, 'raster' embeds dense series as an image instead")
+    parser.add_argument('--bucket-ms', type=int, default=1000, help="plot_latency_percentiles: width of the time buckets latency percentiles are computed over")
+    parser.add_argument('--recovery-band', type=float, default=0.1, help="metric_recovery: relative distance to the pre-failure baseline throughput that counts as recovered")
+    parser.add_argument('--streaming', action='store_true', help="metric_latency: summarise latency logs in blocks with mergeable sketches instead of loading them entirely")
+    parser.add_argument('--relative-accuracy', type=float, default=0.01, help="relative error bound of the streamed latency quantiles")
+    parser.add_argument('--cost-baseline-ms', type=float, default=5000, help="metric_checkpoint_cost: length of the window before each checkpoint its cost is measured against")
+    parser.add_argument('--cost-settle-ms', type=float, default=1000, help="metric_checkpoint_cost: time after each checkpoint completed that still counts towards its cost")
+    parser.add_argument('--format', choices=FORMATS, default='latex', help="output format of the metric tables")
+    parser.add_argument('--profile', action='store_true', help="print the time and rows per stage, function and experiment when done")
+    parser.add_argument('--profile-trace', default=None, metavar='FILE', help="with --profile, also write every measured call to a Chrome trace file")
+    parser.add_argument('--profile-cprofile', default=None, metavar='FILE', help="with --profile, also run cProfile in the main process and write its statistics to FILE")
+    args = parser.parse_args()
+
+    parallel.set_jobs(args.jobs)
+    data_cache.enabled = not args.no_cache
+    plot_builder.defaults.update({'max_points': args.max_points, 'downsample': args.downsample})
+    profiler = None
+    if(args.profile or args.profile_trace or args.profile_cprofile):
+        profiling.start(trace=args.profile_trace is not None)
+        if(args.profile_cprofile):
+            profiler = cProfile.Profile()
+            profiler.enable()
+
+    for action in args.actions:
+        with profiling.section('action', action):
+            if(action == 'plot_throughput'):
+                produce_throughput_graphs_in_folder(plot_data_folder)
+            if(action == 'plot_latency'):
+                produce_latency_graphs_in_folder(plot_data_folder)
+
+            if(action == 'plot_latency_percentiles'):
+                produce_latency_percentile_graphs_in_folder(plot_data_folder, args.bucket_ms)
+
+                plotter = Plotter()
+                plotter.start_plot()
+                produce_latency_percentile_graph(plot_data_folder, get_compound_plot_repetitions(), plotter, fromSecond, toSecond, args.bucket_ms)
+                plotter.save_plot(f"{plot_data_folder}/compound-latency-percentiles")
+
+            if(action == 'plot_compound'):
+                compound_plot_keys = get_compound_plot_keys(args.repetition)
+                plotter = produce_throughput_compound_graph(plot_data_folder, compound_plot_keys)
+                plotter.xlim([fromSecond, toSecond])
+                plotter.ylim([0, 75000])
+                #plotter.show_plot(experiment)
+                plotter.save_plot(f"{plot_data_folder}/compound-throughput")
         
-        plotter = produce_latency_compound_graph(plot_data_folder, compound_plot_keys)
-        plotter.xlim([fromSecond, toSecond])
-        plotter.ylim([0, 25000])
-        #plotter.show_plot(experiment)
-        plotter.save_plot(f"{plot_data_folder}/compound-latency")
-
-    if(action == 'metric_latency'):
-        metrics = produce_compound_latency_metrics(metric_data_folder, fromSecond, toSecond)
-        metrics['protocol'] = metrics['protocol'].apply(lambda s: 'UC' if s == '0' else 'CC' if s == '1' else 'CIC')
-        metrics['protocol'] = metrics['protocol'] + " @ " + metrics['interval']+"s"
-        metrics.drop('interval', axis='columns', inplace=True)
-        print(metrics.to_latex(index = False))
-
-    if(action == 'metric_checkpoint'):  
-        metrics = produce_compound_checkpoint_metrics(metric_data_folder)
-        metrics['protocol'] = metrics['protocol'].apply(lambda s: 'UC' if s == '0' else 'CC' if s == '1' else 'CIC')
-        metrics['protocol'] = metrics['protocol'] + " @ " + metrics['interval']+"s"
-        metrics.drop('interval',axis='columns', inplace=True)
-        print(metrics.to_latex(index = False))
-        
-    if(action == 'metric_recovery'):
-        metrics = produce_compound_recovery_metrics(metric_data_folder)
-        metrics['protocol'] = metrics['protocol'].apply(lambda s: 'UC' if s == '0' else 'CC' if s == '1' else 'CIC')
-        metrics['protocol'] = metrics['protocol'] + " @ " + metrics['interval']+"s"
-        metrics.drop('interval',axis='columns', inplace=True)
-        print(metrics.to_latex(index = False))
+                plotter = produce_latency_compound_graph(plot_data_folder, compound_plot_keys)
+                plotter.xlim([fromSecond, toSecond])
+                plotter.ylim([0, 25000])
+                #plotter.show_plot(experiment)
+                plotter.save_plot(f"{plot_data_folder}/compound-latency")
+
+            if(action == 'metric_latency'):
+                metrics = produce_compound_latency_metrics(metric_data_folder, fromSecond, toSecond, streaming=args.streaming, relativeAccuracy=args.relative_accuracy)
+                metrics['protocol'] = metrics['protocol'].apply(lambda s: 'UC' if s == '0' else 'CC' if s == '1' else 'CIC')
+                metrics['protocol'] = metrics['protocol'] + " @ " + metrics['interval']+"s"
+                metrics.drop('interval', axis='columns', inplace=True)
+                print(render_table(metrics, args.format))
+
+            if(action == 'metric_checkpoint'):  
+                metrics = produce_compound_checkpoint_metrics(metric_data_folder)
+                metrics['protocol'] = metrics['protocol'].apply(lambda s: 'UC' if s == '0' else 'CC' if s == '1' else 'CIC')
+                metrics['protocol'] = metrics['protocol'] + " @ " + metrics['interval']+"s"
+                metrics.drop('interval',axis='columns', inplace=True)
+                print(render_table(metrics, args.format))
         
+            if(action == 'metric_checkpoint_cost'):
+                metrics = produce_compound_checkpoint_cost(metric_data_folder, args.cost_baseline_ms, args.cost_settle_ms, args.recovery_band)
+                metrics['protocol'] = metrics['protocol'].apply(lambda s: 'UC' if s == '0' else 'CC' if s == '1' else 'CIC')
+                metrics['protocol'] = metrics['protocol'] + " @ " + metrics['interval']+"s"
+                metrics.drop('interval',axis='columns', inplace=True)
+                print(render_table(metrics, args.format))
+
+            if(action == 'metric_recovery'):
+                metrics = produce_compound_recovery_metrics(metric_data_folder, band=args.recovery_band)
+                metrics['protocol'] = metrics['protocol'].apply(lambda s: 'UC' if s == '0' else 'CC' if s == '1' else 'CIC')
+                metrics['protocol'] = metrics['protocol'] + " @ " + metrics['interval']+"s"
+                metrics.drop('interval',axis='columns', inplace=True)
+                print(render_table(metrics, args.format))
+
+    if(profiler is not None):
+        profiler.disable()
+        profiler.dump_stats(args.profile_cprofile)
+        print(f"cProfile statistics written to {args.profile_cprofile}")
+    if(profiling.enabled):
+        print(profiling.report())
+        if(args.profile_trace):
+            profiling.write_trace(args.profile_trace)
+            print(f"Trace written to {args.profile_trace}, open it in chrome://tracing or ui.perfetto.dev")
     print("Done, exiting")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,234 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+import pandas as pd
+
+from lib import data_cache, parallel, synthetic
+from lib.catalog import get_catalog, clear_catalogs, LOG_FOLDERS
+from lib.data_retriever import read_experiment_file, parse_metric_content, get_init_ts, THROUGHPUT_COLUMNS, LATENCY_COLUMNS, FAILURE_COLUMNS, CHECKPOINT_COLUMNS, RECOVERY_COLUMNS, LOST_MESSAGES_COLUMNS
+from lib.data_parser import parse_throughput_data, parse_latency_data, parse_failures_data, parse_checkpoint_data, parse_recovery_data, parse_lost_messages_data, parse_time_to_timestamp, normalize_timestamp_column
+from lib.plot_builder import Plotter
+from performance_plots import produce_compound_latency_metrics, produce_throughput_compound_graph, produce_latency_compound_graph, produce_latency_percentile_graph
+from checkpoint_plots import produce_compound_checkpoint_metrics, produce_compound_checkpoint_cost, produce_compound_recovery_metrics
+
+import warnings
+warnings.filterwarnings("ignore")
+
+#times every stage of the analysis on generated results trees of increasing size and appends the outcome to a results file
+#e.g. python benchmark.py run --sizes 1,2,4,8 --scale-by repetitions, then python benchmark.py compare to compare the last two runs
+#python benchmark.py generate <folder> writes a single synthetic results tree to try the plots on
+
+STAGES = ['read', 'parse', 'normalize', 'aggregate', 'render']
+SCALE_BY = ['repetitions', 'duration', 'shards']
+DEFAULT_OUTPUT = 'benchmark-results.jsonl'
+
+"""Returns (columns, parser) of a log file of an experiment, the same parsers data_cache builds its frames with
+"""
+def get_log_kind(name: str):
+    folder, filename = name.split('/', 1) if '/' in name else (None, name)
+    if(folder == 'performance'):
+        return (THROUGHPUT_COLUMNS, parse_throughput_data) if filename.startswith('throughput') else (LATENCY_COLUMNS, lambda frame: parse_latency_data(frame.drop_duplicates()))
+    return {'checkpoint': (CHECKPOINT_COLUMNS, parse_checkpoint_data), 'recovery': (RECOVERY_COLUMNS, parse_recovery_data),
+            'lost-messages': (LOST_MESSAGES_COLUMNS, parse_lost_messages_data), None: (FAILURE_COLUMNS, parse_failures_data)}[folder]
+
+"""Lists (location, experiment, name) of every metric log under root, names relative to the experiment
+"""
+def get_log_files(root: str):
+    return [(e.location, e.key, name) for e in get_catalog(root).experiments
+            for name in ['failures.log'] + [f'{folder}/{filename}' for folder in LOG_FOLDERS for filename in e.files[folder]]]
+
+"""Times function over repeat runs (the fastest counts) and measures its peak traced memory in one more run
+prepare returns the argument of function and is not measured, returns (seconds, peak MiB)
+"""
+def measure(function, prepare, repeat: int):
+    seconds = []
+    for _ in range(repeat):
+        argument = prepare()
+        start = time.perf_counter()
+        function(argument)
+        seconds.append(time.perf_counter() - start)
+    argument = prepare()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    function(argument)
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+    return min(seconds), peak / 2**20
+
+def read_logs(files: list):
+    return [read_experiment_file(location, experiment, name) for location, experiment, name in files]
+
+def parse_logs(item: tuple):
+    files, contents = item
+    return [get_log_kind(name)[1](parse_metric_content(content, get_log_kind(name)[0])) for (_, _, name), content in zip(files, contents)]
+
+def normalize_logs(item: tuple):
+    frames, initial = item
+    return [normalize_timestamp_column(frame, ts) for frame, ts in zip(frames, initial)]
+
+def aggregate(root: str):
+    location = os.path.join(root, 'synthetic')
+    return [produce_compound_latency_metrics(location, 30, 240), produce_compound_checkpoint_metrics(location), produce_compound_recovery_metrics(location), produce_compound_checkpoint_cost(location)]
+
+def render(root: str):
+    location = os.path.join(root, 'synthetic')
+    experiments = [(e.key, e.protocol_name, e.location) for e in get_catalog(location).experiments]
+    produce_throughput_compound_graph(location, experiments).save_plot(os.path.join(root, 'compound-throughput'))
+    produce_latency_compound_graph(location, experiments).save_plot(os.path.join(root, 'compound-latency'))
+    plotter = Plotter()
+    plotter.start_plot()
+    produce_latency_percentile_graph(location, experiments, plotter).save_plot(os.path.join(root, 'compound-latency-percentiles'))
+
+"""Runs every stage on the results tree at root, returns the counts of the tree and {stage: {seconds, peak_mib}}
+the stages read the raw logs, parse them into typed frames, normalize their timestamps, compute every metric table
+and render the compound plots. The last two work on frames already loaded like a second action of Main.py does.
+"""
+def run_stages(root: str, repeat: int):
+    clear_catalogs()
+    data_cache.clear_loaded()
+    files = get_log_files(os.path.join(root, 'synthetic'))
+    contents = read_logs(files)
+    frames = parse_logs((files, contents))
+    initial = [parse_time_to_timestamp(get_init_ts(location, experiment)) for location, experiment, _ in files]
+    results = {}
+    results['read'] = measure(read_logs, lambda: files, repeat)
+    results['parse'] = measure(parse_logs, lambda: (files, contents), repeat)
+    results['normalize'] = measure(normalize_logs, lambda: ([frame.copy() for frame in frames], initial), repeat)
+    aggregate(root) #loads every frame once
+    results['aggregate'] = measure(aggregate, lambda: root, repeat)
+    results['render'] = measure(render, lambda: root, repeat)
+    counts = {'experiments': len(get_catalog(os.path.join(root, 'synthetic'))), 'files': len(files), 'bytes': sum(len(content) for content in contents), 'rows': sum(len(frame) for frame in frames)}
+    return counts, {stage: {'seconds': round(results[stage][0], 4), 'peak_mib': round(results[stage][1], 1)} for stage in STAGES}
+
+"""Returns the generator settings of a size, the dimension scale_by is multiplied by size
+"""
+def get_settings(args, size: int):
+    settings = {'protocols': tuple(args.protocols), 'repetitions': args.repetitions, 'seed': args.seed, 'shards': args.shards, 'workers': args.workers, 'durationSec': args.duration,
+                'failures': args.failures, 'duplicateHeaders': args.duplicate_headers, 'duplicateRows': args.duplicate_rows}
+    key = {'repetitions': 'repetitions', 'duration': 'durationSec', 'shards': 'shards'}[args.scale_by]
+    settings[key] = settings[key] * size
+    return settings
+
+def get_commit():
+    try:
+        folder = os.path.dirname(os.path.abspath(__file__))
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=folder, capture_output=True, text=True, timeout=30).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--', '.'], cwd=folder, capture_output=True, text=True, timeout=30).stdout.strip() != ''
+        return (commit + ('-dirty' if dirty else '')) or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def run(args):
+    parallel.set_jobs(1)
+    data_cache.enabled = False #every run starts from the raw logs
+    record = {'commit': get_commit(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(), 'pandas': pd.__version__, 'numpy': np.__version__,
+              'machine': platform.machine(), 'scale_by': args.scale_by, 'repeat': args.repeat, 'base': get_settings(args, 1), 'sizes': []}
+    workdir = tempfile.mkdtemp(prefix='benchmark-', dir=args.workdir)
+    try:
+        for size in args.sizes:
+            root = os.path.join(workdir, f'size-{size}')
+            start = time.perf_counter()
+            synthetic.generate_results(root, **get_settings(args, size))
+            print(f"size {size}: generated in {time.perf_counter() - start:.1f}s")
+            counts, stages = run_stages(root, args.repeat)
+            record['sizes'].append(dict(size=size, **counts, stages=stages))
+            print(f"size {size}: {counts['experiments']} experiments, {counts['files']} files, {counts['bytes'] / 2**20:.1f} MiB, {counts['rows']} rows")
+            for stage in STAGES:
+                print(f"  {stage:<10}{stages[stage]['seconds']:>10.3f}s{counts['rows'] / max(stages[stage]['seconds'], 1e-9) / 1e6:>10.2f}M rows/s{stages[stage]['peak_mib']:>10.1f} MiB")
+            if(not args.keep):
+                shutil.rmtree(root, ignore_errors=True)
+    finally:
+        if(not args.keep):
+            shutil.rmtree(workdir, ignore_errors=True)
+        else:
+            print(f"Results trees kept in {workdir}")
+    with open(args.output, 'a') as file:
+        file.write(json.dumps(record) + '\n')
+    print(f"Appended the results of {record['commit']} to {args.output}")
+
+"""Compares the last record of a results file to a baseline record (the one before it unless a commit is given)
+returns 1 when a stage got slower than threshold times the baseline, stages faster than minSeconds are not compared
+"""
+def compare(args):
+    with open(args.output) as file:
+        records = [json.loads(line) for line in file if line.strip()]
+    if(len(records) < 2):
+        print(f"{args.output} holds {len(records)} records, at least two are needed")
+        return 1
+    current = records[-1]
+    candidates = [r for r in records[:-1] if args.baseline is None or (r['commit'] or '').startswith(args.baseline)]
+    if(len(candidates) == 0):
+        print(f"No record of commit {args.baseline} in {args.output}")
+        return 1
+    baseline = candidates[-1]
+    if(baseline['base'] != current['base'] or baseline['scale_by'] != current['scale_by']):
+        print("The records were generated with different settings, their timings are not comparable")
+    print(f"{baseline['commit']} ({baseline['time']}) -> {current['commit']} ({current['time']})")
+    regressions = 0
+    sizes = {entry['size']: entry for entry in baseline['sizes']}
+    for entry in current['sizes']:
+        if(entry['size'] not in sizes):
+            continue
+        for stage in STAGES:
+            before, after = sizes[entry['size']]['stages'][stage], entry['stages'][stage]
+            ratio = after['seconds'] / max(before['seconds'], 1e-9)
+            slower = ratio > args.threshold and after['seconds'] >= args.min_seconds
+            regressions += slower
+            print(f"size {entry['size']:<4}{stage:<10}{before['seconds']:>9.3f}s ->{after['seconds']:>9.3f}s{ratio:>7.2f}x{before['peak_mib']:>9.1f} ->{after['peak_mib']:>8.1f} MiB{'  SLOWER' if slower else ''}")
+    print(f"{regressions} stage(s) slower than {args.threshold}x the baseline")
+    return 1 if regressions > 0 else 0
+
+def add_generator_arguments(parser):
+    parser.add_argument('--protocols', type=lambda s: [int(p) for p in s.split(',')], default=[0, 1, 2], help="checkpoint protocols, comma separated")
+    parser.add_argument('--repetitions', type=int, default=1, help="repetitions per protocol")
+    parser.add_argument('--shards', type=int, default=24, help="latency shards (topic partitions)")
+    parser.add_argument('--workers', type=int, default=8, help="worker instances, the coordinator comes on top")
+    parser.add_argument('--duration', type=int, default=260, help="length of each experiment in seconds")
+    parser.add_argument('--failures', type=int, default=1, help="failures per experiment, the first 90 seconds in")
+    parser.add_argument('--duplicate-headers', type=int, default=1, help="extra header lines per metric log, as written when a logger restarts")
+    parser.add_argument('--duplicate-rows', type=float, default=0.001, help="fraction of latency rows that are written twice")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the generator, the same seed gives the same tree")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the analysis scripts on synthetic results trees")
+    actions = parser.add_subparsers(dest='action', required=True)
+    generate = actions.add_parser('generate', help="write a synthetic results tree")
+    generate.add_argument('root', help="folder the tree is written to, experiments go to <root>/synthetic")
+    generate.add_argument('--start', default='03:00:00:000000', help="init timestamp of every experiment, e.g. 12:58:00:000000 to cross the 12-hour clock wrap")
+    add_generator_arguments(generate)
+    bench = actions.add_parser('run', help="time every stage at increasing sizes and append the results")
+    bench.add_argument('--sizes', type=lambda s: [int(p) for p in s.split(',')], default=[1, 2, 4, 8], help="multipliers of the scaled dimension, comma separated")
+    bench.add_argument('--scale-by', choices=SCALE_BY, default='repetitions', help="dimension of the tree that grows with the size")
+    bench.add_argument('--repeat', type=int, default=3, help="runs per stage, the fastest counts")
+    bench.add_argument('--output', default=DEFAULT_OUTPUT, help="results file the run is appended to (JSON lines)")
+    bench.add_argument('--workdir', default=None, help="folder the trees are generated in, the system temp folder when omitted")
+    bench.add_argument('--keep', action='store_true', help="keep the generated trees")
+    add_generator_arguments(bench)
+    comparison = actions.add_parser('compare', help="compare the last run to an earlier one, exits with 1 on a regression")
+    comparison.add_argument('--output', default=DEFAULT_OUTPUT, help="results file to read")
+    comparison.add_argument('--baseline', default=None, help="commit to compare against, the run before the last one when omitted")
+    comparison.add_argument('--threshold', type=float, default=1.25, help="ratio of the baseline time above which a stage counts as slower")
+    comparison.add_argument('--min-seconds', type=float, default=0.05, help="stages faster than this are not compared")
+    args = parser.parse_args()
+
+    if(args.action == 'generate'):
+        keys = synthetic.generate_results(args.root, start=args.start, **get_settings(argparse.Namespace(**vars(args), scale_by='repetitions'), 1))
+        print(f"Wrote {len(keys)} experiments to {os.path.join(args.root, 'synthetic')}")
+    elif(args.action == 'run'):
+        run(args)
+    else:
+        sys.exit(compare(args))
+
+if __name__ == "__main__":
+    main()
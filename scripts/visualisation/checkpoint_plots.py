@@ -6,33 +6,37 @@ import matplotlib.pyplot as plt
 import os
 import numpy as np
 
-from lib.data_retriever import get_experiments_at_location, get_checkpoint_files, get_checkpoint_file_content, get_recovery_files, get_recovery_file_content, get_init_ts
-from lib.data_parser import parse_checkpoint_data, normalize_timestamp_column, parse_time_to_timestamp,parse_recovery_data
+from lib.data_retriever import get_experiments_at_location, get_checkpoint_files, get_recovery_files, get_lost_messages_files, get_performance_files
+from lib.data_cache import load_checkpoint_data, load_recovery_data, load_lost_messages_data, load_throughput_data, load_latency_data, load_failure_data
+from lib.data_parser import stack_frames, US_PER_MS
+from lib.recovery_time import detect_recovery
+from lib.lost_messages import attribute_lost_messages
+from lib.smoothing import smooth_many
 from lib.plot_builder import Plotter
+from lib.parallel import map_ordered
+from lib.metric_table import column, derived, to_long, load_dataset, add_metrics, add_run_metrics, compute_table
+from lib.checkpoint_cost import attribute_checkpoint_cost, bucket_series
+from lib.profiling import instrument
 
 def produce_checkpoint_plot(location: str):
     for experiment in get_experiments_at_location(location):
         plotter = Plotter()
         plotter.start_plot()
 
-        frame = pd.DataFrame()
+        frames = []
 
         for perf_file in get_checkpoint_files(location, experiment):
             instanceName = perf_file.split("-", 1)[0]
             
             print(f"Processing datafile {perf_file} ({instanceName})")
-            data = get_checkpoint_file_content(location, experiment, perf_file)
+            data = load_checkpoint_data(location, experiment, perf_file)
             if(data.empty):
                 continue
-            #parse & normalize
-            data = parse_checkpoint_data(data);
-            initialTs = parse_time_to_timestamp(get_init_ts(location, experiment))
-            data = normalize_timestamp_column(data, initialTs)
             #print(data)
             #add to plot
-            frame = pd.concat([frame, data['bytes']])
+            frames.append(data[['bytes']])
 
-        frame.columns = ['bytes']
+        frame = stack_frames(frames, ['bytes'])
         print(frame)
         plotter.add_checkpoint_data(frame.apply(lambda b: b/1000))
         plotter.show_plot()
@@ -40,124 +44,157 @@ def produce_checkpoint_plot(location: str):
 
 
     
-def produce_compound_checkpoint_metrics(location: str):
-    output = pd.DataFrame(columns = ['query', 'protocol', 'interval', '#total', '#regular', '#forced', 'size (Kb)', 'time (ms)'])
-    i = 0
-    for query_folder in get_experiments_at_location(location):
-        query_folder_path = os.path.join(location, query_folder)
-        
-        print(query_folder)
-        frame = pd.DataFrame()
-        frame['key'] = get_experiments_at_location(query_folder_path);
-        frame['protocol'] = frame['key'].apply(lambda key: key.split('-')[3])
-        frame['interval'] = frame['key'].apply(lambda key: key.split('-')[4][:2])
-        for _, group in frame.groupby(['protocol', 'interval']):
-            checkpoints = pd.DataFrame()
-            group_size = 0
-            for key in group['key']:
-                checkpoints = group_checkpoint_data(query_folder_path, key, checkpoints)
-                group_size += 1
-            checkpoints = checkpoints.reset_index()        
-
-            cp_total = round(np.count_nonzero(checkpoints['timestamp'])/group_size)
-            cp_regular = round(np.count_nonzero(checkpoints['forced'] == False)/group_size)
-            cp_forced = cp_total - cp_regular
-            size_mean = round(checkpoints['kbytes'].mean())
-            size_stdef = round(checkpoints['kbytes'].std())
-            time_mean = round(checkpoints['taken_ms'].mean())
-            time_stdef = round(checkpoints['taken_ms'].std())
-            output.loc[i] = [str(query_folder), group['protocol'].iloc[0], group['interval'].iloc[0], cp_total, cp_regular, cp_forced, str(size_mean) + " ± " + str(size_stdef), str(time_mean) + " ± " + str(time_stdef)]
-            i += 1
-    return output
-
-def group_checkpoint_data(location: str, experiment: str, frame: pd.DataFrame):
-    initialTs = parse_time_to_timestamp(get_init_ts(location, experiment))
-    for perf_file in get_checkpoint_files(location, experiment):
-        instanceName = perf_file.split("-", 1)[0]
-        data = get_checkpoint_file_content(location, experiment, perf_file)
-        if(data.empty):
-            continue
-        #parse & normalize
-        data = parse_checkpoint_data(data)
-        data = normalize_timestamp_column(data, initialTs)
-        frame = pd.concat([frame, data])
-    frame['kbytes'] = (frame['bytes'] / 1000).round(0)
-    return frame
-
-
-def produce_compound_recovery_metrics(location: str):
-    output = pd.DataFrame(columns = ['query', 'protocol', 'interval', '#total', '#recovered', 'recovery (ms)', 'restore (ms)', 'rollback (s)'])
-    i = 0
-    for query_folder in get_experiments_at_location(location):
-        query_folder_path = os.path.join(location, query_folder)
-    
-        frame = pd.DataFrame()
-        frame['key'] = get_experiments_at_location(query_folder_path);
-        frame['protocol'] = frame['key'].apply(lambda key: key.split('-')[3])
-        frame['interval'] = frame['key'].apply(lambda key: key.split('-')[4][:2])
-        for _, group in frame.groupby(['protocol', 'interval']):
-            recovery = pd.DataFrame()
-            group_size = 0
-            for key in group['key']:
-                recovery = pd.concat([recovery, group_recovery_data(query_folder_path, key)])
-                group_size += 1
-            recovery = recovery.reset_index()        
-            recovery['rollback_s'] = recovery['rollback_ms'].apply(lambda ms: ms/1000);
-            #compute statistics
-            total_workers = round(recovery['total_workers'].mean())
-            recovered_workers = round(recovery['recovered_workers'].mean())
-            recovery_mean = float('nan') #TODO: calculate somehow..
-            restore_mean = round(recovery['restored_ms'].mean())
-            restore_stdev = round(recovery['restored_ms'].std())
-            rollback_mean = round(recovery['rollback_s'].mean(),2)
-            rollback_stdev = round(recovery['rollback_s'].std(),2)
-            output.loc[i] = [str(query_folder), group['protocol'].iloc[0], group['interval'].iloc[0], total_workers, recovered_workers, recovery_mean, str(restore_mean) + " ± " + str(restore_stdev), str(rollback_mean) + " ± " + str(rollback_stdev)]
-            i += 1
-    return output
-
-def group_recovery_data(location: str, experiment: str):
-    initialTs = parse_time_to_timestamp(get_init_ts(location, experiment))
-
-    frame = pd.DataFrame()
-    total_workers = 0;
-    for perf_file in get_recovery_files(location, experiment):
-        instanceName = perf_file.split("-", 1)[0]
-        total_workers += 1
-
-        data = get_recovery_file_content(location, experiment, perf_file)
-        if(data.empty):
-            continue
-        #parse & normalize
-        data = parse_recovery_data(data)
-        data = normalize_timestamp_column(data, initialTs)
-        #add to plot
-        frame = pd.concat([frame, data])
-    total_workers -= 1 #subtract the coordinator
-    
+#columns of the checkpoint table, see lib/metric_table
+CHECKPOINT_TABLE = [column('#total', 'logged', 'sum/run', 0), column('#regular', 'regular', 'sum/run', 0), derived('#forced', lambda table: table['#total'] - table['#regular']),
+                    column('size (Kb)', 'kbytes', 'mean±std'), column('time (ms)', 'taken_ms', 'mean±std')]
 
-    if(frame.empty):
+def produce_compound_checkpoint_metrics(location: str):
+    groups, _, dataset = load_dataset(location, [checkpoint_metrics])
+    return compute_table(groups, dataset, CHECKPOINT_TABLE)
+
+"""Returns the rows of every checkpoint of an experiment for the metric table
+logged is 1 for checkpoints with a timestamp, regular is 1 for checkpoints that were not forced
+"""
+@instrument('aggregate', 1)
+def checkpoint_metrics(location: str, experiment: str):
+    frames = [data for data in (load_checkpoint_data(location, experiment, perf_file) for perf_file in get_checkpoint_files(location, experiment)) if not data.empty]
+    checkpoints = stack_frames(frames, ['timestamp', 'forced', 'taken_ms', 'bytes'])
+    checkpoints['logged'] = checkpoints['timestamp'] != 0
+    checkpoints['regular'] = checkpoints['forced'] == False
+    checkpoints['kbytes'] = (checkpoints['bytes'] / 1000).round(0)
+    return to_long(checkpoints, ['logged', 'regular', 'kbytes', 'taken_ms'])
+
+
+#columns of the checkpoint cost table, regular and forced checkpoints side by side, see lib/checkpoint_cost
+#checkpoints near a failure are only counted, their windows overlap the warm-up of the run or the outage and catch-up of a failure
+CHECKPOINT_COST_TABLE = [c for kind in ('regular', 'forced') for c in [
+    column(f'#{kind}', f'{kind} duration_ms', 'count/run', 0),
+    column(f'#{kind} near failure', f'{kind} near_failure', 'count/run', 0),
+    column(f'{kind} time (ms)', f'{kind} duration_ms', 'mean±std'),
+    column(f'{kind} deficit (e/s)', f'{kind} throughput_deficit', 'mean±std'),
+    column(f'{kind} deficit median (e/s)', f'{kind} throughput_deficit', 'median', 0),
+    column(f'{kind} deficit (%)', f'{kind} relative_percent', 'mean±std', 1),
+    column(f'{kind} latency (+ms)', f'{kind} latency_inflation', 'mean±std', 1),
+    column(f'{kind} latency median (+ms)', f'{kind} latency_inflation', 'median', 1),
+    column(f'{kind} lost (e/run)', f'{kind} lost_events', 'sum/run', 0)]]
+
+"""Attributes a throughput deficit and latency inflation to every checkpoint of every run and tabulates them per group
+baselineMs and settleMs set the windows compared around each checkpoint, see attribute_checkpoint_cost
+checkpoints whose windows overlap the warm-up or a failure until the run settled (see get_outages, band) are left out of the costs
+"""
+def produce_compound_checkpoint_cost(location: str, baselineMs: float = 5000, settleMs: float = 1000, band: float = 0.1):
+    groups, runs, dataset = load_dataset(location, [])
+    loaded = map_ordered(load_run_checkpoint_series, list(zip(runs['location'], runs['experiment'])))
+    def combine(position: int, columns: list):
+        return stack_frames([frames[position].assign(run=np.int32(run)) for run, frames in zip(runs.index, loaded)], columns + ['run'])
+    costs = attribute_checkpoint_cost(combine(0, ['instance', 'timestamp', 'forced', 'taken_ms']), combine(1, ['timestamp', 'sum', 'count']), combine(2, ['timestamp', 'sum', 'count']),
+                                      baselineMs, settleMs, get_outages(runs, combine(3, ['timestamp']), band))
+    costs['relative_percent'] = costs['relative_deficit'] * 100
+    metrics = ['duration_ms', 'throughput_deficit', 'relative_percent', 'latency_inflation', 'lost_events']
+    for kind, forced in (('regular', False), ('forced', True)):
+        selected = costs[(costs['forced'] == forced) & ~costs['near_failure']].rename(columns={metric: f'{kind} {metric}' for metric in metrics})
+        dataset = add_metrics(dataset, runs, selected, [f'{kind} {metric}' for metric in metrics])
+        excluded = costs[(costs['forced'] == forced) & costs['near_failure']].rename(columns={'near_failure': f'{kind} near_failure'})
+        dataset = add_metrics(dataset, runs, excluded, [f'{kind} near_failure'])
+    return compute_table(groups, dataset, CHECKPOINT_COST_TABLE)
+
+"""Returns the outages (run, start, end in ms) of the runs: the start of every run until its throughput was up to speed and every failure
+until the throughput settled after the catch-up, every failure of a run is given the time detected after its first failure
+runs that never were up to speed or never settled are down until the end
+"""
+def get_outages(runs: pd.DataFrame, failures: pd.DataFrame, band: float = 0.1):
+    recovery_times = compute_recovery_times(list(zip(runs['location'], runs['experiment'])), band)
+    recovery_times = recovery_times.reindex([get_run_id(path, key) for path, key in zip(runs['location'], runs['experiment'])])
+    settled_ms = recovery_times['settled_ms'].to_numpy(dtype=np.float64)
+    durations = np.nan_to_num(settled_ms[failures['run'].to_numpy()], nan=np.inf)
+    warmups = pd.DataFrame({'run': runs.index.to_numpy(dtype=np.int32), 'start': -np.inf, 'end': np.nan_to_num(recovery_times['warmup_ms'].to_numpy(dtype=np.float64), nan=np.inf)})
+    return pd.concat([warmups, pd.DataFrame({'run': failures['run'], 'start': failures['timestamp'], 'end': failures['timestamp'] + durations})], ignore_index=True)
+
+"""Loads the checkpoints of every instance of a run, its throughput and latency series bucketed per timestamp and its failures, timestamps in ms
+"""
+def load_run_checkpoint_series(run: tuple):
+    location, experiment = run
+    names = get_checkpoint_files(location, experiment)
+    checkpoints = stack_frames([load_checkpoint_data(location, experiment, name) for name in names], ['timestamp', 'forced', 'taken_ms', 'bytes'], keys={'instance': [name.split("-", 1)[0] for name in names]})
+    checkpoints['timestamp'] = checkpoints['timestamp'] / US_PER_MS
+    series = {}
+    for kind in ['throughput', 'latency']:
+        loader = load_throughput_data if kind == 'throughput' else load_latency_data
+        frames = [loader(location, experiment, name) for name in get_performance_files(location, experiment) if name.split("-", 1)[0] == kind]
+        series[kind] = bucket_series(stack_frames(frames, ['timestamp', kind]), kind)
+        series[kind]['timestamp'] = series[kind]['timestamp'] / US_PER_MS
+    failures = load_failure_data(location, experiment)[['timestamp']]
+    return checkpoints[['instance', 'timestamp', 'forced', 'taken_ms']], series['throughput'], series['latency'], failures.assign(timestamp=failures['timestamp'] / US_PER_MS)
+
+#columns of the recovery table, see lib/metric_table
+RECOVERY_TABLE = [column('#total', 'total_workers', 'mean', 0), column('#recovered', 'recovered_workers', 'mean', 0), column('baseline (e/s)', 'baseline', 'mean±std'),
+                  column('drop (ms)', 'drop_ms', 'mean±std'), column('recovery (ms)', 'recovery_ms', 'mean±std'), column('restore (ms)', 'restored_ms', 'mean±std'),
+                  column('rollback (s)', 'rollback_s', 'mean±std', 2), column('lost (msgs)', 'lost_messages', 'mean±std'),
+                  column('lost/failure (msgs)', 'failure_lost_messages', 'mean±std'), column('lost rate (msgs/s)', 'lost_rate', 'mean±std')]
+
+def produce_compound_recovery_metrics(location: str, band: float = 0.1, baselineSec: int = 30, sustain: int = 3):
+    groups, runs, dataset = load_dataset(location, [recovery_metrics])
+    recovery_times = compute_recovery_times(list(zip(runs['location'], runs['experiment'])), band, baselineSec, sustain)
+    times = recovery_times.reindex([get_run_id(path, key) for path, key in zip(runs['location'], runs['experiment'])])
+    dataset = add_run_metrics(dataset, runs, times[['baseline', 'drop_ms', 'recovery_ms']].set_axis(runs.index))
+    per_recovery, per_failure = compute_lost_messages(runs)
+    dataset = add_metrics(dataset, runs, per_recovery, ['lost_messages', 'lost_rate'])
+    dataset = add_metrics(dataset, runs, per_failure.rename(columns={'lost_messages': 'failure_lost_messages'}), ['failure_lost_messages'])
+    return compute_table(groups, dataset, RECOVERY_TABLE)
+
+"""Joins the lost-messages logs of every run against its recovery logs, see attribute_lost_messages
+runs = the runs frame of load_dataset, the run column of the results indexes it
+"""
+def compute_lost_messages(runs: pd.DataFrame):
+    loaded = map_ordered(load_run_replay_logs, list(zip(runs['location'], runs['experiment'])))
+    def combine(position: int, columns: list):
+        return stack_frames([frames[position].assign(run=np.int32(run)) for run, frames in zip(runs.index, loaded)], columns + ['run'])
+    return attribute_lost_messages(combine(0, ['instance', 'timestamp', 'rollback_ms']), combine(1, ['timestamp', 'message_count', 'instance_name']), combine(2, ['timestamp']))
+
+"""Loads the recoveries (per instance), the lost messages and the failures of a run
+"""
+def load_run_replay_logs(run: tuple):
+    location, experiment = run
+    names = get_recovery_files(location, experiment)
+    recoveries = stack_frames([load_recovery_data(location, experiment, name) for name in names], ['timestamp', 'restored_ms', 'rollback_ms'], keys={'instance': [name.split("-", 1)[0] for name in names]})
+    lost = stack_frames([load_lost_messages_data(location, experiment, name) for name in get_lost_messages_files(location, experiment)], ['timestamp', 'message_count', 'instance_name'])
+    return recoveries[['instance', 'timestamp', 'rollback_ms']], lost, load_failure_data(location, experiment)[['timestamp']]
+
+def get_run_id(location: str, experiment: str):
+    return f"{location}/{experiment}"
+
+"""Loads the throughput series and failures of every run and detects recovery for all runs at once
+the throughput series are smoothed in one batched pass like the throughput plots
+"""
+def compute_recovery_times(runs: list, band: float = 0.1, baselineSec: int = 30, sustain: int = 3):
+    loaded = map_ordered(load_run_throughput, runs)
+    run_ids = [get_run_id(location, experiment) for location, experiment in runs]
+    throughput = stack_frames([frame for frame, _ in loaded], ['timestamp', 'throughput'], keys={'run': run_ids})
+    failures = stack_frames([frame for _, frame in loaded], ['timestamp'], keys={'run': run_ids})
+    throughput['timestamp'] = throughput['timestamp'] / US_PER_MS
+    failures['timestamp'] = failures['timestamp'] / US_PER_MS
+    series = [group['throughput'].to_numpy() for _, group in throughput.groupby('run', sort=False, observed=True)]
+    throughput['throughput'] = np.concatenate(smooth_many(series, 'savgol', window_size=19, order=2)) if len(series) > 0 else []
+    return detect_recovery(throughput, failures, baselineSec * 1000, band, sustain)
+
+def load_run_throughput(run: tuple):
+    location, experiment = run
+    frames = [load_throughput_data(location, experiment, name) for name in get_performance_files(location, experiment) if name.split("-", 1)[0] == 'throughput']
+    return stack_frames(frames, ['timestamp', 'throughput']), load_failure_data(location, experiment)
+
+"""Returns the rows of every recovered worker of an experiment for the metric table
+and the number of workers (without the coordinator) and of recovered workers once per run
+"""
+@instrument('aggregate', 1)
+def recovery_metrics(location: str, experiment: str):
+    files = get_recovery_files(location, experiment)
+    frames = [data for data in (load_recovery_data(location, experiment, perf_file) for perf_file in files) if not data.empty]
+    if(len(frames) == 0):
         print("no recovery from " + str(experiment))
-
-    frame['total_workers'] = total_workers
-    frame['recovered_workers'] = recovered_workers = np.count_nonzero(frame['timestamp'])
+    recovery = stack_frames(frames, ['timestamp', 'restored_ms', 'rollback_ms'])
+    recovery['rollback_s'] = recovery['rollback_ms'] / 1000
+    recovered_workers = np.count_nonzero(recovery['timestamp'])
     if(recovered_workers > 24):
         print("double failure in " + experiment)
-
-    return frame
-
-    #print("Total workers:", total_workers)
-    #print("Total recovered:", np.count_nonzero(frame['timestamp']))
-    #print("Restore ms")
-    #print("1th:", np.percentile(frame['restored_ms'], 1).round(2))
-    #print("25th:", np.percentile(frame['restored_ms'], 25).round(2))
-    #print("50th:", np.percentile(frame['restored_ms'], 50).round(2))
-    #print("75th:", np.percentile(frame['restored_ms'], 75).round(2))
-    #print("95th:", np.percentile(frame['restored_ms'], 95).round(2))
-    #print("99th:", np.percentile(frame['restored_ms'], 99).round(2))
-    #print("Rollback distance ms")
-    #print("1th:", np.percentile(frame['rollback_ms'], 1).round(2))
-    #print("25th:", np.percentile(frame['rollback_ms'], 25).round(2))
-    #print("50th:", np.percentile(frame['rollback_ms'], 50).round(2))
-    #print("75th:", np.percentile(frame['rollback_ms'], 75).round(2))
-    #print("95th:", np.percentile(frame['rollback_ms'], 95).round(2))
-    #print("99th:", np.percentile(frame['rollback_ms'], 99).round(2))
\ No newline at end of file
+    workers = pd.DataFrame({'total_workers': [len(files) - 1], 'recovered_workers': [recovered_workers]}) #the coordinator logs recovery as well
+    return stack_frames([to_long(recovery, ['restored_ms', 'rollback_s']), to_long(workers, ['total_workers', 'recovered_workers'])])
@@ -0,0 +1,27 @@
+import argparse
+import os
+
+from lib.blob_fetcher import get_container_client, fetch_experiment, FETCH_WORKERS
+
+#downloads the logs container of an experiment into its results folder and fills the data cache on the way
+#e.g. python fetch_results.py "../experiments/results/job-1-cp-0-10s-18k-(0)" --url "<logs container SAS url>"
+#against Azurite: python fetch_results.py <folder> --connection-string UseDevelopmentStorage=true --container logs
+#run it again after an interruption, it continues where it stopped
+
+def main():
+    parser = argparse.ArgumentParser(description="Fetches experiment logs from blob storage concurrently")
+    parser.add_argument('destination', help="experiment folder the blobs are written to, it should hold init_timestamp.log for the metric logs to be cached")
+    parser.add_argument('--url', default=None, help="SAS url of the container")
+    parser.add_argument('--connection-string', default=None, help="storage connection string, used with --container when no url is given")
+    parser.add_argument('--container', default='logs')
+    parser.add_argument('--workers', type=int, default=FETCH_WORKERS, help="concurrent downloads")
+    args = parser.parse_args()
+    if(args.url is None and args.connection_string is None):
+        parser.error("either --url or --connection-string is required")
+
+    client = get_container_client(args.url, args.connection_string, args.container, args.workers)
+    location, folder = os.path.split(os.path.normpath(args.destination))
+    fetch_experiment(client, location, folder, args.workers)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Contains the experiment archive, one zstd compressed file per experiment folder with random access to its members
+layout: MAGIC, every member as its own zstd frame, the zstd compressed json index {name: [offset, compressed size, size, mtime_ns]}
+and a trailer holding the offset and length of the index (little endian u64) followed by MAGIC.
+Readers map an archive once per process and only decompress the members they read.
+"""
+
+import json
+import mmap
+import os
+import struct
+
+import zstandard
+
+ARCHIVE_SUFFIX = '.bsa'
+MAGIC = b'BSPARC01'
+TRAILER = struct.Struct('<QQ8s')
+ZSTD_LEVEL = 10
+STREAM_BLOCK_BYTES = 4 * 1024 * 1024
+
+_archives = {} #path -> (signature, mmap, index)
+
+def get_archive_path(location: str, folder: str):
+    return os.path.join(location, folder + ARCHIVE_SUFFIX)
+
+"""True when the experiment is only available as an archive, an extracted folder always takes precedence
+"""
+def is_archived(location: str, folder: str):
+    return not os.path.isdir(os.path.join(location, folder)) and os.path.isfile(get_archive_path(location, folder))
+
+"""Returns (map, index) of the archive, opened once per process and reopened when the archive file changes
+"""
+def open_archive(path: str):
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    if(path not in _archives or _archives[path][0] != signature):
+        with open(path, 'rb') as file:
+            view = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        index_offset, index_length, magic = TRAILER.unpack_from(view, len(view) - TRAILER.size)
+        if(view[:len(MAGIC)] != MAGIC or magic != MAGIC):
+            raise ValueError(f"{path} is not an experiment archive")
+        index = json.loads(zstandard.ZstdDecompressor().decompress(view[index_offset:index_offset + index_length]))
+        _archives[path] = (signature, view, index)
+    return _archives[path][1], _archives[path][2]
+
+def get_index(location: str, folder: str):
+    return open_archive(get_archive_path(location, folder))[1]
+
+"""Returns {name: size} of the members directly inside subfolder ('' for the top level)
+"""
+def list_members(location: str, folder: str, subfolder: str = ''):
+    prefix = subfolder + '/' if subfolder else ''
+    return {name[len(prefix):]: entry[2] for name, entry in get_index(location, folder).items() if name.startswith(prefix) and '/' not in name[len(prefix):]}
+
+def has_member(location: str, folder: str, name: str):
+    return name in get_index(location, folder)
+
+"""Returns the [basename, mtime_ns, size] the member had when it was packed, the same signature the cache records for plain files
+"""
+def get_member_signature(location: str, folder: str, name: str):
+    entry = get_index(location, folder)[name]
+    return [name.rsplit('/', 1)[-1], entry[3], entry[2]]
+
+def read_member(location: str, folder: str, name: str):
+    view, index = open_archive(get_archive_path(location, folder))
+    offset, length, size, _ = index[name]
+    return zstandard.ZstdDecompressor().decompress(view[offset:offset + length], max_output_size=size)
+
+"""Yields the content of a member in blocks of roughly block_bytes without decompressing it at once
+"""
+def iter_member(location: str, folder: str, name: str, block_bytes: int = STREAM_BLOCK_BYTES):
+    view, index = open_archive(get_archive_path(location, folder))
+    offset, length, _, _ = index[name]
+    with zstandard.ZstdDecompressor().stream_reader(memoryview(view)[offset:offset + length]) as reader:
+        yield from iter(lambda: reader.read(block_bytes), b'')
+
+"""Packs every file below location/folder, except the data cache, into location/folder.bsa
+written to a temporary file first so readers never see a partial archive. Returns (file count, raw bytes, archive bytes).
+"""
+def pack_folder(location: str, folder: str, level: int = ZSTD_LEVEL):
+    root = os.path.join(location, folder)
+    names = []
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories[:] = sorted(d for d in subdirectories if not d.startswith('.'))
+        names += sorted(os.path.relpath(os.path.join(directory, f), root).replace(os.sep, '/') for f in files)
+    path = get_archive_path(location, folder)
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    compressor = zstandard.ZstdCompressor(level=level, write_checksum=True)
+    index = {}
+    raw_bytes = 0
+    with open(temp_path, 'wb') as archive:
+        archive.write(MAGIC)
+        for name in names:
+            source = os.path.join(root, *name.split('/'))
+            stat = os.stat(source)
+            with open(source, 'rb') as file:
+                content = file.read()
+            frame = compressor.compress(content)
+            index[name] = [archive.tell(), len(frame), len(content), stat.st_mtime_ns]
+            archive.write(frame)
+            raw_bytes += len(content)
+        index_frame = compressor.compress(json.dumps(index).encode())
+        index_offset = archive.tell()
+        archive.write(index_frame)
+        archive.write(TRAILER.pack(index_offset, len(index_frame), MAGIC))
+    os.replace(temp_path, path)
+    return len(names), raw_bytes, os.path.getsize(path)
+
+"""Checks every member of the archive against the file it was packed from
+"""
+def verify_archive(location: str, folder: str):
+    root = os.path.join(location, folder)
+    for name in get_index(location, folder):
+        with open(os.path.join(root, *name.split('/')), 'rb') as file:
+            if(read_member(location, folder, name) != file.read()):
+                return False
+    return True
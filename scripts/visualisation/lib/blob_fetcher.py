@@ -0,0 +1,114 @@
+"""Contains the parallel fetcher that downloads the logs of an experiment from a blob container
+The container is listed once and the blobs are downloaded concurrently over one pooled set of connections.
+Metric logs are parsed into their typed frames while they stream in and stored in the data cache,
+so the plots never parse them again. Other blobs (e.g. worker logs) are only written to disk.
+A fetch that was interrupted resumes: blobs already on disk with their full size are skipped and
+partial downloads, kept in .part files named after the blob version, continue where they stopped.
+Works against Azurite as well, e.g. with the connection string UseDevelopmentStorage=true.
+"""
+
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import requests
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceModifiedError
+from azure.core.pipeline.transport import RequestsTransport
+from azure.storage.blob import ContainerClient
+
+from lib import data_cache
+from lib.data_retriever import iter_metric_chunks
+from lib.data_parser import stack_frames
+
+FETCH_WORKERS = 16
+BLOCK_BYTES = 8 * 1024 * 1024 #metric logs are parsed in blocks of this size while they download
+
+"""Returns a client for the container, from its (SAS) url or from a connection string and container name
+all downloads share one session holding up to workers connections.
+"""
+def get_container_client(url: str = None, connectionString: str = None, container: str = None, workers: int = FETCH_WORKERS):
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    transport = RequestsTransport(session=session, session_owner=False)
+    if(url is not None):
+        return ContainerClient.from_container_url(url, transport=transport)
+    return ContainerClient.from_connection_string(connectionString, container, transport=transport)
+
+def get_part_path(path: str, etag: str):
+    return f"{path}.{re.sub(r'[^0-9A-Za-z]', '', etag)}.part"
+
+"""Writes every chunk to file as it passes through
+"""
+def tee_to_file(chunks, file):
+    for chunk in chunks:
+        file.write(chunk)
+        yield chunk
+
+"""Prepends the bytes an interrupted fetch already wrote to the chunks that are still to come
+"""
+def prepend_chunk(first: bytes, chunks):
+    if(len(first) > 0):
+        yield first
+    yield from chunks
+
+"""Downloads one blob to location/folder/<blob name>, resuming from its .part file, and caches metric logs.
+Returns the number of bytes that were transferred.
+"""
+def fetch_blob(client: ContainerClient, blob, location: str, folder: str):
+    path = os.path.join(location, folder, *blob.name.split('/'))
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    part_path = get_part_path(path, blob.etag)
+    for name in os.listdir(directory):
+        if(name.startswith(os.path.basename(path) + '.') and name.endswith('.part') and os.path.join(directory, name) != part_path):
+            os.remove(os.path.join(directory, name)) #left by an older version of the blob
+
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    parts = blob.name.split('/')
+    kind = data_cache.get_metric_kind(parts[0], parts[1]) if len(parts) == 2 else None
+    chunks = iter([])
+    if(offset < blob.size):
+        try:
+            chunks = client.download_blob(blob.name, offset=offset, etag=blob.etag, match_condition=MatchConditions.IfNotModified).chunks()
+        except ResourceModifiedError:
+            print(f"{blob.name} changed since the container was listed, fetch again to download it")
+            return 0
+
+    with open(part_path, 'ab') as file:
+        if(kind is None):
+            for chunk in chunks:
+                file.write(chunk)
+        else:
+            with open(part_path, 'rb') as existing:
+                written = existing.read(offset)
+            frames = list(iter_metric_chunks(prepend_chunk(written, tee_to_file(chunks, file)), kind[0], BLOCK_BYTES))
+    os.replace(part_path, path)
+    if(kind is not None):
+        content = stack_frames(frames) if len(frames) > 0 else pd.DataFrame({name: pd.Series(dtype=dtype) for name, dtype in kind[0].items()})
+        data_cache.store_metric_content(location, folder, parts[0], parts[1], content)
+    return blob.size - offset
+
+"""Downloads every blob of the container into location/folder, skipping blobs that are already complete.
+"""
+def fetch_experiment(client: ContainerClient, location: str, folder: str, workers: int = FETCH_WORKERS):
+    started = time.monotonic()
+    blobs = list(client.list_blobs())
+    missing = [blob for blob in blobs if not is_complete(blob, location, folder)]
+    print(f"Fetching {len(missing)} of {len(blobs)} blobs into {os.path.join(location, folder)}")
+    if(len(missing) > 0):
+        with ThreadPoolExecutor(max_workers=min(workers, len(missing))) as executor:
+            transferred = sum(executor.map(lambda blob: fetch_blob(client, blob, location, folder), missing))
+    else:
+        transferred = 0
+    seconds = time.monotonic() - started
+    print(f"Fetched {transferred / 1024 / 1024:.1f} MiB in {seconds:.1f}s ({transferred / 1024 / 1024 / max(seconds, 0.001):.1f} MiB/s)")
+    return len(missing)
+
+def is_complete(blob, location: str, folder: str):
+    path = os.path.join(location, folder, *blob.name.split('/'))
+    return os.path.exists(path) and os.path.getsize(path) == blob.size
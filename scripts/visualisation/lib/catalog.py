@@ -0,0 +1,147 @@
+"""Contains the experiment catalog, an index of all experiments under a results root
+Experiment keys (job-X-cp-Y-Ns-Kk-(R)) are parsed once into typed fields and the available
+log files are indexed with their sizes. Parsed data is loaded lazily and shared within the process.
+"""
+
+import os
+import re
+
+from lib.data_retriever import get_experiments_at_location, get_experiment_files
+from lib.data_cache import load_throughput_data, load_latency_data, load_failure_data, load_checkpoint_data, load_recovery_data, load_lost_messages_data
+
+#the throughput part is shards * throughput / 1000 (see execute-experiment.ps1), e.g. 5.4k for 3 shards at 1800 e/s
+KEY_PATTERN = re.compile(r'^job-(\d+)-cp-(\d+)-(\d+)s-(\d+(?:\.\d+)?)k-\((\d+)\)$')
+PROTOCOL_NAMES = {0: 'UC', 1: 'CC', 2: 'CIC'}
+LOG_FOLDERS = ['performance', 'checkpoint', 'recovery', 'lost-messages']
+FIELDS = ['query', 'job', 'protocol', 'interval', 'throughput_k', 'repetition']
+
+_catalogs = {}
+
+"""Parses an experiment key into a dict of typed fields, returns None for folders that are not experiments
+"""
+def parse_experiment_key(key: str):
+    match = KEY_PATTERN.match(key)
+    if(match is None):
+        return None
+    job, protocol, interval, throughput_k, repetition = match.groups()
+    return {'job': int(job), 'protocol': int(protocol), 'interval': int(interval), 'throughput_k': float(throughput_k), 'repetition': int(repetition)}
+
+
+class Experiment:
+    """One experiment folder (or archive), its parsed key and its log files"""
+
+    def __init__(self, location: str, key: str, query: str, fields: dict):
+        self.location = location
+        self.key = key
+        self.query = query
+        self.job = fields['job']
+        self.protocol = fields['protocol']
+        self.interval = fields['interval']
+        self.throughput_k = fields['throughput_k']
+        self.repetition = fields['repetition']
+        self.files = {}
+        for folder in LOG_FOLDERS:
+            files = get_experiment_files(location, key, folder)
+            self.files[folder] = {name: files[name] for name in sorted(files)}
+
+    @property
+    def protocol_name(self):
+        return PROTOCOL_NAMES.get(self.protocol, str(self.protocol))
+
+    def get(self, field: str):
+        return getattr(self, field)
+
+    def files_of(self, folder: str, prefix: str = None):
+        return [name for name in self.files[folder] if prefix is None or name.split("-", 1)[0] == prefix]
+
+    def total_size(self):
+        return sum(size for files in self.files.values() for size in files.values())
+
+    def throughput(self):
+        return [load_throughput_data(self.location, self.key, name) for name in self.files_of('performance', 'throughput')]
+
+    def latency(self):
+        return [load_latency_data(self.location, self.key, name) for name in self.files_of('performance', 'latency')]
+
+    def failures(self):
+        return load_failure_data(self.location, self.key)
+
+    def checkpoints(self):
+        return [load_checkpoint_data(self.location, self.key, name) for name in self.files_of('checkpoint')]
+
+    def recoveries(self):
+        return [load_recovery_data(self.location, self.key, name) for name in self.files_of('recovery')]
+
+    def lost_messages(self):
+        return [load_lost_messages_data(self.location, self.key, name) for name in self.files_of('lost-messages')]
+
+    def __repr__(self):
+        return f"Experiment({self.query}/{self.key})" if self.query else f"Experiment({self.key})"
+
+
+class Catalog:
+    """Scans root once, experiments may sit directly under root or one level deeper in query folders"""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.experiments = []
+        for entry in get_experiments_at_location(root):
+            fields = parse_experiment_key(entry)
+            if(fields is not None):
+                self.experiments.append(Experiment(root, entry, None, fields))
+                continue
+            query_path = os.path.join(root, entry)
+            for key in get_experiments_at_location(query_path):
+                fields = parse_experiment_key(key)
+                if(fields is None):
+                    print(f"Skipping {os.path.join(query_path, key)}, its name is not an experiment key (job-X-cp-Y-Ns-Kk-(R))")
+                    continue
+                self.experiments.append(Experiment(query_path, key, entry, fields))
+
+    """Returns the experiments matching every criterion, a criterion is a value or a collection of values
+    e.g. catalog.filter(protocol=2, interval=10, repetition=range(1, 4))
+    """
+    def filter(self, **criteria):
+        for field in criteria:
+            if(field not in FIELDS):
+                raise ValueError(f"unknown experiment field '{field}', expected one of {FIELDS}")
+        def matches(experiment, field, expected):
+            value = experiment.get(field)
+            if(isinstance(expected, (list, tuple, set, range, frozenset))):
+                return value in expected
+            return value == expected
+        return [e for e in self.experiments if all(matches(e, field, expected) for field, expected in criteria.items())]
+
+    """Groups (filtered) experiments by the given fields, returns a sorted list of (field values, experiments)
+    """
+    def group(self, *fields, experiments: list = None):
+        groups = {}
+        for experiment in self.experiments if experiments is None else experiments:
+            groups.setdefault(tuple(experiment.get(f) for f in fields), []).append(experiment)
+        return sorted(groups.items(), key=lambda item: tuple('' if v is None else v for v in item[0]))
+
+    def __len__(self):
+        return len(self.experiments)
+
+"""Returns the catalog of root, scanned once per process
+"""
+def get_catalog(root: str):
+    if(root not in _catalogs):
+        _catalogs[root] = Catalog(root)
+    return _catalogs[root]
+
+"""Forgets the catalogs scanned in this process
+"""
+def clear_catalogs():
+    _catalogs.clear()
+
+"""Lists (query, query_folder_path, protocol, interval, keys) for each query/protocol/interval group under root
+plain tuples so groups can be handed to worker processes
+"""
+def get_experiment_groups(root: str, **criteria):
+    catalog = get_catalog(root)
+    groups = []
+    for (query, protocol, interval), experiments in catalog.group('query', 'protocol', 'interval', experiments=catalog.filter(**criteria)):
+        query_name = query if query is not None else os.path.basename(os.path.normpath(root))
+        groups.append((query_name, experiments[0].location, str(protocol), str(interval), [e.key for e in experiments]))
+    return groups
@@ -0,0 +1,86 @@
+"""Contains the checkpoint-cost attribution which measures what every checkpoint costs the pipeline
+Checkpoints are logged when they complete, so a checkpoint covers [timestamp - taken_ms, timestamp].
+Series are turned into running sums per run and every checkpoint window is resolved with as-of joins on them,
+the mean of a series over a window is then two lookups. All checkpoints of all instances and runs are handled at once.
+"""
+
+import numpy as np
+import pandas as pd
+
+from lib.profiling import instrument, argument_rows
+
+"""Sums the values of a series per bucket of bucketUs microseconds, returns a frame with columns timestamp (bucket start), sum, count
+latency logs have several rows per millisecond, this keeps what is passed between processes small
+"""
+@instrument('aggregate', rows=argument_rows(0))
+def bucket_series(frame: pd.DataFrame, column: str, bucketUs: int = 1000):
+    values = frame[column].astype(np.float64) #running sums over float32 columns would lose precision
+    present = values.notna()
+    buckets = (frame['timestamp'][present].to_numpy(dtype=np.int64) // bucketUs) * bucketUs
+    grouped = values[present].groupby(buckets, sort=True)
+    sums = grouped.sum()
+    return pd.DataFrame({'timestamp': sums.index.to_numpy(), 'sum': sums.to_numpy(), 'count': grouped.count().to_numpy(dtype=np.int32)})
+
+"""Turns the bucketed series of all runs (run, timestamp, sum, count) into running totals per run, sorted by timestamp
+"""
+def get_running_sums(buckets: pd.DataFrame):
+    frame = buckets.astype({'timestamp': np.float64}).sort_values('timestamp', kind='stable').reset_index(drop=True)
+    grouped = frame.groupby('run', sort=False)
+    return pd.DataFrame({'run': frame['run'], 'timestamp': frame['timestamp'], 'sum': grouped['sum'].cumsum(), 'count': grouped['count'].cumsum()})
+
+"""Returns the (sum, count) of the samples of the same run before the time in column, for every row of points
+"""
+def get_sums_before(points: pd.DataFrame, sums: pd.DataFrame, column: str):
+    left = pd.DataFrame({'run': points['run'], 'timestamp': points[column].astype(np.float64), 'row': np.arange(len(points))}).sort_values('timestamp', kind='stable')
+    joined = pd.merge_asof(left, sums, on='timestamp', by='run', direction='backward', allow_exact_matches=False).sort_values('row')
+    return joined['sum'].fillna(0).to_numpy(), joined['count'].fillna(0).to_numpy()
+
+"""Returns the mean of the series over [startColumn, endColumn) for every row of points, NaN for windows without samples
+"""
+def get_window_means(points: pd.DataFrame, sums: pd.DataFrame, startColumn: str, endColumn: str):
+    start_sum, start_count = get_sums_before(points, sums, startColumn)
+    end_sum, end_count = get_sums_before(points, sums, endColumn)
+    count = end_count - start_count
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return pd.Series(np.where(count > 0, (end_sum - start_sum) / count, np.nan), index=points.index)
+
+"""Returns for every row of points whether [baseline_start, end) intersects an outage [start, end) of the same run
+"""
+def get_near_failure(points: pd.DataFrame, outages: pd.DataFrame):
+    pairs = pd.DataFrame({'run': points['run'], 'row': np.arange(len(points)), 'window_start': points['baseline_start'], 'window_end': points['end']}) \
+        .merge(outages.rename(columns={'start': 'outage_start', 'end': 'outage_end'}), on='run')
+    overlapping = pairs['row'][(pairs['window_start'] < pairs['outage_end']) & (pairs['window_end'] > pairs['outage_start'])]
+    near = np.zeros(len(points), dtype=bool)
+    near[overlapping.to_numpy()] = True
+    return pd.Series(near, index=points.index)
+
+"""Attributes a throughput deficit and a latency inflation to every checkpoint
+checkpoints = frame with columns run, instance, timestamp (ms, completion), forced, taken_ms
+throughput  = bucketed throughput (run, timestamp, sum, count), see bucket_series
+latency     = bucketed latency (run, timestamp, sum, count)
+baselineMs  = length of the window before the checkpoint started the series are compared to
+settleMs    = time after the checkpoint completed that still counts towards its cost
+outages     = frame with columns run, start, end (ms) of the failures and their recovery, None when there are none
+returns the checkpoints with near_failure (the windows overlap an outage, the series there say nothing about the checkpoint), duration_ms, throughput_deficit (e/s below the baseline during the checkpoint), relative_deficit,
+lost_events (deficit times the window length) and latency_inflation (ms above the baseline). Checkpoints that overlap,
+e.g. of instances taking a coordinated checkpoint, share their windows so their costs are not additive.
+"""
+@instrument('aggregate')
+def attribute_checkpoint_cost(checkpoints: pd.DataFrame, throughput: pd.DataFrame, latency: pd.DataFrame, baselineMs: float = 5000, settleMs: float = 1000, outages: pd.DataFrame = None):
+    frame = checkpoints.reset_index(drop=True).copy()
+    frame['duration_ms'] = frame['taken_ms']
+    frame['start'] = frame['timestamp'] - frame['taken_ms']
+    frame['end'] = frame['timestamp'] + settleMs
+    frame['baseline_start'] = frame['start'] - baselineMs
+    frame['near_failure'] = get_near_failure(frame, outages) if outages is not None else False
+
+    throughput_sums = get_running_sums(throughput)
+    baseline = get_window_means(frame, throughput_sums, 'baseline_start', 'start')
+    during = get_window_means(frame, throughput_sums, 'start', 'end')
+    frame['throughput_deficit'] = baseline - during
+    frame['relative_deficit'] = frame['throughput_deficit'] / baseline.where(baseline > 0)
+    frame['lost_events'] = frame['throughput_deficit'] * (frame['end'] - frame['start']) / 1000
+
+    latency_sums = get_running_sums(latency)
+    frame['latency_inflation'] = get_window_means(frame, latency_sums, 'start', 'end') - get_window_means(frame, latency_sums, 'baseline_start', 'start')
+    return frame.drop(columns=['start', 'end', 'baseline_start'])
@@ -0,0 +1,190 @@
+"""Contains an on-disk cache of parsed & normalized experiment data
+Each parsed frame is stored as an npz file in a .cache folder inside the experiment folder,
+for an experiment packed into an archive in .cache/<experiment> next to the archive.
+Entries are invalidated when the mtime or size of any of their source files changes.
+"""
+
+import json
+import os
+import numpy as np
+import pandas as pd
+
+from lib import archive
+from lib.data_retriever import get_throughput_file_content, get_latency_file_content, get_failure_file_content, get_checkpoint_file_content, get_recovery_file_content, get_lost_messages_file_content, get_init_ts, \
+    get_file_signatures, THROUGHPUT_COLUMNS, LATENCY_COLUMNS, CHECKPOINT_COLUMNS, RECOVERY_COLUMNS, LOST_MESSAGES_COLUMNS
+from lib.data_parser import parse_throughput_data, parse_latency_data, parse_failures_data, parse_checkpoint_data, parse_recovery_data, parse_lost_messages_data, parse_time_to_timestamp, normalize_timestamp_column
+from lib.profiling import instrument, argument_rows
+
+CACHE_FOLDER = '.cache'
+CACHE_VERSION = 2
+#with copy-on-write (always on from pandas 3) a shallow copy already keeps callers from changing the shared frame
+COPY_ON_WRITE = int(pd.__version__.split('.')[0]) >= 3
+
+#set to False to always parse from the raw log files
+enabled = True
+
+_init_ts = {}
+_frames = {} #frames already loaded in this process, shared by every action
+
+"""Returns the folder holding the cache entries of an experiment
+"""
+def get_cache_folder(location: str, folder: str):
+    if(archive.is_archived(location, folder)):
+        return os.path.join(location, CACHE_FOLDER, folder)
+    return os.path.join(location, folder, CACHE_FOLDER)
+
+"""Returns the (mtime, size) signature of each source file, names relative to the experiment
+an archived file keeps the signature it had on disk, so packing an experiment does not invalidate its entries
+"""
+def get_source_signature(location: str, folder: str, sources: list):
+    return get_file_signatures(location, folder, sources)
+
+"""Reads a cached frame, returns None when the entry is missing, stale or unreadable
+"""
+@instrument('cache')
+def read_cache_entry(path: str, signature: list):
+    if(not os.path.exists(path)):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as entry:
+            meta = json.loads(str(entry['__meta__']))
+            if(meta['version'] != CACHE_VERSION or meta['sources'] != signature):
+                return None
+            categorical = meta.get('categorical', [])
+            return pd.DataFrame({column: pd.Categorical.from_codes(entry[column], categories=entry[f'__categories__{column}']) if column in categorical else entry[column]
+                                 for column in meta['columns']})
+    except (OSError, ValueError, KeyError):
+        return None
+
+"""Writes a frame to the cache, written to a temporary file first so readers never see partial entries
+"""
+@instrument('cache', rows=argument_rows(2))
+def write_cache_entry(path: str, signature: list, frame: pd.DataFrame):
+    arrays = {}
+    categorical = []
+    for column in frame.columns:
+        if(isinstance(frame[column].dtype, pd.CategoricalDtype)):
+            categories = frame[column].cat.categories.to_numpy()
+            arrays[column] = frame[column].cat.codes.to_numpy()
+            arrays[f'__categories__{column}'] = categories.astype(str) if categories.dtype == object else categories
+            categorical.append(column)
+            continue
+        values = frame[column].to_numpy()
+        arrays[column] = values.astype(str) if values.dtype == object else values
+    arrays['__meta__'] = np.array(json.dumps({'version': CACHE_VERSION, 'sources': signature, 'columns': list(frame.columns), 'categorical': categorical}))
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as file:
+            np.savez(file, **arrays)
+        os.replace(temp_path, path)
+    except OSError as ex:
+        print(f"Could not write cache entry {path}: {ex}")
+
+"""Returns the cached frame for the given sources, building (and storing) it when needed
+frames are also kept in memory so each file is parsed or read from the cache once per process
+"""
+@instrument('cache', 1)
+def cached_frame(location: str, folder: str, name: str, sources: list, build):
+    path = os.path.join(get_cache_folder(location, folder), f'{name}.npz')
+    signature = get_source_signature(location, folder, sources)
+    key = (path, json.dumps(signature))
+    if(key not in _frames):
+        frame = read_cache_entry(path, signature) if enabled else None
+        if(frame is None):
+            frame = build()
+            if(enabled):
+                write_cache_entry(path, signature, frame)
+        _frames[key] = frame
+    return _frames[key].copy(deep=not COPY_ON_WRITE) #callers are free to modify their frame
+
+"""Forgets the frames and initial timestamps loaded in this process, the files are read again on the next load
+"""
+def clear_loaded():
+    _frames.clear()
+    _init_ts.clear()
+
+"""Returns the parsed initial timestamp of an experiment, read from disk once per process
+"""
+def load_init_ts(location: str, folder: str):
+    key = (os.path.join(location, folder), tuple(get_source_signature(location, folder, ['init_timestamp.log'])[0]))
+    if(key not in _init_ts):
+        _init_ts[key] = parse_time_to_timestamp(get_init_ts(location, folder))
+    return _init_ts[key]
+
+"""Turn the typed content of a log file into the frame that is cached, timestamps relative to initTs
+"""
+def build_throughput_frame(content: pd.DataFrame, initTs: int):
+    return normalize_timestamp_column(parse_throughput_data(content), initTs)
+
+def build_latency_frame(content: pd.DataFrame, initTs: int):
+    return normalize_timestamp_column(parse_latency_data(content.drop_duplicates()), initTs).reset_index(drop=True)
+
+def build_checkpoint_frame(content: pd.DataFrame, initTs: int):
+    return normalize_timestamp_column(parse_checkpoint_data(content), initTs)
+
+def build_recovery_frame(content: pd.DataFrame, initTs: int):
+    return normalize_timestamp_column(parse_recovery_data(content), initTs)
+
+def build_lost_messages_frame(content: pd.DataFrame, initTs: int):
+    return normalize_timestamp_column(parse_lost_messages_data(content), initTs)
+
+"""Returns (columns, build function) for a log file at folder/filename inside an experiment, None for files that are not metric logs
+"""
+def get_metric_kind(folder: str, filename: str):
+    if(folder == 'performance' and filename.startswith('throughput')):
+        return THROUGHPUT_COLUMNS, build_throughput_frame
+    if(folder == 'performance' and filename.startswith('latency')):
+        return LATENCY_COLUMNS, build_latency_frame
+    if(folder == 'checkpoint'):
+        return CHECKPOINT_COLUMNS, build_checkpoint_frame
+    if(folder == 'recovery'):
+        return RECOVERY_COLUMNS, build_recovery_frame
+    if(folder == 'lost-messages'):
+        return LOST_MESSAGES_COLUMNS, build_lost_messages_frame
+    return None
+
+"""Caches the typed content of a log file that was just written, e.g. parsed while it was downloaded,
+so the file is never parsed again. Needs the init timestamp of the experiment, returns False when it is missing.
+"""
+def store_metric_content(location: str, folder: str, logFolder: str, filename: str, content: pd.DataFrame):
+    kind = get_metric_kind(logFolder, filename)
+    if(not enabled or kind is None or not os.path.exists(f'{location}/{folder}/init_timestamp.log')):
+        return False
+    path = os.path.join(get_cache_folder(location, folder), f'{logFolder}-{filename}.npz')
+    signature = get_source_signature(location, folder, [f'{logFolder}/{filename}', 'init_timestamp.log'])
+    frame = kind[1](content, load_init_ts(location, folder))
+    write_cache_entry(path, signature, frame)
+    _frames[(path, json.dumps(signature))] = frame
+    return True
+
+def load_throughput_data(location: str, folder: str, filename: str):
+    def build():
+        return build_throughput_frame(get_throughput_file_content(location, folder, filename), load_init_ts(location, folder))
+    return cached_frame(location, folder, f'performance-{filename}', [f'performance/{filename}', 'init_timestamp.log'], build)
+
+def load_latency_data(location: str, folder: str, filename: str):
+    def build():
+        return build_latency_frame(get_latency_file_content(location, folder, filename), load_init_ts(location, folder))
+    return cached_frame(location, folder, f'performance-{filename}', [f'performance/{filename}', 'init_timestamp.log'], build)
+
+def load_failure_data(location: str, folder: str):
+    def build():
+        data = parse_failures_data(get_failure_file_content(location, folder))
+        return normalize_timestamp_column(data, load_init_ts(location, folder))
+    return cached_frame(location, folder, 'failures', ['failures.log', 'init_timestamp.log'], build)
+
+def load_checkpoint_data(location: str, folder: str, filename: str):
+    def build():
+        return build_checkpoint_frame(get_checkpoint_file_content(location, folder, filename), load_init_ts(location, folder))
+    return cached_frame(location, folder, f'checkpoint-{filename}', [f'checkpoint/{filename}', 'init_timestamp.log'], build)
+
+def load_recovery_data(location: str, folder: str, filename: str):
+    def build():
+        return build_recovery_frame(get_recovery_file_content(location, folder, filename), load_init_ts(location, folder))
+    return cached_frame(location, folder, f'recovery-{filename}', [f'recovery/{filename}', 'init_timestamp.log'], build)
+
+def load_lost_messages_data(location: str, folder: str, filename: str):
+    def build():
+        return build_lost_messages_frame(get_lost_messages_file_content(location, folder, filename), load_init_ts(location, folder))
+    return cached_frame(location, folder, f'lost-messages-{filename}', [f'lost-messages/{filename}', 'init_timestamp.log'], build)
@@ -1,132 +1,142 @@
 
-from datetime import datetime
+import numpy as np
 import pandas as pd
+from pandas.api.types import union_categoricals
 
-def lowpass(data: pd.Series, alpha: float):
-    data2 = []
-    for i, val in enumerate(data):
-        if (i != 0 and i != len(data) - 1):
-            try:
-                data2.append(alpha * data[i - 1] + (1 - 2 * alpha) * val + alpha * data[i + 1])
-            except:
-                data2.append(val)
-    return pd.Series(data2)
-
-def savitzky_golay(y, window_size, order, deriv=0, rate=1):
-    r"""Smooth (and optionally differentiate) data with a Savitzky-Golay filter.
-    The Savitzky-Golay filter removes high frequency noise from data.
-    It has the advantage of preserving the original shape and
-    features of the signal better than other types of filtering
-    approaches, such as moving averages techniques.
-    Parameters
-    ----------
-    y : array_like, shape (N,)
-        the values of the time history of the signal.
-    window_size : int
-        the length of the window. Must be an odd integer number.
-    order : int
-        the order of the polynomial used in the filtering.
-        Must be less then `window_size` - 1.
-    deriv: int
-        the order of the derivative to compute (default = 0 means only smoothing)
-    Returns
-    -------
-    ys : ndarray, shape (N)
-        the smoothed signal (or it's n-th derivative).
-    Notes
-    -----
-    The Savitzky-Golay is a type of low-pass filter, particularly
-    suited for smoothing noisy data. The main idea behind this
-    approach is to make for each point a least-square fit with a
-    polynomial of high order over a odd-sized window centered at
-    the point.
-    Examples
-    --------
-    t = np.linspace(-4, 4, 500)
-    y = np.exp( -t**2 ) + np.random.normal(0, 0.05, t.shape)
-    ysg = savitzky_golay(y, window_size=31, order=4)
-    import matplotlib.pyplot as plt
-    plt.plot(t, y, label='Noisy signal')
-    plt.plot(t, np.exp(-t**2), 'k', lw=1.5, label='Original signal')
-    plt.plot(t, ysg, 'r', label='Filtered signal')
-    plt.legend()
-    plt.show()
-    References
-    ----------
-    .. [1] A. Savitzky, M. J. E. Golay, Smoothing and Differentiation of
-       Data by Simplified Least Squares Procedures. Analytical
-       Chemistry, 1964, 36 (8), pp 1627-1639.
-    .. [2] Numerical Recipes 3rd Edition: The Art of Scientific Computing
-       W.H. Press, S.A. Teukolsky, W.T. Vetterling, B.P. Flannery
-       Cambridge University Press ISBN-13: 9780521880688
+from lib.smoothing import lowpass, savitzky_golay #kept importable from here for older scripts
+from lib.profiling import instrument, argument_rows
+
+TIME_FORMAT_LENGTH = len('hh:mm:ss:ffffff')
+CLOCK_PERIOD_US = 12 * 3600 * 1000000 #MetricLogger writes 'hh' (12-hour clock, no AM/PM marker)
+#normalized timestamps are integer microsecond offsets from the init timestamp
+US_PER_MS = 1000
+US_PER_SECOND = 1000000
+INT32_MIN, INT32_MAX = np.iinfo(np.int32).min, np.iinfo(np.int32).max
+
+@instrument('parse')
+def parse_time_column(column):
+    """Parses a column of 'hh:mm:ss:ffffff' strings in one pass.
+    Returns an int64 array with the microseconds elapsed on the 12-hour clock,
+    hour 12 is mapped to 0 so that 12:59 -> 01:00 is a regular increment.
     """
-    import numpy as np
-    from math import factorial
-    
-    y[-1] = 0
-    try:
-        window_size = np.abs(np.int(window_size))
-        order = np.abs(np.int(order))
-    except ValueError as msg:
-        raise ValueError("window_size and order have to be of type int")
-    if window_size % 2 != 1 or window_size < 1:
-        raise TypeError("window_size size must be a positive odd number")
-    if window_size < order + 2:
-        raise TypeError("window_size is too small for the polynomials order")
-    order_range = range(order+1)
-    half_window = (window_size -1) // 2
-    # precompute coefficients
-    b = np.mat([[k**i for i in order_range] for k in range(-half_window, half_window+1)])
-    m = np.linalg.pinv(b).A[deriv] * rate**deriv * factorial(deriv)
-    # pad the signal at the extremes with
-    # values taken from the signal itself
-    firstvals = y[0] - np.abs( y[1:half_window+1][::-1] - y[0] )
-    lastvals = y[-1] + np.abs(y[-half_window-1:-1][::-1] - y[-1])
-    y = np.concatenate((firstvals, y, lastvals))
-    res = np.convolve( m[::-1], y, mode='valid')
-    return np.delete(res, -1)
+    raw = np.asarray(column, dtype=f'S{TIME_FORMAT_LENGTH + 1}').view(np.uint8).reshape(-1, TIME_FORMAT_LENGTH + 1)
+    if(np.any(raw[:, TIME_FORMAT_LENGTH] != 0) or np.any(raw[:, TIME_FORMAT_LENGTH - 1] == 0)):
+        #padded or truncated entries, strip whitespace and retry once
+        raw = np.asarray(pd.Series(column).astype(str).str.strip(), dtype=f'S{TIME_FORMAT_LENGTH + 1}').view(np.uint8).reshape(-1, TIME_FORMAT_LENGTH + 1)
+        if(np.any(raw[:, TIME_FORMAT_LENGTH] != 0) or np.any(raw[:, TIME_FORMAT_LENGTH - 1] == 0)):
+            raise ValueError("time data does not match format 'hh:mm:ss:ffffff'")
+    digits = raw[:, :TIME_FORMAT_LENGTH].astype(np.int64) - ord('0')
+    numbers = np.delete(digits, [2, 5, 8], axis=1)
+    if(np.any(digits[:, [2, 5, 8]] != ord(':') - ord('0')) or np.any((numbers < 0) | (numbers > 9))):
+        raise ValueError("time data does not match format 'hh:mm:ss:ffffff'")
+    hours = (digits[:, 0] * 10 + digits[:, 1]) % 12
+    minutes = digits[:, 3] * 10 + digits[:, 4]
+    seconds = digits[:, 6] * 10 + digits[:, 7]
+    micros = digits[:, 9:15] @ np.array([100000, 10000, 1000, 100, 10, 1], dtype=np.int64)
+    return ((hours * 60 + minutes) * 60 + seconds) * 1000000 + micros
 
+@instrument('parse')
 def parse_time_to_timestamp(timestr: str):
-    dt_obj = datetime.strptime(f'01.01.2000 {timestr}', '%d.%m.%Y %H:%M:%S:%f')
-    millisec = dt_obj.timestamp() * 1000
-    return millisec
+    return int(parse_time_column([timestr])[0])
+
+def offset_timestamps(timestamps, initialTs: int):
+    """Converts 12-hour clock microseconds to int64 microsecond offsets relative to initialTs.
+    Offsets are folded into [-6h, 6h) which corrects both the 'hh' wrap and the midnight rollover.
+    """
+    half_period = CLOCK_PERIOD_US // 2
+    return (np.asarray(timestamps, dtype=np.int64) - initialTs + half_period) % CLOCK_PERIOD_US - half_period
 
-def normalize_timestamp_column(datapoints: pd.DataFrame, initialTs: float):
-    datapoints['timestamp'] = datapoints['timestamp'].transform(lambda dp: dp - initialTs)
+def compact_offsets(offsets):
+    """Narrows int64 microsecond offsets to int32 when they all fit (about 35 minutes either side of the init timestamp),
+    longer experiments keep int64 offsets.
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    if(len(offsets) == 0 or (offsets.min() >= INT32_MIN and offsets.max() <= INT32_MAX)):
+        return offsets.astype(np.int32)
+    return offsets
+
+@instrument('normalize')
+def normalize_timestamp_column(datapoints: pd.DataFrame, initialTs: int):
+    """Replaces the parsed clock times by integer microsecond offsets relative to initialTs (see US_PER_MS and US_PER_SECOND)
+    """
+    datapoints['timestamp'] = compact_offsets(offset_timestamps(datapoints['timestamp'], initialTs))
     return datapoints
 
+@instrument('stack')
+def stack_frames(frames: list, columns: list = None, keys: dict = None):
+    """Stacks frames holding the same columns into one frame, like pd.concat(frames, ignore_index=True), built once
+    from arrays sized for all rows. Categorical columns stay categorical over the union of their categories.
+    columns names the columns of the (empty) result when there are no frames.
+    keys = {column: one label per frame} adds a categorical column with the label of the frame each row came from.
+    """
+    keys = keys or {}
+    if(len(frames) == 0):
+        return pd.DataFrame({name: pd.Series(dtype=object) for name in list(columns or []) + list(keys)})
+    sizes = np.array([len(frame) for frame in frames], dtype=np.int64)
+    ends = np.cumsum(sizes)
+    filled = [frame for frame in frames if len(frame) > 0] or frames[:1]
+    output = {}
+    for name in frames[0].columns:
+        if(any(isinstance(frame[name].dtype, pd.CategoricalDtype) for frame in filled)):
+            output[name] = union_categoricals([frame[name].astype('category') for frame in filled], ignore_order=True)
+            continue
+        dtypes = [frame[name].dtype for frame in filled]
+        if(not all(isinstance(dtype, np.dtype) for dtype in dtypes)):
+            output[name] = pd.concat([frame[name] for frame in frames], ignore_index=True)
+            continue
+        values = np.empty(int(ends[-1]), dtype=np.result_type(*dtypes))
+        for frame, end, size in zip(frames, ends, sizes):
+            values[end - size:end] = frame[name].to_numpy()
+        output[name] = values
+    for name, labels in keys.items():
+        codes, uniques = pd.factorize(pd.Index(labels))
+        output[name] = pd.Categorical.from_codes(np.repeat(codes, sizes), categories=uniques)
+    return pd.DataFrame(output)
+
 
 def parse_throughput_data(datapoints: pd.DataFrame):
-    datapoints = datapoints.transform([parse_time_to_timestamp, int])
-    datapoints.columns = ['timestamp', 'throughput']
+    datapoints['timestamp'] = parse_time_column(datapoints['timestamp'])
     return datapoints
 
 def parse_latency_data(datapoints: pd.DataFrame):
-    #print(datapoints)
-    #datapoints = datapoints.transform([parse_time_to_timestamp, str, int])
-    #print(datapoints)
-
-    datapoints['timestamp'] = datapoints['timestamp'].transform(parse_time_to_timestamp)
-    datapoints['latency'] = datapoints['latency'].apply(lambda x: float(str(x).strip()))
-    datapoints['shard'] = datapoints['shard'].transform(int)
-
-    datapoints.columns = ['timestamp', 'latency', 'shard']
+    datapoints['timestamp'] = parse_time_column(datapoints['timestamp'])
+    datapoints['shard'] = datapoints['shard'].astype('category')
     return datapoints
 
 def parse_failures_data(datapoints: pd.DataFrame):
-    datapoints = datapoints.transform([parse_time_to_timestamp])
-    datapoints.columns = ['timestamp']
+    datapoints['timestamp'] = parse_time_column(datapoints['timestamp'])
     return datapoints
 
 def parse_checkpoint_data(datapoints: pd.DataFrame):
-    datapoints['timestamp'] = datapoints['timestamp'].transform(parse_time_to_timestamp)
-    datapoints['forced'] = datapoints['forced'].transform(lambda e: str(e) == "True")
-    datapoints['taken_ms'] = datapoints['taken_ms'].transform(float)
-    datapoints['bytes'] = datapoints['bytes'].transform(int)
+    datapoints['timestamp'] = parse_time_column(datapoints['timestamp'])
     return datapoints
 
 def parse_recovery_data(datapoints: pd.DataFrame):
-    datapoints['timestamp'] = datapoints['timestamp'].transform(parse_time_to_timestamp)
-    datapoints['restored_ms'] = datapoints['restored_ms'].transform(float)
-    datapoints['rollback_ms'] = datapoints['rollback_ms'].transform(float)
+    datapoints['timestamp'] = parse_time_column(datapoints['timestamp'])
     return datapoints
+
+def parse_lost_messages_data(datapoints: pd.DataFrame):
+    datapoints['timestamp'] = parse_time_column(datapoints['timestamp'])
+    #the sender logs fromSequenceNr - lastSentSeqNr, i.e. the number of messages it could not replay as a negative number
+    datapoints['message_count'] = datapoints['message_count'].abs()
+    return datapoints
+
+@instrument('aggregate', rows=argument_rows(1))
+def bucket_percentiles(timestamps, values, bucket_ms: float = 1000, groups = None, percentiles: tuple = (50, 95, 99)):
+    """Computes percentiles and the max of values per fixed time bucket (and per group) in one groupby pass.
+    Percentiles use linear interpolation like pandas' quantile, NaN values are ignored.
+    Returns a frame with the group, the bucket start (ms), the sample count, one column per percentile ('p50', ...) and 'max'.
+    """
+    frame = pd.DataFrame({
+        'group': np.zeros(len(values), dtype=np.int8) if groups is None else (groups if isinstance(groups, pd.Categorical) else np.asarray(groups)),
+        'timestamp': np.floor(np.asarray(timestamps, dtype=np.float64) / bucket_ms) * bucket_ms,
+        'value': np.asarray(values, dtype=np.float64)
+    }).dropna(subset=['value'])
+    if(frame.empty):
+        return pd.DataFrame(columns=['group', 'timestamp', 'count'] + [f'p{p}' for p in percentiles] + ['max'])
+    grouped = frame.groupby(['group', 'timestamp'], sort=True, observed=True)['value']
+    output = grouped.quantile([p / 100 for p in percentiles]).unstack()
+    output.columns = [f'p{p}' for p in percentiles]
+    output.insert(0, 'count', grouped.size())
+    output['max'] = grouped.max()
+    return output.reset_index()
@@ -1,78 +1,209 @@
 """Contains data-retrieval functions (get files from disk)
+an experiment is either a folder or an archive packed from it (see lib/archive), the functions read both.
 """
 
+import codecs
+import io
 import os
 import pandas as pd
 
+from lib import archive
+from lib.profiling import instrument, count_lines
 
 """Retrieves folders containing experiment data
-the function looks up folders at the location base-path.
+the function looks up folders and experiment archives at the location base-path, hidden folders (the data cache) are skipped.
 """
 def get_experiments_at_location(location: str):
-    return sorted([e for e in os.listdir(location) if os.path.isdir(os.path.join(location, e))])
+    entries = set()
+    for e in os.listdir(location):
+        if(os.path.isdir(os.path.join(location, e)) and not e.startswith('.')):
+            entries.add(e)
+        elif(e.endswith(archive.ARCHIVE_SUFFIX) and os.path.isfile(os.path.join(location, e))):
+            entries.add(e[:-len(archive.ARCHIVE_SUFFIX)])
+    return sorted(entries)
+
+"""Retrieves {filename: size} of the files in a subfolder of an experiment, empty when it has no such subfolder
+"""
+@instrument('list', 1)
+def get_experiment_files(location: str, folder: str, subfolder: str):
+    if(archive.is_archived(location, folder)):
+        return archive.list_members(location, folder, subfolder)
+    path = os.path.join(location, folder, subfolder)
+    return {e: os.path.getsize(os.path.join(path, e)) for e in os.listdir(path)} if os.path.isdir(path) else {}
 
 """Retrieves a list of performance data filenames
 """
 def get_performance_files(location: str, folder: str):
-    return [e for e in os.listdir(f'{location}/{folder}/performance')]
+    return list(get_experiment_files(location, folder, 'performance'))
 
 """Retrieves a list of checkpoint data filenames
 """
 def get_checkpoint_files(location: str, folder: str):
-    return [e for e in os.listdir(f'{location}/{folder}/checkpoint')]
+    return list(get_experiment_files(location, folder, 'checkpoint'))
 
 
 """Retrieves a list of recovery data filenames
 """
 def get_recovery_files(location: str, folder: str):
-    return [e for e in os.listdir(f'{location}/{folder}/recovery')]
+    return list(get_experiment_files(location, folder, 'recovery'))
+
+"""Retrieves a list of lost-messages data filenames
+"""
+def get_lost_messages_files(location: str, folder: str):
+    return list(get_experiment_files(location, folder, 'lost-messages'))
+
+"""Returns the [basename, mtime_ns, size] of each file of an experiment (names relative to it), from disk or from the archive index
+"""
+def get_file_signatures(location: str, folder: str, names: list):
+    if(archive.is_archived(location, folder)):
+        return [archive.get_member_signature(location, folder, name) for name in names]
+    signature = []
+    for name in names:
+        stat = os.stat(os.path.join(location, folder, *name.split('/')))
+        signature.append([name.rsplit('/', 1)[-1], stat.st_mtime_ns, stat.st_size])
+    return signature
+
+"""Reads a file of an experiment (name relative to it) from disk or from its archive
+"""
+@instrument('read', 1, rows=count_lines)
+def read_experiment_file(location: str, folder: str, name: str):
+    if(archive.is_archived(location, folder)):
+        return archive.read_member(location, folder, name)
+    with open(os.path.join(location, folder, *name.split('/')), 'rb') as file:
+        return file.read()
+
+
+
+"""Column names and dtypes per metric log, in the order they are written
+values are kept in the narrowest type that holds them, the parsers in data_parser compact the rest
+"""
+THROUGHPUT_COLUMNS = {'timestamp': str, 'throughput': 'int32'}
+LATENCY_COLUMNS = {'timestamp': str, 'latency': 'float32', 'shard': 'int32'}
+FAILURE_COLUMNS = {'timestamp': str}
+CHECKPOINT_COLUMNS = {'timestamp': str, 'forced': 'bool', 'taken_ms': 'float32', 'bytes': 'int64'}
+RECOVERY_COLUMNS = {'timestamp': str, 'restored_ms': 'float32', 'rollback_ms': 'float32'}
+LOST_MESSAGES_COLUMNS = {'timestamp': str, 'message_count': 'int32', 'instance_name': 'category'}
+
+"""Removes every header line (starting with 'timestamp') from raw file content
+Serilog writes the header again whenever a logger restarts, so these can appear anywhere in the file.
+"""
+def drop_header_lines(raw: bytes):
+    if(raw.startswith(codecs.BOM_UTF8)):
+        raw = raw[len(codecs.BOM_UTF8):]
+    pieces = []
+    start = 0
+    index = raw.find(b'timestamp')
+    while(index >= 0):
+        if(index == 0 or raw[index - 1] == ord('\n')):
+            pieces.append(raw[start:index])
+            line_end = raw.find(b'\n', index)
+            start = len(raw) if line_end < 0 else line_end + 1
+            index = raw.find(b'timestamp', start)
+        else:
+            index = raw.find(b'timestamp', index + 1)
+    pieces.append(raw[start:])
+    return b''.join(pieces)
+
+"""Parses raw metric log content with the C parser into a typed frame
+format = comma + space separated values, header lines are dropped before parsing
+"""
+@instrument('parse')
+def parse_metric_content(raw: bytes, columns: dict):
+    body = drop_header_lines(raw)
+    if(not body.strip()):
+        return pd.DataFrame({name: pd.Series(dtype=dtype) for name, dtype in columns.items()})
+    return pd.read_csv(io.BytesIO(body), sep=',', skipinitialspace=True, header=None, names=list(columns.keys()), dtype=columns, engine='c')
+
+"""Reads a metric log from disk into a typed frame
+"""
+@instrument('read')
+def read_metric_file(path: str, columns: dict):
+    with open(path, 'rb') as file:
+        return parse_metric_content(file.read(), columns)
 
+"""Parses a stream of raw metric log chunks (e.g. a download) into a typed frame per block of roughly block_bytes
+blocks are cut at line boundaries so no row is ever split, however the chunks were cut
+"""
+def iter_metric_chunks(chunks, columns: dict, block_bytes: int = 64 * 1024 * 1024):
+    pending = []
+    pending_bytes = 0
+    remainder = b''
+    for chunk in chunks:
+        pending.append(chunk)
+        pending_bytes += len(chunk)
+        if(pending_bytes < block_bytes):
+            continue
+        block = remainder + b''.join(pending)
+        pending, pending_bytes = [], 0
+        cut = block.rfind(b'\n') + 1
+        remainder = block[cut:]
+        if(cut > 0):
+            yield parse_metric_content(block[:cut], columns)
+    block = remainder + b''.join(pending)
+    if(block.strip()):
+        yield parse_metric_content(block, columns)
+
+"""Reads a metric log from disk in blocks of roughly block_bytes, yielding a typed frame per block
+blocks are cut at line boundaries so no row is ever split
+"""
+def iter_metric_file(path: str, columns: dict, block_bytes: int = 64 * 1024 * 1024):
+    with open(path, 'rb') as file:
+        yield from iter_metric_chunks(iter(lambda: file.read(block_bytes), b''), columns, block_bytes)
 
+"""Reads a metric log of an experiment (name relative to it) into a typed frame
+"""
+def read_experiment_metric_file(location: str, folder: str, name: str, columns: dict):
+    return parse_metric_content(read_experiment_file(location, folder, name), columns)
 
-"""Reads a throughput file and returns it as an untyped multi-dimensional array
-format = timestamp, throughput, latmin, latavg, latmax
+"""Reads a throughput file and returns it as a typed frame
+format = timestamp, throughput
 """
 def get_throughput_file_content(location: str, folder: str, filename: str):
-    frame = pd.read_csv(f'{location}/{folder}/performance/{filename}', sep=", ")
-    frame.columns = ['timestamp', 'throughput']
-    return frame[frame.timestamp.astype(str).str.strip() != 'timestamp']
+    return read_experiment_metric_file(location, folder, f'performance/{filename}', THROUGHPUT_COLUMNS)
 
-"""Reads a latency file and returns it as an untyped multi-dimensional array
-format = timestamp, throughput, latmin, latavg, latmax
+"""Reads a latency file and returns it as a typed frame
+format = timestamp, latency, shard
 """
 def get_latency_file_content(location: str, folder: str, filename: str):
-    frame = pd.read_csv(f'{location}/{folder}/performance/{filename}', sep=", ")
-    frame.columns = ['timestamp', 'latency', 'shard']
-    return frame[frame.timestamp.astype(str).str.strip() != 'timestamp']
+    return read_experiment_metric_file(location, folder, f'performance/{filename}', LATENCY_COLUMNS)
 
-"""Reads a failures file and returns it as an untyped multi-dimensional array
-format = timestamp, throughput, latmin, latavg, latmax
+"""Reads a latency file in blocks and yields each block as a typed frame
+format = timestamp, latency, shard
+"""
+def iter_latency_file_content(location: str, folder: str, filename: str, block_bytes: int = 64 * 1024 * 1024):
+    if(archive.is_archived(location, folder)):
+        return iter_metric_chunks(archive.iter_member(location, folder, f'performance/{filename}'), LATENCY_COLUMNS, block_bytes)
+    return iter_metric_file(f'{location}/{folder}/performance/{filename}', LATENCY_COLUMNS, block_bytes)
+
+"""Reads a failures file and returns it as a typed frame
+format = timestamp
 """
 def get_failure_file_content(location: str, folder: str):
-    frame = pd.read_csv(f'{location}/{folder}/failures.log', sep=", ")
-    frame.columns = ['timestamp']
-    return frame[frame.timestamp.astype(str).str.strip() != 'timestamp']
+    return read_experiment_metric_file(location, folder, 'failures.log', FAILURE_COLUMNS)
 
-"""Reads a checkpoint file and returns it as an untyped multi-dimensional array
+"""Reads a checkpoint file and returns it as a typed frame
 format = timestamp, forced, taken_ms, bytes
 """
 def get_checkpoint_file_content(location: str, folder: str, filename: str):
-    frame = pd.read_csv(f'{location}/{folder}/checkpoint/{filename}', sep=", ")
-    frame.columns = ['timestamp', 'forced', 'taken_ms', 'bytes']
-    return frame[frame.timestamp.astype(str).str.strip() != 'timestamp']
+    return read_experiment_metric_file(location, folder, f'checkpoint/{filename}', CHECKPOINT_COLUMNS)
 
-"""Reads a recovery file and returns it as an untyped multi-dimensional array
-format = timestamp, forced, taken_ms, bytes
+"""Reads a recovery file and returns it as a typed frame
+format = timestamp, restored_ms, rollback_ms
 """
 def get_recovery_file_content(location: str, folder: str, filename: str):
-    frame = pd.read_csv(f'{location}/{folder}/recovery/{filename}', sep=", ")
-    frame.columns = ['timestamp', 'restored_ms', 'rollback_ms']
-    return frame[frame.timestamp.astype(str).str.strip() != 'timestamp']
+    return read_experiment_metric_file(location, folder, f'recovery/{filename}', RECOVERY_COLUMNS)
 
+"""Reads a lost-messages file and returns it as a typed frame
+format = timestamp, message_count, instance_name (the downstream instance that asked for the replay)
+"""
+def get_lost_messages_file_content(location: str, folder: str, filename: str):
+    return read_experiment_metric_file(location, folder, f'lost-messages/{filename}', LOST_MESSAGES_COLUMNS)
 
-"""Reads a init timestamp file and returns it as an untyped multi-dimensional array
-format = timestamp, forced, taken_ms, bytes
+
+"""Reads a init timestamp file and returns its content as a string
+format = hh:mm:ss:ffffff
 """
+@instrument('read', 1)
 def get_init_ts(location: str, folder: str):
-    ts = open(f'{location}/{folder}/init_timestamp.log', encoding='UTF-8').read()
+    ts = read_experiment_file(location, folder, 'init_timestamp.log').decode('UTF-8')
     return ''.join(c for c in ts if (c.isdigit() or c == ':'))
\ No newline at end of file
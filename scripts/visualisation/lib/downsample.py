@@ -0,0 +1,89 @@
+"""Contains decimation functions used to reduce the number of points handed to matplotlib
+Every function returns the sorted indices of the points to keep, so the kept points are always real samples.
+"""
+
+import numpy as np
+
+from lib.profiling import instrument, argument_rows
+
+METHODS = ['lttb', 'minmax', 'percentile', 'raster']
+
+"""Assigns each point to one of bins equally wide bins over the x range
+"""
+def bin_indices(x: np.ndarray, bins: int):
+    low, high = x.min(), x.max()
+    if(high <= low):
+        return np.zeros(len(x), dtype=np.int64)
+    return np.minimum(((x - low) / (high - low) * bins).astype(np.int64), bins - 1)
+
+"""Keeps the points at the given percentile ranks of y within each x bin
+percentiles (0, 100) equals per-pixel min/max binning, spikes are always preserved
+"""
+def percentile_bins(x: np.ndarray, y: np.ndarray, bins: int, percentiles: tuple = (0, 100)):
+    if(len(x) == 0):
+        return np.zeros(0, dtype=np.int64)
+    binned = bin_indices(x, bins)
+    y_order = np.where(np.isnan(y), -np.inf, y) #NaN sorts first so it is never selected as a max
+    order = np.lexsort((y_order, binned))
+    starts = np.flatnonzero(np.r_[True, np.diff(binned[order]) != 0])
+    lengths = np.diff(np.r_[starts, len(order)])
+    picks = [starts + np.round(p / 100 * (lengths - 1)).astype(np.int64) for p in percentiles]
+    return np.unique(order[np.concatenate(picks)])
+
+def minmax_bins(x: np.ndarray, y: np.ndarray, bins: int):
+    return percentile_bins(x, y, bins, (0, 100))
+
+"""Largest-Triangle-Three-Buckets, keeps threshold points that retain the visual shape of the series
+x must be sorted
+"""
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int):
+    n = len(x)
+    if(threshold >= n or threshold < 3):
+        return np.arange(n)
+    y = np.nan_to_num(y)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.zeros(threshold, dtype=np.int64)
+    selected[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_start:max(next_end, next_start + 1)].mean()
+        avg_y = y[next_start:max(next_end, next_start + 1)].mean()
+        areas = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(areas))
+        selected[i + 1] = a
+    return selected
+
+"""Returns the indices of all points within window of any of the focus x values
+"""
+def focus_indices(x: np.ndarray, focus: np.ndarray, window: float):
+    if(focus is None or len(focus) == 0 or len(x) == 0):
+        return np.zeros(0, dtype=np.int64)
+    focus = np.sort(np.asarray(focus, dtype=np.float64))
+    position = np.clip(np.searchsorted(focus, x), 1, len(focus)) - 1
+    nearest = np.minimum(np.abs(x - focus[position]), np.abs(x - focus[np.minimum(position + 1, len(focus) - 1)]))
+    return np.flatnonzero(nearest <= window)
+
+"""Reduces a series to roughly max_points points with the given method
+points within focus_window of a focus value (e.g. failure times) are always kept untouched.
+'raster' does not decimate, the plotter draws the full series as an embedded image instead.
+"""
+@instrument('downsample', rows=argument_rows(0))
+def downsample(x, y, max_points: int, method: str = 'minmax', focus = None, focus_window: float = 5.0):
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if(method not in METHODS):
+        raise ValueError(f"unknown downsample method '{method}', expected one of {METHODS}")
+    if(method == 'raster' or max_points is None or len(x) <= max_points):
+        return x, y
+    if(method == 'lttb'):
+        order = np.argsort(x, kind='stable')
+        keep = order[lttb(x[order], y[order], max_points)]
+    elif(method == 'minmax'):
+        keep = minmax_bins(x, y, max(1, max_points // 2))
+    else:
+        keep = percentile_bins(x, y, max(1, max_points // 4), (0, 50, 95, 100))
+    keep = np.union1d(keep, focus_indices(x, focus, focus_window))
+    keep = keep[np.argsort(x[keep], kind='stable')]
+    return x[keep], y[keep]
@@ -0,0 +1,47 @@
+"""Contains the lost-message attribution which joins the lost-messages logs against the recovery logs
+An upstream instance logs a lost-messages row when a recovering downstream instance asks it to replay messages
+that are no longer in its message log, so those messages are lost. Every row is matched to the recovery of that
+downstream instance after the same failure. All runs are handled at once like in lib/recovery_time.
+"""
+
+import numpy as np
+import pandas as pd
+
+from lib.profiling import instrument
+
+"""Returns, for every row of frame (columns run, timestamp), the index of the last failure of its run at or before it, -1 before the first failure
+"""
+def get_failure_index(frame: pd.DataFrame, failures: pd.DataFrame):
+    ordered = failures[['run', 'timestamp']].sort_values(['run', 'timestamp'], kind='stable')
+    ordered = ordered.assign(failure=ordered.groupby('run', observed=True).cumcount(), timestamp=ordered['timestamp'].astype(np.int64))
+    left = pd.DataFrame({'run': frame['run'], 'timestamp': frame['timestamp'].astype(np.int64), 'row': np.arange(len(frame))}).sort_values('timestamp', kind='stable')
+    joined = pd.merge_asof(left, ordered.sort_values('timestamp', kind='stable'), on='timestamp', by='run', direction='backward').sort_values('row')
+    return joined['failure'].fillna(-1).to_numpy(dtype=np.int32)
+
+"""Attributes the lost messages of every run to the recoveries and failures they belong to
+recoveries = frame with columns run, instance, timestamp, rollback_ms, rows with timestamp 0 are not recoveries
+lost       = frame with columns run, timestamp, message_count, instance_name (the downstream instance)
+failures   = frame with columns run, timestamp
+timestamps of the three frames share one unit
+returns (per recovery: run, failure, instance, rollback_ms, lost_messages, lost_rate (messages per second of rollback)),
+(per failure: run, failure, lost_messages, instances (downstream instances that lost messages))
+"""
+@instrument('aggregate')
+def attribute_lost_messages(recoveries: pd.DataFrame, lost: pd.DataFrame, failures: pd.DataFrame):
+    recovered = recoveries[recoveries['timestamp'] != 0]
+    recovered = pd.DataFrame({'run': recovered['run'].to_numpy(), 'failure': get_failure_index(recovered, failures),
+                              'instance': recovered['instance'].astype(str).to_numpy(), 'rollback_ms': recovered['rollback_ms'].to_numpy(dtype=np.float64)})
+    losses = pd.DataFrame({'run': lost['run'].to_numpy(), 'failure': get_failure_index(lost, failures),
+                           'instance': lost['instance_name'].astype(str).to_numpy(), 'lost_messages': lost['message_count'].to_numpy(dtype=np.float64)})
+    losses = losses.groupby(['run', 'failure', 'instance'], sort=False, observed=True, as_index=False)['lost_messages'].sum()
+
+    per_recovery = recovered.merge(losses, on=['run', 'failure', 'instance'], how='left')
+    per_recovery['lost_messages'] = per_recovery['lost_messages'].fillna(0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        per_recovery['lost_rate'] = per_recovery['lost_messages'] / (per_recovery['rollback_ms'] / 1000).where(per_recovery['rollback_ms'] > 0)
+
+    #every failure gets a row, also when nothing was lost, messages lost before the first failure are left out
+    per_failure = failures[['run']].assign(failure=failures.groupby('run', observed=True).cumcount().to_numpy(dtype=np.int32)).reset_index(drop=True)
+    totals = losses.groupby(['run', 'failure'], observed=True).agg(lost_messages=('lost_messages', 'sum'), instances=('instance', 'nunique')).reset_index()
+    per_failure = per_failure.merge(totals, on=['run', 'failure'], how='left').fillna({'lost_messages': 0, 'instances': 0})
+    return per_recovery, per_failure
@@ -0,0 +1,180 @@
+"""Contains the metric table engine, a table is declared as a list of columns over the experiment groups
+Every value of every run is one row of a long-format dataset (group, run, metric, value). All statistics the
+columns of a table need are computed in one pass over that dataset sorted by group and metric, so another column
+(e.g. a p99.9 or the forced checkpoint ratio) costs no extra pass over the data.
+e.g. [column('mean', 'latency', 'mean', 2), column('99.9th', 'latency', 'p99.9'), column('size (Kb)', 'kbytes', 'mean±std')]
+"""
+
+import re
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from lib.catalog import get_experiment_groups
+from lib.data_parser import stack_frames
+from lib.parallel import map_ordered
+from lib.profiling import instrument, argument_rows
+
+GROUP_FIELDS = ['query', 'protocol', 'interval']
+RUNS_METRIC = 'runs' #every run has one row of this metric, so per-run averages also count runs without samples
+BASE_STATS = ['count', 'sum', 'min', 'max', 'mean', 'std', 'median']
+QUANTILE_PATTERN = re.compile(r'^p(\d+(\.\d+)?)$')
+FORMATS = ['latex', 'csv', 'json']
+
+"""Declares a column computing stat over the values of metric, rounded to digits (whole numbers when 0, as is when None)
+stat = one of BASE_STATS, a quantile as pXX (e.g. p99.9), count/run or sum/run (averaged over the runs of the group)
+or mean±std (formatted as "mean ± std")
+"""
+def column(label: str, metric: str, stat: str, digits: int = None):
+    if(stat not in BASE_STATS and stat not in ('count/run', 'sum/run', 'mean±std') and QUANTILE_PATTERN.match(stat) is None):
+        raise ValueError(f"unknown statistic '{stat}' for column '{label}'")
+    return {'label': label, 'metric': metric, 'stat': stat, 'digits': digits}
+
+"""Declares a column computed from the (rounded) values of the other columns, function gets the table as a frame
+derived columns are computed after every statistic column, in the order they are declared
+e.g. derived('#regular', lambda table: table['#total'] - table['#forced'])
+"""
+def derived(label: str, function, digits: int = None):
+    return {'label': label, 'function': function, 'digits': digits}
+
+"""Turns the given columns of a frame into metric rows
+"""
+@instrument('aggregate')
+def to_long(frame: pd.DataFrame, metrics: list):
+    values = np.empty(len(frame) * len(metrics), dtype=np.float64)
+    for i, metric in enumerate(metrics):
+        values[i * len(frame):(i + 1) * len(frame)] = frame[metric].to_numpy(dtype=np.float64)
+    return pd.DataFrame({'metric': pd.Categorical.from_codes(np.repeat(np.arange(len(metrics)), len(frame)), categories=metrics), 'value': values})
+
+def load_run_metrics(run: tuple, sources: list):
+    location, experiment = run
+    frames = [source(location, experiment) for source in sources]
+    frames.append(to_long(pd.DataFrame({RUNS_METRIC: [1.0]}), [RUNS_METRIC]))
+    return stack_frames(frames)
+
+"""Loads the metric rows of every run of every experiment group under location, runs are loaded in worker processes
+sources = top-level functions (location, experiment) -> frame with columns metric, value (see to_long)
+returns (groups, runs, dataset): groups is a frame of the GROUP_FIELDS, runs a frame of the group, location and experiment
+of each run and dataset the long-format frame of group, run, metric and value (group and run index the other two frames)
+"""
+@instrument('load')
+def load_dataset(location: str, sources: list, **criteria):
+    groups = get_experiment_groups(location, **criteria)
+    runs = pd.DataFrame([(i, path, key) for i, (_, path, _, _, keys) in enumerate(groups) for key in keys], columns=['group', 'location', 'experiment'])
+    frames = map_ordered(partial(load_run_metrics, sources=sources), list(zip(runs['location'], runs['experiment'])))
+    sizes = [len(frame) for frame in frames]
+    dataset = stack_frames(frames, ['metric', 'value'])
+    dataset.insert(0, 'run', np.repeat(runs.index.to_numpy(dtype=np.int32), sizes))
+    dataset.insert(0, 'group', np.repeat(runs['group'].to_numpy(dtype=np.int32), sizes))
+    group_frame = pd.DataFrame([group[:1] + group[2:4] for group in groups], columns=GROUP_FIELDS)
+    return group_frame, runs, dataset
+
+"""Adds the given columns of a frame with a run column (indexing runs) to the dataset as metric rows
+"""
+@instrument('aggregate')
+def add_metrics(dataset: pd.DataFrame, runs: pd.DataFrame, frame: pd.DataFrame, metrics: list):
+    rows = to_long(frame, metrics)
+    run = np.tile(frame['run'].to_numpy(dtype=np.int32), len(metrics))
+    rows.insert(0, 'run', run)
+    rows.insert(0, 'group', runs['group'].to_numpy(dtype=np.int32)[run])
+    return stack_frames([dataset, rows])
+
+"""Adds per-run values (a frame indexed like runs, one column per metric) to the dataset
+"""
+def add_run_metrics(dataset: pd.DataFrame, runs: pd.DataFrame, values: pd.DataFrame):
+    return add_metrics(dataset, runs, values.assign(run=runs.index.to_numpy()), list(values.columns))
+
+def format_mean_std(means: pd.Series, stds: pd.Series, digits: int = 0):
+    def format_value(value):
+        if(np.isnan(value)):
+            return "nan"
+        return str(round(value, digits)) if digits > 0 else str(round(value))
+    return pd.Series([format_value(mean) + " ± " + format_value(std) for mean, std in zip(means, stds)], index=means.index, dtype=object)
+
+def round_values(values: pd.Series, digits: int):
+    if(digits is None or values.dtype == object):
+        return values
+    if(digits == 0):
+        return values.round(0).astype('Int64') if values.isna().any() else values.round(0).astype(np.int64)
+    return values.round(digits)
+
+"""Computes count, sum, min, max, mean, std, median and the given quantiles of the values per key with one sort,
+quantiles interpolate linearly like pandas and NaN values are ignored. Returns a frame indexed by the keys present.
+"""
+@instrument('aggregate', rows=argument_rows(0))
+def get_segment_stats(keys: np.ndarray, values: np.ndarray, quantiles: list):
+    order = np.lexsort((values, keys)) #by key, then by value with NaN values last
+    keys = keys[order]
+    values = values[order]
+    del order
+    if(len(values) == 0):
+        return pd.DataFrame(columns=BASE_STATS + [f'q{q}' for q in quantiles], dtype=np.float64)
+    starts = np.concatenate([[0], np.flatnonzero(keys[1:] != keys[:-1]) + 1])
+    missing = np.isnan(values)
+    counts = np.add.reduceat(~missing, starts, dtype=np.int64)
+    filled = np.where(missing, 0.0, values)
+    sums = np.add.reduceat(filled, starts)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        means = np.where(counts > 0, sums / counts, np.nan)
+        deviations = np.repeat(means, np.diff(np.append(starts, len(values))))
+        np.subtract(filled, deviations, out=deviations)
+        del filled
+        deviations[missing] = 0
+        np.square(deviations, out=deviations)
+        stds = np.where(counts > 1, np.sqrt(np.add.reduceat(deviations, starts) / (counts - 1)), np.nan)
+    del deviations
+
+    def get_quantile(q: float):
+        position = (counts - 1) * q
+        lower = starts + np.floor(position).astype(np.int64).clip(min=0)
+        upper = starts + np.ceil(position).astype(np.int64).clip(min=0)
+        result = values[lower] + (values[upper] - values[lower]) * (position - np.floor(position))
+        return np.where(counts > 0, result, np.nan)
+
+    stats = {'count': counts, 'sum': sums, 'min': get_quantile(0), 'max': get_quantile(1), 'mean': means, 'std': stds, 'median': get_quantile(0.5)}
+    for q in quantiles:
+        stats[f'q{q}'] = get_quantile(q)
+    return pd.DataFrame(stats, index=keys[starts])
+
+"""Computes the table declared by columns over the dataset of load_dataset, one row per group
+"""
+@instrument('aggregate', rows=argument_rows(1))
+def compute_table(groups: pd.DataFrame, dataset: pd.DataFrame, columns: list):
+    quantiles = sorted({float(QUANTILE_PATTERN.match(c['stat']).group(1)) / 100 for c in columns if 'stat' in c and QUANTILE_PATTERN.match(c['stat'])})
+    metric = dataset['metric'].astype('category')
+    categories = list(metric.cat.categories)
+    keys = dataset['group'].to_numpy(dtype=np.int32) * np.int32(len(categories)) + metric.cat.codes.to_numpy().astype(np.int32)
+    stats = get_segment_stats(keys, dataset['value'].to_numpy(dtype=np.float64), quantiles)
+
+    def get_stat(stat: str, metric: str):
+        if(metric not in categories):
+            return pd.Series(np.nan if stat not in ('count', 'sum') else 0.0, index=groups.index)
+        values = stats[stat].reindex(groups.index.to_numpy() * len(categories) + categories.index(metric)).set_axis(groups.index)
+        return values.fillna(0.0) if stat in ('count', 'sum') else values
+
+    table = groups.copy()
+    for c in [c for c in columns if 'function' not in c] + [c for c in columns if 'function' in c]:
+        if('function' in c):
+            values = c['function'](table)
+        elif(c['stat'] in ('count/run', 'sum/run')):
+            values = get_stat(c['stat'].split('/')[0], c['metric']) / get_stat('sum', RUNS_METRIC)
+        elif(c['stat'] == 'mean±std'):
+            values = format_mean_std(get_stat('mean', c['metric']), get_stat('std', c['metric']), c['digits'] or 0)
+        elif(QUANTILE_PATTERN.match(c['stat'])):
+            values = get_stat(f"q{float(QUANTILE_PATTERN.match(c['stat']).group(1)) / 100}", c['metric'])
+        else:
+            values = get_stat(c['stat'], c['metric'])
+        table[c['label']] = round_values(pd.Series(values, index=groups.index), c['digits'])
+    return table[GROUP_FIELDS + [c['label'] for c in columns]].reset_index(drop=True)
+
+"""Renders a table as latex, csv or json (a list of row objects)
+"""
+def render_table(table: pd.DataFrame, format: str = 'latex'):
+    if(format == 'csv'):
+        return table.to_csv(index=False)
+    if(format == 'json'):
+        return table.to_json(orient='records', force_ascii=False)
+    if(format == 'latex'):
+        return table.to_latex(index=False)
+    raise ValueError(f"unknown table format '{format}', expected one of {FORMATS}")
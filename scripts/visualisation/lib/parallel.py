@@ -0,0 +1,37 @@
+"""Contains the process-pool execution mode used to handle experiments concurrently
+Results are always returned in input order so output is identical to a serial run.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import matplotlib
+
+from lib import data_cache, plot_builder, profiling
+
+#number of worker processes, 1 means everything runs serially in the current process
+jobs = 1
+
+def set_jobs(count: int):
+    global jobs
+    jobs = max(1, count)
+
+def init_worker(cache_enabled: bool, plot_defaults: dict):
+    matplotlib.use('Agg') #workers never show figures, only save them
+    data_cache.enabled = cache_enabled
+    plot_builder.defaults.update(plot_defaults)
+
+"""Applies function to each item, in worker processes when more than one job is configured
+function and items must be picklable (top-level functions, plain arguments)
+"""
+def map_ordered(function, items):
+    items = list(items)
+    if(jobs <= 1 or len(items) <= 1):
+        return [function(item) for item in items]
+    with ProcessPoolExecutor(max_workers=min(jobs, len(items)), initializer=init_worker, initargs=(data_cache.enabled, dict(plot_builder.defaults))) as executor:
+        if(not profiling.enabled):
+            return list(executor.map(function, items))
+        outcomes = list(executor.map(partial(profiling.run_collected, function, profiling.is_tracing()), items))
+    for _, collected in outcomes:
+        profiling.merge(collected)
+    return [result for result, _ in outcomes]
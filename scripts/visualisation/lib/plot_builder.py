@@ -2,16 +2,30 @@
 import matplotlib.pyplot as plt
 import pandas as pd
 
+from lib.downsample import downsample
+from lib.profiling import instrument, argument_rows
+
+#decimation applied to every series unless overridden per Plotter, max_points None disables it
+defaults = {'max_points': None, 'downsample': 'minmax'}
+
 class Plotter:
 
     #fig
 
+    def __init__(self, max_points: int = None, downsample_method: str = None):
+        self.max_points = defaults['max_points'] if max_points is None else max_points
+        self.downsample_method = defaults['downsample'] if downsample_method is None else downsample_method
+
+    def decimate(self, timestamps, values, focus):
+        return downsample(timestamps, values, self.max_points, self.downsample_method, focus)
+
     def start_plot(self):
         self.fig = plt.figure(figsize=[8,4.5], dpi=150)
         plt.grid(axis="y")
         self.c = 0
 
 
+    @instrument('render', rows=argument_rows(1))
     def add_checkpoint_data(self, series: pd.DataFrame):
         self.c = self.c + 1
         
@@ -23,8 +37,10 @@ class Plotter:
         plt.legend(prop={'size': 16})
         self.fig.tight_layout(pad=0.05)
 
-    def add_throughput_data(self, timestamps: pd.DataFrame, throughputs: pd.DataFrame, instanceName: str):
+    @instrument('render', rows=argument_rows(1))
+    def add_throughput_data(self, timestamps: pd.DataFrame, throughputs: pd.DataFrame, instanceName: str, focus = None):
         self.c = self.c + 1
+        timestamps, throughputs = self.decimate(timestamps, throughputs, focus)
         
         plt.plot(timestamps, 
                 throughputs, 
@@ -34,7 +50,8 @@ class Plotter:
                 linestyle='-',
                 marker='.',
                 linewidth=1,
-                markersize=4)
+                markersize=4,
+                rasterized=self.downsample_method == 'raster')
         #color='random',
         
         plt.xlabel("Experiment Time (s)")
@@ -42,7 +59,9 @@ class Plotter:
         plt.legend(prop={'size': 12})
         self.fig.tight_layout(pad=0.05)
         
-    def add_latency_data(self, timestamps: pd.DataFrame, latencies: pd.DataFrame, label: str):
+    @instrument('render', rows=argument_rows(1))
+    def add_latency_data(self, timestamps: pd.DataFrame, latencies: pd.DataFrame, label: str, focus = None):
+        timestamps, latencies = self.decimate(timestamps, latencies, focus)
         plt.plot(timestamps, 
                 latencies, 
                 #(0, self.c), 
@@ -51,7 +70,8 @@ class Plotter:
                 linestyle='',
                 marker='.',
                 linewidth=1,
-                markersize=4)
+                markersize=4,
+                rasterized=self.downsample_method == 'raster')
         #color='random',
         
         plt.xlabel("Experiment Time (s)")
@@ -59,6 +79,18 @@ class Plotter:
         plt.legend(prop={'size': 12})
         #self.fig.tight_layout(pad=0.05)
 
+    @instrument('render', rows=argument_rows(1))
+    def add_latency_band(self, timestamps, p50, p95, p99, maxima, label: str):
+        line, = plt.plot(timestamps, p50, label=f"{label} p50", linewidth=1)
+        color = line.get_color()
+        plt.fill_between(timestamps, p50, p95, color=color, alpha=0.35, linewidth=0, label=f"{label} p50-p95")
+        plt.fill_between(timestamps, p95, p99, color=color, alpha=0.15, linewidth=0, label=f"{label} p95-p99")
+        plt.plot(timestamps, maxima, color=color, linestyle=':', linewidth=0.8, label=f"{label} max")
+
+        plt.xlabel("Experiment Time (s)")
+        plt.ylabel("Latency (ms)")
+        plt.legend(prop={'size': 8})
+
     def add_kill_line(self, killtime, label):
         plt.axvline((killtime) / 1000, color="r", linestyle="--")
 
@@ -68,11 +100,13 @@ class Plotter:
     def ylim(self, arg: list):
         plt.ylim(arg)
 
+    @instrument('render')
     def show_plot(self, title = 'plot'):
         self.fig.canvas.set_window_title(title)
         plt.show()
         self.fig = None
 
+    @instrument('render')
     def save_plot(self, path):
         plt.savefig(path + ".pdf",
             bbox_inches="tight",
@@ -0,0 +1,185 @@
+"""Contains the optional instrumentation of the analysis, enabled with --profile in Main.py
+Instrumented functions count their calls, time and rows per stage (read, parse, normalize, aggregate, render, ...)
+and per experiment. Times are self times, the time spent in instrumented functions called from a function counts
+towards their own stage, so the stages add up to the instrumented time. Calls made in worker processes are merged back.
+When profiling is disabled an instrumented function costs one flag check per call.
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+#set through start(), checked by every instrumented function
+enabled = False
+
+_stats = {} #(stage, function) -> [calls, self seconds, total seconds, rows]
+_experiments = {} #experiment -> [self seconds, rows]
+_events = None #trace events when a trace is recorded
+_local = threading.local()
+_started = 0.0
+
+"""Returns the row count of a result with a shape (frames, series, arrays), None otherwise
+"""
+def count_rows(result, args):
+    shape = getattr(result, 'shape', None)
+    return shape[0] if shape else None
+
+def count_lines(result, args):
+    return result.count(b'\n')
+
+"""Returns a row counter that takes the length of the positional argument at index, for functions that consume a series
+"""
+def argument_rows(index: int):
+    def count(result, args):
+        return len(args[index]) if len(args) > index and hasattr(args[index], '__len__') else None
+    return count
+
+"""Resets the counters and enables profiling, trace records every call as a trace event as well
+"""
+def start(trace: bool = False):
+    global enabled, _events, _started
+    _stats.clear()
+    _experiments.clear()
+    _events = [] if trace else None
+    _started = time.perf_counter()
+    enabled = True
+
+def stop():
+    global enabled
+    enabled = False
+
+def get_stack():
+    stack = getattr(_local, 'stack', None)
+    if(stack is None):
+        stack = _local.stack = []
+    return stack
+
+def record(stage: str, name: str, experiment, start: float, elapsed: float, own: float, rows):
+    entry = _stats.setdefault((stage, name), [0, 0.0, 0.0, 0])
+    entry[0] += 1
+    entry[1] += own
+    entry[2] += elapsed
+    entry[3] += rows or 0
+    if(experiment is not None):
+        totals = _experiments.setdefault(experiment, [0.0, 0])
+        totals[0] += own
+        totals[1] += rows or 0
+    if(_events is not None):
+        _events.append({'name': name, 'cat': stage, 'ph': 'X', 'ts': start * 1e6, 'dur': elapsed * 1e6, 'pid': os.getpid(), 'tid': threading.get_ident(),
+                        'args': {'rows': rows, 'experiment': experiment}})
+
+"""Runs function as a measured call of stage, the experiment is inherited from the calling measured function when not given
+"""
+def call(stage: str, name: str, experiment, rows, function, args, kwargs):
+    stack = get_stack()
+    if(experiment is None and len(stack) > 0):
+        experiment = stack[-1][2]
+    frame = [time.perf_counter(), 0.0, experiment]
+    stack.append(frame)
+    try:
+        result = function(*args, **kwargs)
+    finally:
+        elapsed = time.perf_counter() - frame[0]
+        stack.pop()
+        if(len(stack) > 0):
+            stack[-1][1] += elapsed
+    record(stage, name, experiment, frame[0], elapsed, elapsed - frame[1], rows(result, args) if rows is not None else None)
+    return result
+
+"""Decorates a function to be measured as part of stage
+experimentArg = index of the positional argument holding the experiment key (e.g. 1 for (location, folder, ...))
+rows = function (result, args) -> rows handled by the call, see count_rows
+"""
+def instrument(stage: str, experimentArg: int = None, rows = count_rows):
+    def decorate(function):
+        name = function.__qualname__
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if(not enabled):
+                return function(*args, **kwargs)
+            experiment = args[experimentArg] if experimentArg is not None and len(args) > experimentArg else None
+            return call(stage, name, experiment, rows, function, args, kwargs)
+        return wrapper
+    return decorate
+
+"""Measures the code in a with block as a call of stage, e.g. an action of Main.py
+"""
+@contextmanager
+def section(stage: str, name: str):
+    if(not enabled):
+        yield
+        return
+    stack = get_stack()
+    frame = [time.perf_counter(), 0.0, stack[-1][2] if len(stack) > 0 else None]
+    stack.append(frame)
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - frame[0]
+        stack.pop()
+        if(len(stack) > 0):
+            stack[-1][1] += elapsed
+        record(stage, name, frame[2], frame[0], elapsed, elapsed - frame[1], None)
+
+"""Runs function on item in a worker process with profiling enabled, returns (result, counters of the call)
+"""
+def run_collected(function, trace: bool, item):
+    start(trace)
+    result = function(item)
+    stop()
+    return result, (dict(_stats), dict(_experiments), _events)
+
+"""Adds the counters collected by run_collected in a worker process
+"""
+def merge(collected: tuple):
+    stats, experiments, events = collected
+    for key, values in stats.items():
+        entry = _stats.setdefault(key, [0, 0.0, 0.0, 0])
+        for i, value in enumerate(values):
+            entry[i] += value
+    for key, values in experiments.items():
+        totals = _experiments.setdefault(key, [0.0, 0])
+        totals[0] += values[0]
+        totals[1] += values[1]
+    if(_events is not None and events is not None):
+        _events.extend(events)
+
+def is_tracing():
+    return _events is not None
+
+"""Writes the recorded calls as a Chrome trace (chrome://tracing, ui.perfetto.dev)
+"""
+def write_trace(path: str):
+    with open(path, 'w') as file:
+        json.dump({'traceEvents': _events or [], 'displayTimeUnit': 'ms'}, file)
+
+"""Returns the breakdown per stage, per function (the top entries by self time) and per experiment as text
+"""
+def report(top: int = 15):
+    wall = time.perf_counter() - _started
+    stages = {}
+    for (stage, _), (calls, own, _, rows) in _stats.items():
+        totals = stages.setdefault(stage, [0, 0.0, 0])
+        totals[0] += calls
+        totals[1] += own
+        totals[2] += rows
+    measured = sum(own for _, own, _ in stages.values())
+    def rate(rows, seconds):
+        return f"{rows / seconds / 1e6:.2f}M/s" if rows > 0 and seconds > 0 else ""
+    lines = [f"Profile: {wall:.2f}s wall, {measured:.2f}s measured (worker processes add their time)", "",
+             f"{'stage':<14}{'calls':>10}{'self (s)':>12}{'share':>8}{'rows':>14}{'rows/s':>12}"]
+    for stage, (calls, own, rows) in sorted(stages.items(), key=lambda item: -item[1][1]):
+        lines.append(f"{stage:<14}{calls:>10}{own:>12.3f}{own / max(measured, 1e-9):>8.1%}{rows:>14}{rate(rows, own):>12}")
+    lines += ["", f"{'function':<48}{'stage':<12}{'calls':>8}{'self (s)':>10}{'total (s)':>11}{'rows':>12}"]
+    for (stage, name), (calls, own, total, rows) in sorted(_stats.items(), key=lambda item: -item[1][1])[:top]:
+        lines.append(f"{name[-47:]:<48}{stage:<12}{calls:>8}{own:>10.3f}{total:>11.3f}{rows:>12}")
+    if(len(_experiments) > 0):
+        lines += ["", f"{'experiment':<48}{'self (s)':>10}{'rows':>12}"]
+        for experiment, (own, rows) in sorted(_experiments.items(), key=lambda item: -item[1][0])[:top]:
+            lines.append(f"{str(experiment)[-47:]:<48}{own:>10.3f}{rows:>12}")
+        if(len(_experiments) > top):
+            lines.append(f"... {len(_experiments) - top} more experiments")
+    return "\n".join(lines)
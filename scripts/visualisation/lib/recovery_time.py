@@ -0,0 +1,52 @@
+"""Contains the recovery-time detector which derives recovery metrics from throughput series
+All runs of a campaign are handled in one pass over a long-format frame, there is no loop per run.
+"""
+
+import numpy as np
+import pandas as pd
+
+from lib.profiling import instrument, argument_rows
+
+"""Detects, per run, the steady-state baseline, the throughput drop and the return to baseline after the first failure
+throughput = frame with columns run, timestamp (ms), throughput
+failures   = frame with columns run, timestamp (ms), only the first failure per run is used
+baselineMs = length of the window before the failure the baseline (median throughput) is computed over
+band       = relative distance to the baseline that still counts as recovered (0.1 = within 10%)
+sustain    = number of consecutive samples that must be within the band before a run counts as recovered
+returns a frame indexed by run with baseline, failure_ms, drop_ms (time from failure until throughput left the band)
+recovery_ms (time from failure until throughput was back within the band) and settled_ms (time from failure until throughput
+was back within the band on both sides, i.e. the backlog built up during the outage was worked off), NaN when not detected,
+and warmup_ms (time since the start of the run until throughput first was within the band, NaN when not before the failure)
+"""
+@instrument('aggregate', rows=argument_rows(0))
+def detect_recovery(throughput: pd.DataFrame, failures: pd.DataFrame, baselineMs: float = 30000, band: float = 0.1, sustain: int = 3):
+    first_failures = failures.groupby('run', observed=True)['timestamp'].min().rename('failure_ms')
+    frame = throughput[['run', 'timestamp', 'throughput']].merge(first_failures, left_on='run', right_index=True)
+    frame = frame.sort_values(['run', 'timestamp'], kind='stable').reset_index(drop=True)
+    frame['relative'] = frame['timestamp'] - frame['failure_ms']
+
+    before = frame[(frame['relative'] < 0) & (frame['relative'] >= -baselineMs)]
+    baseline = before.groupby('run', observed=True)['throughput'].median().rename('baseline')
+    frame = frame.merge(baseline, left_on='run', right_index=True)
+    frame['within'] = (frame['throughput'] >= (1 - band) * frame['baseline']).astype(np.float64)
+    frame['settled'] = frame['within'] * (frame['throughput'] <= (1 + band) * frame['baseline'])
+
+    after = frame['relative'] >= 0
+    dropped = frame[after & (frame['within'] == 0)]
+    drop_ms = dropped.groupby('run', observed=True)['relative'].min().rename('drop_ms')
+    frame = frame.merge(drop_ms, left_on='run', right_index=True, how='left')
+
+    #a sample counts as recovered when it and the next sustain-1 samples of the same run are all within the band
+    reversed_frame = frame.iloc[::-1]
+    sustained = reversed_frame.groupby('run', sort=False, observed=True)[['within', 'settled']].rolling(sustain, min_periods=1).min().reset_index(level=0, drop=True)
+    frame['sustained'] = sustained['within']
+    frame['sustained_settled'] = sustained['settled']
+    recovered = frame[after & (frame['relative'] > frame['drop_ms']) & (frame['sustained'] == 1)]
+    recovery_ms = recovered.groupby('run', observed=True)['relative'].min().rename('recovery_ms')
+    settled = frame[after & (frame['relative'] > frame['drop_ms']) & (frame['sustained_settled'] == 1)]
+    settled_ms = settled.groupby('run', observed=True)['relative'].min().rename('settled_ms')
+    warmed_up = frame[~after & (frame['sustained'] == 1)]
+    warmup_ms = warmed_up.groupby('run', observed=True)['timestamp'].min().rename('warmup_ms')
+
+    result = pd.concat([baseline, first_failures, drop_ms, recovery_ms, settled_ms, warmup_ms], axis=1)
+    return result[result.index.isin(throughput['run'].unique())]
@@ -0,0 +1,126 @@
+"""Contains mergeable streaming statistics used to summarise latency logs chunk by chunk
+Moments (count, min, max, mean, variance) are exact, quantiles come from a DDSketch
+which guarantees a relative error bound on every returned quantile.
+"""
+
+import math
+import numpy as np
+
+from lib.profiling import instrument, argument_rows
+
+
+class BucketStore:
+    """Dense array of bucket counts starting at bucket index offset, grows on demand"""
+
+    def __init__(self):
+        self.offset = 0
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    @instrument('aggregate', rows=argument_rows(1))
+    def add(self, indices: np.ndarray):
+        if(len(indices) == 0):
+            return
+        self.extend(int(indices.min()), int(indices.max()))
+        self.counts += np.bincount(indices - self.offset, minlength=len(self.counts))
+
+    def merge(self, other: 'BucketStore'):
+        if(len(other.counts) == 0):
+            return
+        self.extend(other.offset, other.offset + len(other.counts) - 1)
+        start = other.offset - self.offset
+        self.counts[start:start + len(other.counts)] += other.counts
+
+    def extend(self, low: int, high: int):
+        if(len(self.counts) == 0):
+            self.offset = low
+            self.counts = np.zeros(high - low + 1, dtype=np.int64)
+            return
+        new_low = min(low, self.offset)
+        new_high = max(high, self.offset + len(self.counts) - 1)
+        if(new_low == self.offset and new_high == self.offset + len(self.counts) - 1):
+            return
+        counts = np.zeros(new_high - new_low + 1, dtype=np.int64)
+        counts[self.offset - new_low:self.offset - new_low + len(self.counts)] = self.counts
+        self.offset = new_low
+        self.counts = counts
+
+
+class LatencySummary:
+    """Streaming summary of a series of values, NaN values are ignored like pandas does"""
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        if(not 0 < relative_accuracy < 1):
+            raise ValueError("relative_accuracy must be between 0 and 1")
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0 #sum of squared differences from the mean
+        self.min = math.inf
+        self.max = -math.inf
+        self.zero_count = 0
+        self.positive = BucketStore()
+        self.negative = BucketStore()
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if(len(values) == 0):
+            return
+        mean = float(values.mean())
+        self.merge_moments(len(values), mean, float(((values - mean) ** 2).sum()))
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self.zero_count += int(np.count_nonzero(values == 0))
+        self.positive.add(self.bucket_indices(values[values > 0]))
+        self.negative.add(self.bucket_indices(-values[values < 0]))
+
+    def merge(self, other: 'LatencySummary'):
+        if(other.gamma != self.gamma):
+            raise ValueError("only summaries with the same relative accuracy can be merged")
+        self.merge_moments(other.count, other.mean, other.m2)
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.zero_count += other.zero_count
+        self.positive.merge(other.positive)
+        self.negative.merge(other.negative)
+        return self
+
+    def merge_moments(self, count: int, mean: float, m2: float):
+        """Chan et al. parallel update of count, mean and m2"""
+        if(count == 0):
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+
+    def bucket_indices(self, magnitudes: np.ndarray):
+        return np.ceil(np.log(magnitudes) / self.log_gamma).astype(np.int64)
+
+    def bucket_value(self, index: int):
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def std(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else float('nan')
+
+    def quantile(self, q: float):
+        if(self.count == 0):
+            return float('nan')
+        rank = q * (self.count - 1)
+        #negative values, largest magnitude first
+        cumulative = np.cumsum(self.negative.counts[::-1])
+        if(len(cumulative) > 0 and rank < cumulative[-1]):
+            index = int(np.searchsorted(cumulative, rank, side='right'))
+            return max(self.min, -self.bucket_value(self.negative.offset + len(self.negative.counts) - 1 - index))
+        rank -= cumulative[-1] if len(cumulative) > 0 else 0
+        if(rank < self.zero_count):
+            return 0.0
+        rank -= self.zero_count
+        if(len(self.positive.counts) == 0):
+            return self.max
+        cumulative = np.cumsum(self.positive.counts)
+        index = min(int(np.searchsorted(cumulative, rank, side='right')), len(cumulative) - 1)
+        return min(self.max, self.bucket_value(self.positive.offset + index))
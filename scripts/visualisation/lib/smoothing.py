@@ -0,0 +1,166 @@
+"""Contains vectorized smoothing filters
+Every filter accepts many series at once (e.g. all shards or all repetitions) and smooths them in one batched pass.
+NaN gaps (e.g. the recovery window) are bridged while filtering and restored in the output.
+"""
+
+from functools import lru_cache
+from math import factorial
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from lib.profiling import instrument
+
+METHODS = ['savgol', 'ema', 'mean', 'median']
+
+@lru_cache(maxsize=None)
+def savitzky_golay_coefficients(window_size: int, order: int, deriv: int = 0, rate: float = 1):
+    try:
+        window_size = abs(int(window_size))
+        order = abs(int(order))
+    except (ValueError, TypeError):
+        raise ValueError("window_size and order have to be of type int")
+    if window_size % 2 != 1 or window_size < 1:
+        raise TypeError("window_size size must be a positive odd number")
+    if window_size < order + 2:
+        raise TypeError("window_size is too small for the polynomials order")
+    half_window = (window_size -1) // 2
+    b = np.vander(np.arange(-half_window, half_window + 1), order + 1, increasing=True)
+    coefficients = np.linalg.pinv(b)[deriv] * rate**deriv * factorial(deriv)
+    coefficients.flags.writeable = False
+    return coefficients
+
+"""Copies series into one NaN-padded 2d array, returns the array and the length of each series
+"""
+def to_batch(series: list):
+    lengths = np.array([len(s) for s in series], dtype=np.int64)
+    batch = np.full((len(series), lengths.max() if len(series) > 0 else 0), np.nan)
+    for row, values in enumerate(series):
+        batch[row, :lengths[row]] = np.asarray(values, dtype=np.float64)
+    return batch, lengths
+
+def from_batch(batch: np.ndarray, lengths: np.ndarray):
+    return [batch[row, :length] for row, length in enumerate(lengths)]
+
+"""Linearly interpolates interior NaN gaps per row, leading/trailing NaN take the nearest value
+"""
+def fill_gaps(values: np.ndarray):
+    valid = ~np.isnan(values)
+    if(valid.all() or not valid.any()):
+        return values.copy()
+    positions = np.arange(len(values))
+    return np.interp(positions, positions[valid], values[valid])
+
+def savitzky_golay(y, window_size, order, deriv=0, rate=1):
+    r"""Smooth (and optionally differentiate) data with a Savitzky-Golay filter.
+    The Savitzky-Golay filter removes high frequency noise from data.
+    It has the advantage of preserving the original shape and
+    features of the signal better than other types of filtering
+    approaches, such as moving averages techniques.
+    Parameters
+    ----------
+    y : array_like, shape (N,)
+        the values of the time history of the signal.
+        Use smooth_many to filter several signals in one batched pass.
+    window_size : int
+        the length of the window. Must be an odd integer number.
+    order : int
+        the order of the polynomial used in the filtering.
+        Must be less then `window_size` - 1.
+    deriv: int
+        the order of the derivative to compute (default = 0 means only smoothing)
+    rate: float
+        sampling rate, scales the derivative (ignored when deriv = 0)
+    Returns
+    -------
+    ys : ndarray, shape (N)
+        the smoothed signal (or it's n-th derivative).
+        The input is never modified, NaN gaps stay NaN in the output.
+    Notes
+    -----
+    The Savitzky-Golay is a type of low-pass filter, particularly
+    suited for smoothing noisy data. The main idea behind this
+    approach is to make for each point a least-square fit with a
+    polynomial of high order over a odd-sized window centered at
+    the point.
+    Examples
+    --------
+    t = np.linspace(-4, 4, 500)
+    y = np.exp( -t**2 ) + np.random.normal(0, 0.05, t.shape)
+    ysg = savitzky_golay(y, window_size=31, order=4)
+    import matplotlib.pyplot as plt
+    plt.plot(t, y, label='Noisy signal')
+    plt.plot(t, np.exp(-t**2), 'k', lw=1.5, label='Original signal')
+    plt.plot(t, ysg, 'r', label='Filtered signal')
+    plt.legend()
+    plt.show()
+    References
+    ----------
+    .. [1] A. Savitzky, M. J. E. Golay, Smoothing and Differentiation of
+       Data by Simplified Least Squares Procedures. Analytical
+       Chemistry, 1964, 36 (8), pp 1627-1639.
+    .. [2] Numerical Recipes 3rd Edition: The Art of Scientific Computing
+       W.H. Press, S.A. Teukolsky, W.T. Vetterling, B.P. Flannery
+       Cambridge University Press ISBN-13: 9780521880688
+    """
+    return smooth_many([y], 'savgol', window_size=window_size, order=order, deriv=deriv, rate=rate)[0]
+
+def savitzky_golay_batch(series: list, window_size: int, order: int, deriv: int = 0, rate: float = 1):
+    coefficients = savitzky_golay_coefficients(window_size, order, deriv, rate)
+    half_window = (len(coefficients) - 1) // 2
+    lengths = np.array([len(s) for s in series], dtype=np.int64)
+    width = (lengths.max() if len(series) > 0 else 0) + 2 * half_window
+    padded = np.zeros((len(series), width))
+    masks = []
+    for row, values in enumerate(series):
+        values = np.asarray(values, dtype=np.float64)
+        masks.append(np.isnan(values))
+        y = fill_gaps(values)
+        if(len(y) <= half_window):
+            padded[row, half_window:half_window + len(y)] = y
+            continue
+        # pad the signal at the extremes with
+        # values taken from the signal itself
+        padded[row, :half_window] = y[0] - np.abs(y[1:half_window+1][::-1] - y[0])
+        padded[row, half_window:half_window + len(y)] = y
+        padded[row, half_window + len(y):half_window * 2 + len(y)] = y[-1] + np.abs(y[-half_window-1:-1][::-1] - y[-1])
+    smoothed = sliding_window_view(padded, len(coefficients), axis=1) @ coefficients
+    result = []
+    for row, values in enumerate(series):
+        out = smoothed[row, :lengths[row]].copy() if lengths[row] > half_window else np.asarray(values, dtype=np.float64).copy()
+        out[masks[row]] = np.nan
+        result.append(out)
+    return result
+
+"""Smooths many series in one batched pass
+method is one of 'savgol' (window_size, order, deriv, rate), 'ema' (alpha), 'mean' or 'median' (window, centered)
+returns a list of float arrays with the same lengths as the inputs
+"""
+@instrument('smooth', rows=lambda result, args: sum(len(s) for s in args[0]))
+def smooth_many(series: list, method: str = 'savgol', **kwargs):
+    series = list(series)
+    if(len(series) == 0):
+        return []
+    if(method == 'savgol'):
+        return savitzky_golay_batch(series, **kwargs)
+    if(method not in METHODS):
+        raise ValueError(f"unknown smoothing method '{method}', expected one of {METHODS}")
+    batch, lengths = to_batch(series)
+    frame = pd.DataFrame(batch.T)
+    if(method == 'ema'):
+        smoothed = frame.ewm(alpha=kwargs['alpha'], ignore_na=True).mean()
+    else:
+        rolling = frame.rolling(kwargs['window'], center=True, min_periods=1)
+        smoothed = rolling.mean() if method == 'mean' else rolling.median()
+    smoothed = smoothed.to_numpy().T.copy()
+    smoothed[np.isnan(batch)] = np.nan
+    return from_batch(smoothed, lengths)
+
+"""Three point weighted average (alpha, 1 - 2 * alpha, alpha), the first and last point are dropped
+"""
+def lowpass(data, alpha: float):
+    values = np.asarray(data, dtype=np.float64)
+    if(len(values) < 3):
+        return pd.Series(dtype=np.float64)
+    return pd.Series(alpha * values[:-2] + (1 - 2 * alpha) * values[1:-1] + alpha * values[2:])
@@ -0,0 +1,187 @@
+"""Contains a generator of synthetic results trees for benchmarking the analysis scripts offline
+The layout matches execute-experiment.ps1 (results/<query>/<experiment key>/ with failures.log and init_timestamp.log
+written by Out-File) and the logs match the formats of MetricLogger and the throughput and latency consumers,
+including 12-hour clock times, NaN latencies, repeated header lines after a logger restart and duplicate latency rows.
+The same seed always produces the same tree.
+"""
+
+import codecs
+import os
+
+import numpy as np
+
+TICK_US = 333000 #the throughput and latency consumers log every 333 ms
+US_PER_HOUR = 3600 * 1000000
+PRE_FAILURE_SEC = 90 #see execute-experiment.ps1
+LOG_DATE = '2021-07-05'
+HEADERS = {'throughput': 'timestamp, throughput', 'latency': 'timestamp, latency_ms, shardId', 'checkpoint': 'timestamp, forced, taken_ms, bytes',
+           'recovery': 'timestamp, restored_ms, rollback_ms', 'lost-messages': 'timestamp, message_count, instance_name'}
+#mean outage (s) after a failure per protocol, 0 = uncoordinated, 1 = coordinated, 2 = communication induced
+OUTAGE_SEC = {0: 8, 1: 15, 2: 11}
+
+"""Formats microseconds since midnight the way the loggers do (DateTime.UtcNow:hh:mm:ss:ffffff, a 12-hour clock)
+"""
+def format_clock(times):
+    times = np.asarray(times, dtype=np.int64) % (24 * US_PER_HOUR)
+    hours = (times // US_PER_HOUR) % 12
+    hours[hours == 0] = 12
+    minutes = times // 60000000 % 60
+    seconds = times // 1000000 % 60
+    fractions = times % 1000000
+    return [f'{h:02d}:{m:02d}:{s:02d}:{f:06d}' for h, m, s, f in zip(hours.tolist(), minutes.tolist(), seconds.tolist(), fractions.tolist())]
+
+"""Parses 'hh:mm:ss:ffffff' into microseconds since midnight
+"""
+def parse_clock(text: str):
+    hours, minutes, seconds, fractions = (int(part) for part in text.split(':'))
+    return ((hours * 60 + minutes) * 60 + seconds) * 1000000 + fractions
+
+"""Returns the lines of a metric log, the header first and again before every row index in restarts
+"""
+def get_log_lines(kind: str, times, columns: list, restarts: list = ()):
+    lines = [', '.join(values) for values in zip(format_clock(times), *[[str(v) for v in column] for column in columns])]
+    for index in sorted(restarts, reverse=True):
+        lines.insert(index, HEADERS[kind])
+    return [HEADERS[kind]] + lines
+
+def write_log(path: str, lines: list):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', newline='\n') as file:
+        file.write('\n'.join(lines) + '\n')
+
+"""Writes a file like Out-File -Encoding "UTF8" of Windows PowerShell does (BOM, CRLF)
+"""
+def write_out_file(path: str, lines: list):
+    with open(path, 'wb') as file:
+        file.write(codecs.BOM_UTF8 + ''.join(line + '\r\n' for line in lines).encode('UTF-8'))
+
+"""Returns the experiment key execute-experiment.ps1 uses
+"""
+def get_experiment_key(job: int, protocol: int, interval: int, throughputK: int, repetition: int):
+    return f'job-{job}-cp-{protocol}-{interval}s-{throughputK}k-({repetition})'
+
+"""Returns sorted row indices of a log with rowCount rows where extra headers are inserted
+"""
+def get_restart_rows(rng: np.random.Generator, rowCount: int, count: int):
+    return sorted(rng.integers(0, rowCount + 1, count).tolist()) if rowCount > 0 else []
+
+"""Writes the throughput and latency logs of the metric consumers
+outages = list of (failure, outage end) in µs relative to the start, throughput is 0 and latency NaN in between
+and a backlog is worked off afterwards at a higher throughput while the latency decays
+"""
+def write_performance_logs(path: str, rng: np.random.Generator, startUs: int, durationSec: int, shards: int, throughputK: int, outages: list, checkpoints: np.ndarray, duplicateHeaders: int, duplicateRows: float):
+    ticks = np.arange(int(rng.integers(0, TICK_US)), durationSec * 1000000, TICK_US, dtype=np.int64)
+    throughput = throughputK * 1000 * rng.normal(1, 0.02, len(ticks))
+    latency = rng.gamma(4, 15, (len(ticks), shards))
+    for failure, end in outages:
+        catch_up = (end - failure) // 2
+        down = (ticks >= failure) & (ticks < end)
+        after = (ticks >= end) & (ticks < end + catch_up)
+        throughput[down] = 0
+        throughput[after] *= 1.4
+        latency[down] = np.nan
+        latency[after] += ((end - failure) / 1000 * (1 - (ticks[after] - end) / catch_up))[:, None]
+    #every checkpoint slows the pipeline down while it is taken
+    taking = np.zeros(len(ticks), dtype=bool)
+    for start, end in checkpoints:
+        taking |= (ticks >= start) & (ticks <= end)
+    throughput[taking] *= 0.9
+    latency[taking] *= 1.2
+
+    throughput_lines = get_log_lines('throughput', startUs + ticks, [np.maximum(throughput, 0).astype(np.int64)], get_restart_rows(rng, len(ticks), duplicateHeaders))
+    throughput_lines.insert(1, f'{format_clock([startUs])[0]}, 0') #written when the consumer starts
+    write_log(f'{path}/performance/throughput-{LOG_DATE}.log', throughput_lines)
+
+    times = np.repeat(startUs + ticks, shards)
+    values = np.where(np.isnan(latency), -1, latency).astype(np.int64).ravel()
+    shard_ids = np.tile(np.arange(shards), len(ticks))
+    duplicated = np.flatnonzero(rng.random(len(values)) < duplicateRows)
+    order = np.sort(np.concatenate([np.arange(len(values)), duplicated]), kind='stable') #a duplicate follows its original
+    latency_values = ['NaN' if v < 0 else v for v in values[order].tolist()]
+    latency_lines = get_log_lines('latency', times[order], [latency_values, shard_ids[order]], get_restart_rows(rng, len(order), duplicateHeaders))
+    latency_lines.insert(1, f'{format_clock([startUs])[0]}, NaN, 0')
+    write_log(f'{path}/performance/latency-{LOG_DATE}.log', latency_lines)
+
+"""Returns the checkpoints of every worker as a list of (start µs, taken ms, forced) arrays, relative to the start
+coordinated checkpoints (protocol 1) are taken by every worker at once, the others at a phase per worker
+and communication induced checkpointing (protocol 2) forces extra checkpoints in between
+"""
+def get_checkpoints(rng: np.random.Generator, protocol: int, interval: int, workers: int, durationSec: int, outages: list, killed: int):
+    phase = rng.uniform(0, interval)
+    checkpoints = []
+    for worker in range(workers):
+        start = phase if protocol == 1 else rng.uniform(0, interval)
+        regular = np.arange(start, durationSec, interval) * 1000000
+        forced = np.sort(rng.uniform(0, durationSec * 1000000, len(regular) // 2)) if protocol == 2 else np.zeros(0)
+        starts = np.concatenate([regular, forced])
+        kinds = np.concatenate([np.zeros(len(regular), dtype=bool), np.ones(len(forced), dtype=bool)])
+        order = np.argsort(starts, kind='stable')
+        starts, kinds = starts[order].astype(np.int64), kinds[order]
+        keep = np.ones(len(starts), dtype=bool)
+        if(worker == killed or protocol == 1): #no checkpoints are taken while the job is down
+            for failure, end in outages:
+                keep &= ~((starts >= failure) & (starts < end))
+        taken = rng.gamma(6, 3, len(starts)).astype(np.int64) + 1
+        checkpoints.append((starts[keep], taken[keep], kinds[keep]))
+    return checkpoints
+
+"""Writes one experiment like a run of execute-experiment.ps1 would leave it in the results folder
+the coordinator is crainst00, the workers crainst01 and up, the killed worker restarts after every failure
+"""
+def write_experiment(path: str, rng: np.random.Generator, protocol: int, interval: int, shards: int = 24, throughputK: int = 18, workers: int = 8,
+                     durationSec: int = 260, failures: int = 1, duplicateHeaders: int = 1, duplicateRows: float = 0.001, startUs: int = 3 * US_PER_HOUR):
+    names = [f'crainst{i:02d}' for i in range(workers + 1)]
+    killed = workers // 2 + 1
+    gap = (durationSec - PRE_FAILURE_SEC) / max(failures, 1)
+    failure_times = [int((PRE_FAILURE_SEC + i * gap) * 1000000) for i in range(failures)]
+    outages = [(failure, failure + int(OUTAGE_SEC.get(protocol, 10) * rng.uniform(0.8, 1.2) * 1000000)) for failure in failure_times]
+
+    os.makedirs(path, exist_ok=True)
+    write_out_file(f'{path}/init_timestamp.log', format_clock([startUs]))
+    write_out_file(f'{path}/failures.log', ['timestamp'] + format_clock([startUs + failure for failure in failure_times]))
+
+    checkpoints = get_checkpoints(rng, protocol, interval, workers, durationSec, outages, killed - 1)
+    windows = np.array([(start, start + taken * 1000) for starts, takens, _ in checkpoints for start, taken in zip(starts, takens)], dtype=np.int64).reshape(-1, 2)
+    write_performance_logs(path, rng, startUs, durationSec, shards, throughputK, outages, windows, duplicateHeaders, duplicateRows)
+
+    for index, name in enumerate(names):
+        def restarts(times):
+            #the restarted worker writes every header again
+            return [int(np.searchsorted(times, end)) for _, end in outages] if index == killed else []
+        if(index > 0):
+            starts, takens, forced = checkpoints[index - 1]
+            completed = starts + takens * 1000
+            sizes = (rng.normal(5000, 400, len(starts)) + np.arange(len(starts)) * 20).astype(np.int64)
+            write_log(f'{path}/checkpoint/{name}-{LOG_DATE}.log', get_log_lines('checkpoint', startUs + completed, [['True' if f else 'False' for f in forced], takens, sizes],
+                                                                                 restarts(completed) + get_restart_rows(rng, len(starts), duplicateHeaders)))
+
+        #the killed worker always rolls back, after a coordinated checkpoint every worker does, otherwise some of them
+        recovered = [(failure, end) for failure, end in outages if index > 0 and (index == killed or protocol == 1 or (protocol == 2 and rng.random() < 0.25))]
+        times = np.array([failure + (end - failure) // 2 for failure, end in recovered], dtype=np.int64)
+        rollbacks = []
+        for failure, _ in recovered:
+            completed = checkpoints[index - 1][0] + checkpoints[index - 1][1] * 1000
+            before = completed[completed < failure]
+            rollbacks.append(int((failure - (before[-1] if len(before) > 0 else 0)) // 1000))
+        write_log(f'{path}/recovery/{name}-{LOG_DATE}.log', get_log_lines('recovery', startUs + times, [rng.normal(100, 5, len(times)).astype(np.int64), rollbacks], restarts(times)))
+
+        #with uncoordinated checkpoints the upstream worker of the killed one cannot replay everything it sent
+        lost = [(failure, end) for failure, end in outages if protocol == 0 and index == killed - 1 and index > 0]
+        times = np.array([failure + (end - failure) * 3 // 5 for failure, end in lost], dtype=np.int64)
+        counts = -rng.integers(50, 500, len(times))
+        write_log(f'{path}/lost-messages/{name}-{LOG_DATE}.log', get_log_lines('lost-messages', startUs + times, [counts, [names[killed]] * len(times)]))
+
+"""Writes a results tree root/query/<experiment key> with every protocol, interval and repetition
+returns the list of experiment keys, see write_experiment for the other parameters
+"""
+def generate_results(root: str, query: str = 'synthetic', protocols: tuple = (0, 1, 2), intervals: tuple = (10,), repetitions: int = 3, job: int = 1, seed: int = 0,
+                     start: str = '03:00:00:000000', **settings):
+    rng = np.random.default_rng(seed)
+    keys = []
+    for protocol in protocols:
+        for interval in intervals:
+            for repetition in range(repetitions):
+                key = get_experiment_key(job, protocol, interval, settings.get('throughputK', 18), repetition)
+                write_experiment(os.path.join(root, query, key), rng, protocol, interval, startUs=parse_clock(start), **settings)
+                keys.append(key)
+    return keys
@@ -0,0 +1,60 @@
+import argparse
+import os
+import shutil
+
+from lib import archive, parallel
+from lib.catalog import parse_experiment_key
+from lib.data_cache import CACHE_FOLDER
+from lib.data_retriever import get_experiments_at_location
+
+#packs every experiment folder under a results root into one compressed archive (<experiment>.bsa) next to it
+#the plots read archived experiments directly, e.g. python pack_results.py ../experiments/results --jobs 8 --remove
+#with --remove the folder is deleted once its archive is verified, its data cache is kept in <root>/.cache/<experiment>
+
+"""Lists (location, folder) of the experiment folders under root, directly or one level deeper in query folders
+"""
+def get_experiment_folders(root: str):
+    folders = []
+    for entry in get_experiments_at_location(root):
+        if(parse_experiment_key(entry) is not None):
+            folders.append((root, entry))
+        elif(os.path.isdir(os.path.join(root, entry))):
+            folders += [(os.path.join(root, entry), key) for key in get_experiments_at_location(os.path.join(root, entry)) if parse_experiment_key(key) is not None]
+    return [(location, folder) for location, folder in folders if os.path.isdir(os.path.join(location, folder))]
+
+"""Packs one experiment folder, returns (file count, raw bytes, archive bytes)
+"""
+def pack(item: tuple):
+    location, folder, level, remove = item
+    outcome = archive.pack_folder(location, folder, level)
+    if(remove):
+        if(not archive.verify_archive(location, folder)):
+            raise SystemError(f"The archive of {os.path.join(location, folder)} does not match the folder, the folder was kept")
+        cache = os.path.join(location, folder, CACHE_FOLDER)
+        if(os.path.isdir(cache)):
+            target = os.path.join(location, CACHE_FOLDER, folder)
+            shutil.rmtree(target, ignore_errors=True)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(cache, target)
+        shutil.rmtree(os.path.join(location, folder))
+    return outcome
+
+def main():
+    parser = argparse.ArgumentParser(description="Packs experiment folders into compressed archives the plots read directly")
+    parser.add_argument('root', help="results folder holding experiment folders or query folders of experiments")
+    parser.add_argument('--level', type=int, default=archive.ZSTD_LEVEL, help="zstd compression level")
+    parser.add_argument('--remove', action='store_true', help="delete each folder once its archive is verified")
+    parser.add_argument('--jobs', type=int, default=1, help="experiments packed concurrently")
+    args = parser.parse_args()
+
+    folders = get_experiment_folders(args.root)
+    parallel.set_jobs(args.jobs)
+    outcomes = parallel.map_ordered(pack, [(location, folder, args.level, args.remove) for location, folder in folders])
+    for (location, folder), (count, raw, packed) in zip(folders, outcomes):
+        print(f"{os.path.join(location, folder)}: {count} files, {raw / 1024 / 1024:.1f} MiB -> {packed / 1024 / 1024:.1f} MiB")
+    raw = sum(outcome[1] for outcome in outcomes)
+    packed = sum(outcome[2] for outcome in outcomes)
+    print(f"Packed {len(folders)} experiments, {raw / 1024 / 1024:.1f} MiB -> {packed / 1024 / 1024:.1f} MiB ({raw / max(packed, 1):.1f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -1,131 +1,194 @@
 import json
+from functools import partial
 from typing import List
 
 import pandas as pd
 import matplotlib.pyplot as plt
 import os
 import numpy as np
-
-from lib.data_retriever import get_experiments_at_location, get_performance_files, get_throughput_file_content, get_latency_file_content, get_failure_file_content, get_init_ts
-from lib.data_parser import normalize_timestamp_column, parse_throughput_data, parse_latency_data, parse_failures_data, parse_time_to_timestamp, lowpass, savitzky_golay
+from pandas.api.types import union_categoricals
+
+from lib.data_retriever import get_experiments_at_location, get_performance_files, iter_latency_file_content
+from lib.data_cache import load_throughput_data, load_latency_data, load_failure_data, load_init_ts
+from lib.data_parser import parse_latency_data, normalize_timestamp_column, bucket_percentiles, stack_frames, US_PER_MS, US_PER_SECOND
+from lib.sketch import LatencySummary
+from lib.catalog import get_experiment_groups
+from lib.smoothing import smooth_many
 from lib.plot_builder import Plotter
+from lib.parallel import map_ordered
+from lib.metric_table import column, to_long, load_dataset, compute_table, GROUP_FIELDS
+from lib.profiling import instrument
 
 def produce_throughput_graphs_in_folder(location: str):
-    for experiment in get_experiments_at_location(location):
-        plotter = Plotter()
-        plotter.start_plot()
-        produce_throughput_graph(location, experiment, plotter)
-        #plotter.show_plot(experiment)
-        plotter.save_plot(f"{location}/{experiment}-throughput")
+    map_ordered(partial(save_throughput_graph, location), get_experiments_at_location(location))
+
+def save_throughput_graph(location: str, experiment: str):
+    plotter = Plotter()
+    plotter.start_plot()
+    produce_throughput_graph(location, experiment, plotter)
+    #plotter.show_plot(experiment)
+    plotter.save_plot(f"{location}/{experiment}-throughput")
 
 
 def produce_throughput_compound_graph(location: str, experiments: list):
     plotter = Plotter()
     plotter.start_plot()
     for experiment in experiments:
-        produce_throughput_graph(location, experiment[0], plotter, label=experiment[1])
+        produce_throughput_graph(experiment[2] if len(experiment) > 2 else location, experiment[0], plotter, label=experiment[1])
     
     return plotter
     
         
 
+@instrument('render', 1)
 def produce_throughput_graph(location: str, experiment: str, plotter: Plotter, fromSec: int = 0, toSec: int = 9999, label = 'throughput'):
-    for perf_file in get_performance_files(location, experiment):
-        baseName = perf_file.split("-", 1)[0]
-        if(baseName != 'throughput'):
-            continue
-        parsedData = parse_throughput_data(get_throughput_file_content(location, experiment, perf_file))
-        initialTs = parse_time_to_timestamp(get_init_ts(location, experiment))
-
-        data = normalize_timestamp_column(parsedData, initialTs)
-        data['throughput'] = savitzky_golay(data['throughput'], 19, 2);
-        data['throughput'] = data['throughput'].apply(lambda x: 0 if x < 0 else x)
-        data = data[data["timestamp"] > fromSec*1000][data["timestamp"] < toSec*1000]
+    frames = [load_throughput_data(location, experiment, perf_file) for perf_file in get_performance_files(location, experiment) if perf_file.split("-", 1)[0] == 'throughput']
+    #smooth all throughput series in one batched pass
+    for data, smoothed in zip(frames, smooth_many([data['throughput'] for data in frames], 'savgol', window_size=19, order=2)):
+        data['throughput'] = np.clip(smoothed, 0, None)
+
+    failures = load_failure_data(location, experiment)
+    failures = failures[failures["timestamp"] > fromSec*US_PER_SECOND][failures["timestamp"] < toSec*US_PER_SECOND]
+    for data in frames:
+        data = data[data["timestamp"] > fromSec*US_PER_SECOND][data["timestamp"] < toSec*US_PER_SECOND]
         data = data.reset_index()
         #add to plot
-        plotter.add_throughput_data(data['timestamp'].apply(lambda x: (x/1000)), data['throughput'], label)
+        plotter.add_throughput_data(data['timestamp'] / US_PER_SECOND, data['throughput'], label, focus=failures['timestamp'] / US_PER_SECOND)
 
         #add failure-lines
-        failures = parse_failures_data(get_failure_file_content(location, experiment))
-        failures['timestamp'] = failures['timestamp'].transform(lambda t: t - initialTs)
-        failures = failures[failures["timestamp"] > fromSec*1000][failures["timestamp"] < toSec*1000]
         for index, row in failures.iterrows():
-            plotter.add_kill_line(row['timestamp'], "FAILURE")
+            plotter.add_kill_line(row['timestamp'] / US_PER_MS, "FAILURE")
 
 
 def produce_latency_graphs_in_folder(location: str):
-    for experiment in get_experiments_at_location(location):
-        plotter = Plotter()
-        plotter.start_plot()
-        produce_latency_graph(location, experiment, plotter, plotPerShard=True)
-        #plotter.show_plot(experiment)
-        plotter.save_plot(f"{location}/{experiment}-latency")
+    map_ordered(partial(save_latency_graph, location), get_experiments_at_location(location))
+
+def save_latency_graph(location: str, experiment: str):
+    plotter = Plotter()
+    plotter.start_plot()
+    produce_latency_graph(location, experiment, plotter, plotPerShard=True)
+    #plotter.show_plot(experiment)
+    plotter.save_plot(f"{location}/{experiment}-latency")
 
 def produce_latency_compound_graph(location: str, experiments: list):
     plotter = Plotter()
     plotter.start_plot()
     for experiment in experiments:
-        produce_latency_graph(location, experiment[0], plotter, label=experiment[1])
+        produce_latency_graph(experiment[2] if len(experiment) > 2 else location, experiment[0], plotter, label=experiment[1])
     return plotter
 
+@instrument('render', 1)
 def produce_latency_graph(location: str, experiment: str, plotter: Plotter, fromSec: int = 0, toSec: int = 9999, label = 'latency', plotPerShard: bool = False, plotMeanPerTime = False):
     for perf_file in get_performance_files(location, experiment):
         baseName = perf_file.split("-", 1)[0]
         if(baseName != 'latency'):
             continue
-        parsedData = parse_latency_data(get_latency_file_content(location, experiment, perf_file).drop_duplicates())
-        initialTs = parse_time_to_timestamp(get_init_ts(location, experiment))
-        data = normalize_timestamp_column(parsedData, initialTs)
-        #data = data[data["timestamp"] > fromSec*1000][data["timestamp"] < toSec*1000]
+        data = load_latency_data(location, experiment, perf_file)
+        failures = load_failure_data(location, experiment)
+        failures = failures[failures["timestamp"] > fromSec*US_PER_SECOND][failures["timestamp"] < toSec*US_PER_SECOND]
+        focus = failures['timestamp'] / US_PER_SECOND
+        #data = data[data["timestamp"] > fromSec*US_PER_SECOND][data["timestamp"] < toSec*US_PER_SECOND]
         if(plotPerShard):
             #add to plot per shard
-            for key, values in data.groupby(["shard"]):
+            for key, values in data.groupby("shard", observed=True):
                 values = values.reset_index()
                 #values['latency'] = savitzky_golay(values['latency'], 19, 2);
-                values['latency'] = values['latency'].apply(lambda x: 0 if x < 0 else x)
-                plotter.add_latency_data(values['timestamp'].apply(lambda x: x/1000), values['latency'], str(label) + " shard-"+str(key))
+                values['latency'] = values['latency'].clip(lower=0)
+                plotter.add_latency_data(values['timestamp'] / US_PER_SECOND, values['latency'], str(label) + " shard-"+str(key), focus=focus)
         elif(plotMeanPerTime):
             #add to plot averaged among shards
-            data = data.groupby(["timestamp"]).mean()
+            data = data.groupby(["timestamp"])[['latency']].mean()
             data = data.reset_index()
             #data['latency'] = savitzky_golay(data['latency'], 11, 1);
-            data['latency'] = data['latency'].apply(lambda x: 0 if x < 0 else x)
-            plotter.add_latency_data(data['timestamp'].apply(lambda x: x/1000), data['latency'], label)
+            data['latency'] = data['latency'].clip(lower=0)
+            plotter.add_latency_data(data['timestamp'] / US_PER_SECOND, data['latency'], label, focus=focus)
         else:
-            plotter.add_latency_data(data['timestamp'].apply(lambda x: x/1000), data['latency'], label)
+            plotter.add_latency_data(data['timestamp'] / US_PER_SECOND, data['latency'], label, focus=focus)
 
         #add failure-lines
-        failures = parse_failures_data(get_failure_file_content(location, experiment))
-        failures['timestamp'] = failures['timestamp'].transform(lambda t: t - initialTs)
-        failures = failures[failures["timestamp"] > fromSec*1000][failures["timestamp"] < toSec*1000]
         for index, row in failures.iterrows():
-            plotter.add_kill_line(row['timestamp'], "FAILURE")
+            plotter.add_kill_line(row['timestamp'] / US_PER_MS, "FAILURE")
 
 
-def produce_compound_latency_metrics(location: str, fromSec: int = 0, toSec: int = 9999):
-    output = pd.DataFrame(columns = ['query', 'protocol', 'interval', 'min', 'max', 'mean', '90th', '95th', '99th', 'std var'])
-    i = 0
+def produce_latency_percentile_graphs_in_folder(location: str, bucketMs: int = 1000):
+    map_ordered(partial(save_latency_percentile_graph, location, bucketMs=bucketMs), get_experiments_at_location(location))
 
-    for query_folder in get_experiments_at_location(location):
-        query_folder_path = os.path.join(location, query_folder)
-    
-        frame = pd.DataFrame()
-        frame['key'] = get_experiments_at_location(query_folder_path);
-        frame['protocol'] = frame['key'].apply(lambda key: key.split('-')[3])
-        frame['interval'] = frame['key'].apply(lambda key: key.split('-')[4][:2])
-        for _, group in frame.groupby(['protocol', 'interval']):
-            latencies = pd.DataFrame()
-            for key in group['key']:
-                for perf_file in get_performance_files(query_folder_path, key):
-                    if(perf_file.split("-", 1)[0] != 'latency'):
-                        continue
-                    new_latencies = parse_latency_data(get_latency_file_content(query_folder_path, key, perf_file).drop_duplicates())
-                    initialTs = parse_time_to_timestamp(get_init_ts(query_folder_path, key))
-                    new_latencies = normalize_timestamp_column(new_latencies, initialTs)
-                    new_latencies = new_latencies[new_latencies["timestamp"] > fromSec*1000][new_latencies["timestamp"] < toSec*1000]
-                    latencies = pd.concat([latencies, new_latencies])
-            latencies = latencies.reset_index()
-            output.loc[i] = [str(query_folder), group['protocol'].iloc[0], group['interval'].iloc[0], latencies['latency'].min(), latencies['latency'].max(), np.round(latencies['latency'].mean(), 2), latencies['latency'].quantile(.9), latencies['latency'].quantile(.95), latencies['latency'].quantile(.99), np.round(latencies['latency'].std(), 2)]
-            i = i + 1
-
-    return output
\ No newline at end of file
+def save_latency_percentile_graph(location: str, experiment: str, bucketMs: int = 1000):
+    plotter = Plotter()
+    plotter.start_plot()
+    produce_latency_percentile_graph(location, [(experiment, 'latency')], plotter, bucketMs=bucketMs)
+    plotter.save_plot(f"{location}/{experiment}-latency-percentiles")
+
+"""Plots p50/p95/p99/max latency per time bucket as bands, one band per label
+experiments is a list of (key, label) or (key, label, location), experiments sharing a label
+(e.g. the repetitions of one protocol) are aggregated together across all their shards
+"""
+def produce_latency_percentile_graph(location: str, experiments: list, plotter: Plotter, fromSec: int = 0, toSec: int = 9999, bucketMs: int = 1000):
+    timestamps, latencies, labels, failure_times = [], [], [], []
+    for experiment in experiments:
+        experiment_location = experiment[2] if len(experiment) > 2 else location
+        for perf_file in get_performance_files(experiment_location, experiment[0]):
+            if(perf_file.split("-", 1)[0] != 'latency'):
+                continue
+            data = load_latency_data(experiment_location, experiment[0], perf_file)
+            timestamps.append(data['timestamp'].to_numpy())
+            latencies.append(data['latency'].to_numpy())
+            labels.append(pd.Categorical.from_codes(np.zeros(len(data), dtype=np.int8), categories=[str(experiment[1])]))
+        failure_times.append(load_failure_data(experiment_location, experiment[0])['timestamp'].to_numpy())
+    if(len(timestamps) == 0):
+        return plotter
+
+    stats = bucket_percentiles(np.concatenate(timestamps) / US_PER_MS, np.concatenate(latencies), bucketMs, union_categoricals(labels))
+    stats = stats[(stats['timestamp'] > fromSec*1000) & (stats['timestamp'] < toSec*1000)]
+    for label in dict.fromkeys(str(e[1]) for e in experiments): #keep the given label order
+        band = stats[stats['group'] == label]
+        plotter.add_latency_band(band['timestamp'] / 1000, band['p50'], band['p95'], band['p99'], band['max'], label)
+
+    #add failure-lines
+    failures = np.unique(np.concatenate(failure_times)) / US_PER_MS
+    for failure in failures[(failures > fromSec*1000) & (failures < toSec*1000)]:
+        plotter.add_kill_line(failure, "FAILURE")
+    return plotter
+
+#columns of the latency table, see lib/metric_table
+LATENCY_TABLE = [column('min', 'latency', 'min'), column('max', 'latency', 'max'), column('mean', 'latency', 'mean', 2), column('90th', 'latency', 'p90'),
+                 column('95th', 'latency', 'p95'), column('99th', 'latency', 'p99'), column('std var', 'latency', 'std', 2)]
+
+def produce_compound_latency_metrics(location: str, fromSec: int = 0, toSec: int = 9999, streaming: bool = False, relativeAccuracy: float = 0.01):
+    if(streaming):
+        rows = map_ordered(partial(summarize_latency_group, fromSec=fromSec, toSec=toSec, relativeAccuracy=relativeAccuracy), get_experiment_groups(location))
+        return pd.DataFrame(rows, columns=GROUP_FIELDS + [c['label'] for c in LATENCY_TABLE])
+    groups, _, dataset = load_dataset(location, [partial(latency_metrics, fromSec=fromSec, toSec=toSec)])
+    return compute_table(groups, dataset, LATENCY_TABLE)
+
+"""Returns the latency rows of an experiment within the time window for the metric table
+"""
+@instrument('aggregate', 1)
+def latency_metrics(location: str, experiment: str, fromSec: int = 0, toSec: int = 9999):
+    frames = [load_latency_data(location, experiment, perf_file) for perf_file in get_performance_files(location, experiment) if perf_file.split("-", 1)[0] == 'latency']
+    latencies = stack_frames(frames, ['timestamp', 'latency'])
+    return to_long(latencies[(latencies["timestamp"] > fromSec*US_PER_SECOND) & (latencies["timestamp"] < toSec*US_PER_SECOND)], ['latency'])
+
+"""Streaming variant of the latency table
+latency files are read block by block and folded into one mergeable summary per file, which are merged per group.
+Memory use is bounded by the block size, quantiles are approximate within relativeAccuracy.
+Duplicate rows are only dropped within a block.
+"""
+def summarize_latency_group(group: tuple, fromSec: int = 0, toSec: int = 9999, relativeAccuracy: float = 0.01):
+    query_folder, query_folder_path, protocol, interval, keys = group
+    summary = LatencySummary(relativeAccuracy)
+    for key in keys:
+        for perf_file in get_performance_files(query_folder_path, key):
+            if(perf_file.split("-", 1)[0] != 'latency'):
+                continue
+            summary.merge(summarize_latency_file(query_folder_path, key, perf_file, fromSec, toSec, relativeAccuracy))
+    return [query_folder, protocol, interval, summary.min if summary.count else float('nan'), summary.max if summary.count else float('nan'), np.round(summary.mean if summary.count else float('nan'), 2), summary.quantile(.9), summary.quantile(.95), summary.quantile(.99), np.round(summary.std(), 2)]
+
+@instrument('aggregate', 1)
+def summarize_latency_file(location: str, experiment: str, filename: str, fromSec: int, toSec: int, relativeAccuracy: float):
+    summary = LatencySummary(relativeAccuracy)
+    initialTs = load_init_ts(location, experiment)
+    for block in iter_latency_file_content(location, experiment, filename):
+        block = normalize_timestamp_column(parse_latency_data(block.drop_duplicates()), initialTs)
+        summary.add(block['latency'][(block['timestamp'] > fromSec*US_PER_SECOND) & (block['timestamp'] < toSec*US_PER_SECOND)])
+    return summary
@@ -0,0 +1,42 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from lib.data_parser import parse_time_column, parse_time_to_timestamp, normalize_timestamp_column, US_PER_MS, US_PER_SECOND
+
+#checks the vectorized timestamp parsing against the strptime parser it replaced, run with python -m pytest from this folder
+
+"""The parser and normalization before the vectorized one, float milliseconds relative to the init timestamp
+"""
+def old_offsets_ms(times: list, init: str):
+    def parse(timestr: str):
+        return datetime.strptime(f'01.01.2000 {timestr}', '%d.%m.%Y %H:%M:%S:%f').timestamp() * 1000
+    return np.array([parse(t) - parse(init) for t in times])
+
+"""The offsets in microseconds the current parser produces for a metric log
+"""
+def new_offsets_us(times: list, init: str):
+    frame = normalize_timestamp_column(pd.DataFrame({'timestamp': parse_time_column(times)}), parse_time_to_timestamp(init))
+    return frame['timestamp'].to_numpy(dtype=np.int64)
+
+def get_clock_times(rng: np.random.Generator, start: int, count: int, spanUs: int):
+    offsets = np.sort(rng.integers(0, spanUs, count))
+    return [f'{(start + o) // 3600000000:02d}:{(start + o) // 60000000 % 60:02d}:{(start + o) // 1000000 % 60:02d}:{(start + o) % 1000000:06d}' for o in offsets.tolist()]
+
+@pytest.mark.parametrize('init', ['03:00:00:000000', '09:41:07:123456', '12:05:00:000001'])
+def test_matches_old_parser_without_wrap(init):
+    rng = np.random.default_rng(1)
+    start = parse_time_to_timestamp(init) + (12 * 3600 * US_PER_SECOND if init.startswith('12') else 0) #hour 12 is parsed as 0
+    times = get_clock_times(rng, start - 30 * US_PER_SECOND, 5000, 20 * 60 * US_PER_SECOND) #from before the init timestamp until 20 minutes later
+    old = np.round(old_offsets_ms(times, init) * US_PER_MS).astype(np.int64)
+    np.testing.assert_array_equal(new_offsets_us(times, init), old)
+
+def test_twelve_hour_wrap():
+    times = ['12:58:00:000000', '12:59:59:500000', '01:00:00:250000', '01:10:00:000000']
+    np.testing.assert_array_equal(new_offsets_us(times, '12:58:00:000000'), [0, 119500000, 120250000, 720000000])
+
+@pytest.mark.parametrize('times', [['11:59:59:900000', '12:00:00:100000', '12:00:01:000000'], ['23:59:59:900000', '00:00:00:100000', '00:00:01:000000']])
+def test_midnight_rollover(times):
+    np.testing.assert_array_equal(new_offsets_us(times, '11:59:00:000000'), [59900000, 60100000, 61000000])